@@ -0,0 +1,501 @@
+"""
+JSON API, version 1, for scripts and editor integrations.
+
+    GET    /api/v1/<kind>               list, oldest first: ?limit=&after=&fields=a,b plus filters
+    GET    /api/v1/<kind>/<id>          one item (?fields= too)
+    POST   /api/v1/<kind>               create one item (an object) or many (a list of objects)
+    PATCH  /api/v1/<kind>/<id>          change some fields of one item
+    PATCH  /api/v1/<kind>               change many: a list of objects, each with its "id"
+    DELETE /api/v1/<kind>/<id>
+
+<kind> is entries, todos, projects or recurring. Lists are paged on id: each response
+has "next", the value to pass as ?after= for the following page (null on the last one).
+Entries, todos and recurring todos carry both "project_id" and "project" (its name);
+writes may set either one.
+
+A batch of up to MAX_BATCH items is checked in full before anything is written and
+then written in one transaction, so either every item lands or none does. Errors come
+back as {"error": ..., "index": position in the batch}.
+
+Writes go through the same bookkeeping as the pages: entry durations (durations.py),
+stored todo HTML (markdown_cache.py) and recurrence rules (recurring_bp.rule_from_form).
+"""
+import datetime
+import sqlite3
+
+from flask import Blueprint, jsonify, request
+from werkzeug.datastructures import MultiDict
+
+from database import get_db_connection, transaction
+from durations import entry_changed, entry_deleted, entry_inserted, next_entry_id
+from markdown_cache import todo_html_columns
+from projects import PROJECT_ID_SQL
+from recurring_bp import rule_from_form
+
+api_bp = Blueprint('api_bp', __name__, url_prefix='/api/v1')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Most items one POST or PATCH may carry
+MAX_BATCH = 1000
+
+# 'active' is what the daily recurrence check gives the todos it creates
+TODO_STATUSES = ('backlog', 'holding', 'started', 'finished', 'active')
+TODO_PRIORITIES = ('low', 'medium', 'high')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400, index=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.index = index
+
+
+@api_bp.errorhandler(ApiError)
+def handle_api_error(error):
+    body = {'error': error.message}
+    if error.index is not None:
+        body['index'] = error.index
+    return jsonify(body), error.status
+
+
+# --- Field checks ---
+
+def _text(data, key, required=False):
+    value = data.get(key)
+    if value is not None and not isinstance(value, (str, int, float)):
+        raise ApiError(f'{key} must be a string')
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ApiError(f'{key} is required')
+    return value or None
+
+
+def _date(data, key):
+    value = _text(data, key)
+    if value is None:
+        return None
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise ApiError(f'{key} must be a YYYY-MM-DD date')
+
+
+def _choice(data, key, choices):
+    value = _text(data, key, required=True).lower()
+    if value not in choices:
+        raise ApiError(f'{key} must be one of {", ".join(choices)}')
+    return value
+
+
+def _weekdays(data):
+    # A list of weekday numbers, 0 = Monday; the stored "0,2,4" form is read too
+    value = data.get('weekdays')
+    if value is None:
+        return []
+    if isinstance(value, str):
+        try:
+            value = [int(day) for day in value.split(',') if day.strip()]
+        except ValueError:
+            value = None
+    if not isinstance(value, list) or any(type(day) is not int or not 0 <= day <= 6 for day in value):
+        raise ApiError('weekdays must be a list of weekday numbers from 0 (Monday) to 6')
+    return value
+
+
+def _project(data, projects, required=False):
+    # The project_id for the item's "project_id", or else its "project" name
+    if data.get('project_id') is not None:
+        # type() rather than isinstance(), so true and 1.0 don't pass for project 1
+        if type(data['project_id']) is not int or data['project_id'] not in projects.values():
+            raise ApiError(f'unknown project_id {data["project_id"]!r}')
+        return data['project_id']
+    name = _text(data, 'project', required)
+    if name is not None and name not in projects:
+        raise ApiError(f'unknown project "{name}"')
+    return projects.get(name)
+
+
+def _project_given(data):
+    return 'project' in data or 'project_id' in data
+
+
+# --- Kinds ---
+# Each kind checks an incoming object against the current row (None when creating) and
+# returns the column values to write; insert/update/delete do the writing. Reads select
+# from `source` as t, with `expressions` for fields that aren't columns of t.
+
+PROJECT_JOIN = 'LEFT JOIN projects AS p ON p.id = t.project_id'
+PROJECT_FILTERS = {'project': f't.project_id = {PROJECT_ID_SQL}', 'project_id': 't.project_id = ?'}
+
+
+class Entries:
+    table = 'entries'
+    source = f'entries AS t {PROJECT_JOIN}'
+    fields = ('id', 'timestamp', 'entry_date', 'project_id', 'project', 'content', 'duration_minutes')
+    expressions = {'project': 'p.name'}
+    filters = {**PROJECT_FILTERS, 'start_date': 't.entry_date >= ?', 'end_date': 't.entry_date <= ?'}
+
+    def check(self, data, row, projects):
+        values = {}
+        if row is None or 'timestamp' in data:
+            timestamp = _text(data, 'timestamp')
+            try:
+                parsed = datetime.datetime.fromisoformat(timestamp) if timestamp else datetime.datetime.now()
+            except ValueError:
+                raise ApiError('timestamp must be YYYY-MM-DD HH:MM[:SS]')
+            values['timestamp'] = parsed.strftime('%Y-%m-%d %H:%M:%S')
+        if row is None or 'content' in data:
+            values['content'] = _text(data, 'content', required=True)
+        if row is None or _project_given(data):
+            values['project_id'] = _project(data, projects)
+        return values
+
+    def insert(self, conn, values):
+        entry_id = _insert(conn, self.table, values)
+        entry_inserted(conn, entry_id)
+        return entry_id
+
+    def update(self, conn, item_id, values):
+        old_next_id = next_entry_id(conn, item_id)
+        _update(conn, self.table, item_id, values)
+        entry_changed(conn, item_id, old_next_id)
+
+    def delete(self, conn, item_id):
+        old_next_id = next_entry_id(conn, item_id)
+        conn.execute('DELETE FROM entries WHERE id = ?', (item_id,))
+        entry_deleted(conn, old_next_id)
+
+
+class Todos:
+    table = 'todos'
+    source = f'todos AS t {PROJECT_JOIN}'
+    fields = ('id', 'project_id', 'project', 'item', 'start_date', 'due_date', 'finished_date', 'priority', 'status')
+    expressions = {'project': 'p.name'}
+    filters = {**PROJECT_FILTERS, 'status': 't.status = ?'}
+
+    def check(self, data, row, projects):
+        current = dict(row) if row is not None else {'priority': 'low', 'status': 'backlog'}
+        merged = {**current, **data}
+        values = {}
+        if row is None or _project_given(data):
+            values['project_id'] = _project(data, projects, required=True)
+        if row is None or 'item' in data:
+            values['item'] = _text(data, 'item', required=True)
+            values['item_html'], values['item_hash'] = todo_html_columns(values['item'])
+        for key in ('start_date', 'due_date'):
+            if key in data:
+                values[key] = _date(data, key)
+        # Only what the request sets is checked; the row keeps whatever it already has
+        for key, choices in (('priority', TODO_PRIORITIES), ('status', TODO_STATUSES)):
+            if row is None or key in data:
+                values[key] = _choice(merged, key, choices)
+        status = values.get('status', current['status'])
+
+        # Same rule as the todo pages: finishing stamps today, reopening clears it
+        if status == 'finished':
+            values['finished_date'] = (_date(data, 'finished_date') or current.get('finished_date')
+                                       or datetime.date.today().isoformat())
+        else:
+            values['finished_date'] = None
+        return values
+
+    def insert(self, conn, values):
+        return _insert(conn, self.table, values)
+
+    def update(self, conn, item_id, values):
+        _update(conn, self.table, item_id, values)
+
+    def delete(self, conn, item_id):
+        conn.execute('DELETE FROM todos WHERE id = ?', (item_id,))
+
+
+class Projects:
+    table = 'projects'
+    source = 'projects AS t'
+    fields = ('id', 'name', 'charging_code', 'status', 'is_active')
+    expressions = {}
+    filters = {'is_active': 't.is_active = ?'}
+
+    def check(self, data, row, projects):
+        values = {}
+        if row is None or 'name' in data:
+            values['name'] = _text(data, 'name', required=True)
+        if row is None or 'charging_code' in data:
+            values['charging_code'] = _text(data, 'charging_code') or ''
+        if row is None or 'status' in data:
+            values['status'] = _text(data, 'status') or 'active'
+        if 'is_active' in data:
+            values['is_active'] = 1 if data['is_active'] in (True, 1, '1', 'true') else 0
+        elif row is None or 'status' in data:
+            # As on the projects page, the status decides unless is_active is given
+            values['is_active'] = 1 if values['status'] == 'active' else 0
+        return values
+
+    def insert(self, conn, values):
+        return _insert(conn, self.table, values)
+
+    def update(self, conn, item_id, values):
+        _update(conn, self.table, item_id, values)
+
+    def delete(self, conn, item_id):
+        name = conn.execute('SELECT name FROM projects WHERE id = ?', (item_id,)).fetchone()['name']
+        in_use = conn.execute(
+            'SELECT EXISTS (SELECT 1 FROM entries WHERE project_id = ?1) OR EXISTS (SELECT 1 FROM todos WHERE project_id = ?1) '
+            'OR EXISTS (SELECT 1 FROM recurring_todos WHERE project_id = ?1)', (item_id,)
+        ).fetchone()[0]
+        if in_use:
+            raise ApiError(f'project "{name}" still has entries or todos; mark it inactive instead', 409)
+        conn.execute('DELETE FROM projects WHERE id = ?', (item_id,))
+
+
+class Recurring:
+    table = 'recurring_todos'
+    source = f'recurring_todos AS t {PROJECT_JOIN}'
+    fields = ('id', 'item', 'project_id', 'project', 'recurrence_type', 'next_due_date', 'recurrence_interval',
+              'weekdays', 'month_day', 'end_date', 'is_active')
+    expressions = {'project': 'p.name'}
+    filters = {**PROJECT_FILTERS, 'is_active': 't.is_active = ?'}
+    rule_fields = ('recurrence_type', 'next_due_date', 'recurrence_interval', 'weekdays', 'month_day', 'end_date')
+
+    def check(self, data, row, projects):
+        values = {}
+        if row is None or 'item' in data:
+            values['item'] = _text(data, 'item', required=True)
+        if row is None or _project_given(data):
+            values['project_id'] = _project(data, projects)
+        if 'is_active' in data:
+            values['is_active'] = 1 if data['is_active'] in (True, 1, '1', 'true') else 0
+
+        if row is None or any(key in data for key in self.rule_fields):
+            # The rule is checked as a whole, with the same rules as the recurring todo form
+            merged = {**(dict(row) if row is not None else {}), **data}
+            weekdays = _weekdays(merged)
+            form = MultiDict([(key, '' if merged.get(key) is None else str(merged[key]))
+                              for key in self.rule_fields if key != 'weekdays'])
+            form.setlist('weekdays', [str(day) for day in weekdays])
+            rule_columns = rule_from_form(form)
+            if rule_columns is None:
+                raise ApiError('recurrence_type, next_due_date and the other rule fields must describe a rule '
+                               'with at least one due date')
+            values.update(zip(self.rule_fields, rule_columns))
+        return values
+
+    def insert(self, conn, values):
+        return _insert(conn, self.table, values)
+
+    def update(self, conn, item_id, values):
+        _update(conn, self.table, item_id, values)
+
+    def delete(self, conn, item_id):
+        conn.execute('DELETE FROM recurring_todos WHERE id = ?', (item_id,))
+
+
+KINDS = {'entries': Entries(), 'todos': Todos(), 'projects': Projects(), 'recurring': Recurring()}
+
+
+def _insert(conn, table, values):
+    columns = ', '.join(values)
+    cursor = conn.execute(f'INSERT INTO {table} ({columns}) VALUES ({", ".join("?" * len(values))})',
+                          list(values.values()))
+    return cursor.lastrowid
+
+
+def _update(conn, table, item_id, values):
+    if values:
+        assignments = ', '.join(f'{column} = ?' for column in values)
+        conn.execute(f'UPDATE {table} SET {assignments} WHERE id = ?', [*values.values(), item_id])
+
+
+# --- Reading ---
+
+def kind_for(name):
+    kind = KINDS.get(name)
+    if kind is None:
+        raise ApiError(f'unknown kind "{name}"; use one of {", ".join(KINDS)}', 404)
+    return kind
+
+
+def selected_fields(kind):
+    # ?fields=a,b limits the output; id is always read so pages can be continued
+    requested = request.args.get('fields')
+    if not requested:
+        return kind.fields
+    fields = tuple(dict.fromkeys(field.strip() for field in requested.split(',') if field.strip()))
+    unknown = [field for field in fields if field not in kind.fields]
+    if unknown:
+        raise ApiError(f'unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def select_list(kind, fields):
+    # id is always read so pages can be continued
+    return ', '.join(f'{kind.expressions.get(field, "t." + field)} AS {field}' for field in dict.fromkeys(('id',) + fields))
+
+
+def fetch_rows(conn, kind, ids, fields):
+    columns = select_list(kind, fields)
+    rows = []
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        rows += conn.execute(f'SELECT {columns} FROM {kind.source} WHERE t.id IN ({", ".join("?" * len(chunk))})',
+                             chunk).fetchall()
+    by_id = {row['id']: row for row in rows}
+    return [{field: by_id[item_id][field] for field in fields} for item_id in ids if item_id in by_id]
+
+
+@api_bp.route('/<name>', methods=['GET'])
+def list_items(name):
+    kind = kind_for(name)
+    fields = selected_fields(kind)
+    limit = min(max(request.args.get('limit', DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+    after = request.args.get('after', 0, type=int)
+
+    conditions, params = ['t.id > ?'], [after]
+    for arg, condition in kind.filters.items():
+        if request.args.get(arg) is not None:
+            conditions.append(condition)
+            params.append(request.args[arg])
+
+    rows = get_db_connection().execute(
+        f'SELECT {select_list(kind, fields)} FROM {kind.source} WHERE {" AND ".join(conditions)} ORDER BY t.id LIMIT ?',
+        (*params, limit + 1)
+    ).fetchall()
+
+    page = rows[:limit]
+    return jsonify(
+        items=[{field: row[field] for field in fields} for row in page],
+        next=page[-1]['id'] if len(rows) > limit else None
+    )
+
+
+@api_bp.route('/<name>/<int:item_id>', methods=['GET'])
+def get_item(name, item_id):
+    kind = kind_for(name)
+    items = fetch_rows(get_db_connection(), kind, [item_id], selected_fields(kind))
+    if not items:
+        raise ApiError(f'{name} {item_id} not found', 404)
+    return jsonify(items[0])
+
+
+# --- Writing ---
+
+def request_items(many_allowed=True):
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        return [data], False
+    if isinstance(data, list) and many_allowed:
+        if not data:
+            raise ApiError('the list is empty')
+        if len(data) > MAX_BATCH:
+            raise ApiError(f'at most {MAX_BATCH} items per request')
+        for index, item in enumerate(data):
+            if not isinstance(item, dict):
+                raise ApiError('each item must be an object', index=index)
+        return data, True
+    raise ApiError('expected a JSON object' + (' or a list of objects' if many_allowed else ''))
+
+
+def project_ids(conn):
+    return {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM projects')}
+
+
+def check_all(kind, items, rows, projects):
+    checked = []
+    for index, (data, row) in enumerate(zip(items, rows)):
+        try:
+            checked.append(kind.check(data, row, projects))
+        except ApiError as e:
+            e.index = index
+            raise
+    return checked
+
+
+def write_all(conn, write, items):
+    # One transaction for the whole batch; a constraint failure anywhere undoes all of it
+    index = 0
+    try:
+        with transaction(conn):
+            results = []
+            for index, item in enumerate(items):
+                results.append(write(*item))
+            return results
+    except sqlite3.IntegrityError as e:
+        raise ApiError(str(e), 409, index)
+
+
+def respond(conn, kind, ids, many, status=200):
+    items = fetch_rows(conn, kind, ids, kind.fields)
+    return (jsonify(items=items) if many else jsonify(items[0])), status
+
+
+@api_bp.route('/<name>', methods=['POST'])
+def create_items(name):
+    kind = kind_for(name)
+    items, many = request_items()
+    conn = get_db_connection()
+    with transaction(conn):
+        checked = check_all(kind, items, [None] * len(items), project_ids(conn))
+        ids = write_all(conn, lambda values: kind.insert(conn, values), [(values,) for values in checked])
+    return respond(conn, kind, ids, many, 201)
+
+
+def current_rows(conn, kind, ids):
+    rows = {}
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        for row in conn.execute(f'SELECT * FROM {kind.table} WHERE id IN ({", ".join("?" * len(chunk))})', chunk):
+            rows[row['id']] = row
+    return rows
+
+
+def update_items(conn, kind, name, items):
+    ids, seen = [], set()
+    for index, data in enumerate(items):
+        item_id = data.get('id')
+        if type(item_id) is not int:
+            raise ApiError('each item needs its integer "id"', index=index)
+        # Each item is checked against the row as it was before the batch, so one change per row
+        if item_id in seen:
+            raise ApiError(f'{name} {item_id} appears more than once in the batch', index=index)
+        seen.add(item_id)
+        ids.append(item_id)
+
+    # Rows are read and checked inside the write transaction, so nothing changes in between
+    with transaction(conn):
+        rows = current_rows(conn, kind, ids)
+        for index, item_id in enumerate(ids):
+            if item_id not in rows:
+                raise ApiError(f'{name} {item_id} not found', 404, index)
+        changes = [{key: value for key, value in data.items() if key != 'id'} for data in items]
+        checked = check_all(kind, changes, [rows[item_id] for item_id in ids], project_ids(conn))
+        write_all(conn, lambda item_id, values: kind.update(conn, item_id, values), list(zip(ids, checked)))
+    return ids
+
+
+@api_bp.route('/<name>', methods=['PATCH'])
+def update_many(name):
+    kind = kind_for(name)
+    items, many = request_items()
+    conn = get_db_connection()
+    return respond(conn, kind, update_items(conn, kind, name, items), many)
+
+
+@api_bp.route('/<name>/<int:item_id>', methods=['PATCH'])
+def update_one(name, item_id):
+    kind = kind_for(name)
+    data, _ = request_items(many_allowed=False)
+    conn = get_db_connection()
+    return respond(conn, kind, update_items(conn, kind, name, [{**data[0], 'id': item_id}]), False)
+
+
+@api_bp.route('/<name>/<int:item_id>', methods=['DELETE'])
+def delete_item(name, item_id):
+    kind = kind_for(name)
+    conn = get_db_connection()
+    with transaction(conn):
+        if conn.execute(f'SELECT 1 FROM {kind.table} WHERE id = ?', (item_id,)).fetchone() is None:
+            raise ApiError(f'{name} {item_id} not found', 404)
+        kind.delete(conn, item_id)
+    return '', 204
@@ -1,236 +1,181 @@
-from flask import Flask, render_template, request, redirect, url_for
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
 import datetime
+import re
 from collections import defaultdict
-import webbrowser
 import threading
 import os
-from markupsafe import Markup, escape
-import markdown
-import recurring_bp
-from utilities import recalculate_day_durations, run_daily_recurrence_check, check_time
-
-# Import the blueprints
-from calendar_app import calendar_bp 
-from todo import todo_bp 
-from projects_bp import projects_bp
-from export_data import export_data_bp
-from recurring_bp import recurring_bp 
-
-# Set the app up as a package
-app = Flask(__name__)
-DB_NAME = 'journal.db'
-app.config['SECRET_KEY'] = 'a-super-secret-key-for-sessions'
+import click
+import database
+from database import get_db_connection, db_connection, DB_NAME
+
+# Home page: days shown on first paint, and days per infinite-scroll batch
+INDEX_INITIAL_DAYS = 5
+INDEX_FEED_DAYS = 7
+INDEX_FEED_MAX_DAYS = 31
+FEED_ENTRY_FIELDS = ('id', 'timestamp', 'project', 'content', 'duration_minutes')
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+def create_app(config=None):
+    """
+    Builds the app. Nothing touches the database here: run `flask --app app init-db`
+    (or start the app with `python app.py`) to create or upgrade the journal.
+    config is a dict of settings applied on top of the defaults, e.g.
+    {'DATABASE': 'other.db', 'TESTING': True}.
+    """
+    # The blueprints, and the modules they pull in, are only loaded once an app is wanted
+    import scheduler
+    import instrumentation
+    import write_queue
+    from formatting import format_entry_content
+    from calendar_app import calendar_bp
+    from todo import todo_bp
+    from projects_bp import projects_bp
+    from export_data import export_data_bp
+    from import_data import import_data_bp
+    from recurring_bp import recurring_bp
+    from search_bp import search_bp
+    from reports_bp import reports_bp
+    from api_bp import api_bp
+
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'a-super-secret-key-for-sessions'
+    app.config['DATABASE'] = os.environ.get('PROJECT_ECHO_DATABASE', DB_NAME)
+    # Recurring todos are created in the background at this time each day
+    app.config['RECURRENCE_CHECK_TIME'] = os.environ.get('RECURRENCE_CHECK_TIME', scheduler.DEFAULT_CHECK_TIME)
+    if config:
+        app.config.update(config)
+
+    database.init_app(app)
+    scheduler.init_app(app)
+    # Opt-in query timing, /metrics and the slow-query log (PROJECT_ECHO_SQL_INSTRUMENTATION=1)
+    instrumentation.init_app(app)
+    # Opt-in batched writer for new entries and todos (PROJECT_ECHO_WRITE_QUEUE=1)
+    write_queue.init_app(app)
+
+    # Register Blueprints
+    app.register_blueprint(calendar_bp)
+    app.register_blueprint(todo_bp)
+    app.jinja_env.filters['format_entry'] = format_entry_content
+    app.register_blueprint(projects_bp)
+    app.register_blueprint(export_data_bp)
+    app.register_blueprint(import_data_bp)
+    app.register_blueprint(recurring_bp)
+    app.register_blueprint(search_bp)
+    app.register_blueprint(reports_bp)
+    app.register_blueprint(api_bp)
+
+    app.add_url_rule('/', 'index', index, methods=('GET', 'POST'))
+    app.add_url_rule('/entries/feed', 'entries_feed', entries_feed)
+    app.add_url_rule('/userguide', 'instructions', instructions)
+    app.cli.add_command(init_db_command)
+    return app
 
 # --- Database Functions ---
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def init_db():
-    conn = get_db_connection()
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS entries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            content TEXT NOT NULL,
-            duration_minutes INTEGER,
-            project TEXT
-        );
-    ''')
-
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS todos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project TEXT NOT NULL,
-            item TEXT NOT NULL,
-            start_date TEXT,
-            due_date TEXT,
-            finished_date TEXT,
-            priority TEXT NOT NULL,
-            status TEXT NOT NULL
-        );
-    ''')
-
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE,
-            is_active BOOLEAN NOT NULL DEFAULT 1, -- 1 for active, 0 for inactive
-            charging_code TEXT NOT NULL
-        );
-    ''')
-
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS recurring_todos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            item TEXT NOT NULL,
-            project TEXT,
-            recurrence_type TEXT NOT NULL CHECK(recurrence_type IN ('daily', 'weekly', 'monthly')),
-            next_due_date TEXT NOT NULL, -- YYYY-MM-DD format
-            is_active BOOLEAN NOT NULL DEFAULT 1,
-            FOREIGN KEY(project) REFERENCES projects(name)
-        );
-    ''')
-
-    # Add a new column if it doesn't exist
-    try:
-        conn.execute('''        
-        ALTER TABLE projects ADD COLUMN charging_code TEXT;        
-        ''')
-    except sqlite3.OperationalError:
-        # This will fail if the column already exists, which is fine
-        pass 
-
-    conn.close()
-    
-# Jinja Filter for Entry Formatting
-def format_entry_content(content):
-    # Converts newline characters to <br>, and handles simple markdown for lists.
-    if not content:
-        return ""
-
-    lines = content.split('\n')
-    html_lines = []
-    
-    in_ul = False
-    in_ol = False
-
-    for line in lines:
-        stripped_line = line.strip()
-
-        # Unordered List (*)
-        if stripped_line.startswith('* '):
-            if not in_ul:
-                html_lines.append('<ul class="entry-list">')
-                in_ul = True
-            
-            # Close ordered list if transitioning
-            if in_ol:
-                html_lines.append('</ol>')
-                in_ol = False
-                
-            item_content = stripped_line[2:].strip()
-            html_lines.append(f'<li>{escape(item_content)}</li>') 
-            continue
-
-        # Ordered List (#)
-        elif stripped_line.startswith('# '):
-            if not in_ol:
-                html_lines.append('<ol class="entry-list">')
-                in_ol = True
-            
-            # Close unordered list if transitioning
-            if in_ul:
-                html_lines.append('</ul>')
-                in_ul = False
-                
-            item_content = stripped_line[2:].strip()
-            html_lines.append(f'<li>{escape(item_content)}</li>')
-            continue
-
-        # Regular Text (Newlines and Paragraphs)
-        else:
-            # Close any open list
-            if in_ul:
-                html_lines.append('</ul>')
-                in_ul = False
-            if in_ol:
-                html_lines.append('</ol>')
-                in_ol = False
-
-            # Convert simple text lines to paragraphs or <br> (for multiline text)
-            if stripped_line:
-                # Use <p> for blocks of text or simply <br> for line breaks
-                escaped_line = escape(line)
-                html_lines.append(f'{escaped_line}<br>')
-            else:
-                # Add an extra <br> for an empty line (paragraph break)
-                html_lines.append('<br>')
-
-
-    # Close any list that might still be open at the end of the entry
-    if in_ul:
-        html_lines.append('</ul>')
-    if in_ol:
-        html_lines.append('</ol>')
-
-    # Join lines and return, ensuring we use Markup to tell Jinja it's safe HTML
-    return Markup(''.join(html_lines).strip('<br>'))
-
-init_db()
+    # Create the tables and apply any schema changes this journal hasn't seen yet
+    from migrations import migrate
+    from markdown_cache import fill_missing_todo_html
+
+    with db_connection() as conn:
+        migrate(conn)
+        fill_missing_todo_html(conn)
+
+@click.command('init-db')
+def init_db_command():
+    """Create the journal database or bring its schema up to date."""
+    init_db()
+    click.echo(f'Database ready: {database.database_path()}')
 # -----------------------------------------------------------------------------------
 
-# Register Blueprints
-app.register_blueprint(calendar_bp)
-app.register_blueprint(todo_bp)
-app.jinja_env.filters['format_entry'] = format_entry_content
-app.register_blueprint(projects_bp)
-app.register_blueprint(export_data_bp)
-app.register_blueprint(recurring_bp)
-
-@app.route('/', methods=('GET', 'POST'))
 def index():
     conn = get_db_connection()
     if request.method == 'POST':
+        from projects import project_id
+        from write_queue import add_entry
+
         content = request.form['content']
         project = request.form.get('project') or None
+        # An entry may have no project, but a named one has to exist
+        entry_project_id = project_id(conn, project) if project else None
+        if project and entry_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('index'))
         now = datetime.datetime.now()
-        date_of_entry = now.strftime('%Y-%m-%d')
         timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
-        conn.execute('INSERT INTO entries (timestamp, content, project) VALUES (?, ?, ?)',
-                     (timestamp, content, project))
-        # Update elapsed times starting from the new entry's timestamp
-        recalculate_day_durations(conn, date_of_entry)
-
-        conn.commit()
-        conn.close()
+        add_entry(conn, timestamp, content, entry_project_id)
         return redirect(url_for('index'))
 
     # Get active projects for the dropdown
     active_projects = get_active_projects()
 
-    # Get entries from the last 14 days
-    fourteen_days_ago = datetime.datetime.now() - datetime.timedelta(days=14)
-    cutoff_timestamp = fourteen_days_ago.strftime('%Y-%m-%d %H:%M:%S')
-    
+    # The most recent few days paint first; older days are fetched by the page as you scroll
+    entry_days, next_before = fetch_entry_days(conn, limit=INDEX_INITIAL_DAYS)
+        
+    return render_template('index.html', 
+                           entry_days=entry_days, 
+                           active_projects=active_projects,
+                           next_before=next_before
+                           )
+
+def entries_feed():
+    """
+    JSON feed of older days for the home page's infinite scroll.
+    ?before=YYYY-MM-DD returns the `days` whole days with entries before that date,
+    newest first, each with its entries, total and pre-rendered HTML, plus the cursor
+    for the next batch (null once the beginning of the journal is reached).
+    """
+    before = request.args.get('before')
+    if before is not None and not DATE_PATTERN.fullmatch(before):
+        return jsonify(error='before must be a YYYY-MM-DD date'), 400
+    day_count = min(max(request.args.get('days', INDEX_FEED_DAYS, type=int), 1), INDEX_FEED_MAX_DAYS)
+
+    entry_days, next_before = fetch_entry_days(get_db_connection(), before, day_count)
+    return jsonify(
+        days=[{
+            'date': day['date'],
+            'total_minutes': day['total_minutes'],
+            'entries': [{key: entry[key] for key in FEED_ENTRY_FIELDS} for entry in day['entries']],
+            'html': render_template('entry_day.html', day=day),
+        } for day in entry_days],
+        next_before=next_before
+    )
+
+def fetch_entry_days(conn, before=None, limit=INDEX_FEED_DAYS):
+    """
+    Keyset pagination over whole days: the `limit` most recent days that have entries,
+    strictly before `before` (YYYY-MM-DD) if given. Returns ([{date, entries,
+    total_minutes}, ...] newest day first, cursor for the next older batch or None).
+    """
+    day_rows = conn.execute(
+        'SELECT day, SUM(total_minutes) AS total_minutes FROM daily_totals '
+        'WHERE day < ? GROUP BY day ORDER BY day DESC LIMIT ?',
+        (before or '9999-12-31', limit)
+    ).fetchall()
+    if not day_rows:
+        return [], None
+
+    newest, oldest = day_rows[0]['day'], day_rows[-1]['day']
     entries = conn.execute(
-        'SELECT *, duration_minutes FROM entries WHERE timestamp >= ? ORDER BY timestamp ASC',
-        (cutoff_timestamp,)
+        'SELECT e.*, p.name AS project FROM entries AS e LEFT JOIN projects AS p ON p.id = e.project_id '
+        'WHERE e.entry_date BETWEEN ? AND ? ORDER BY e.timestamp ASC, e.id ASC',
+        (oldest, newest)
     ).fetchall()
 
-    entries_by_date = defaultdict(list)
-    
     # Group the entries by date
-    all_dates = set()
+    entries_by_date = defaultdict(list)
     for entry in entries:
-        date_part = entry['timestamp'].split(' ')[0]
-        entries_by_date[date_part].append(entry)
-        all_dates.add(date_part) # Collect all unique dates
-
-    # Calculate Total Elapsed Time for each unique date
-    total_durations_by_date = {} 
-    
-    for date_str in all_dates:
-        # Query the database for the sum of duration_minutes for this date
-        total_duration_row = conn.execute(
-            'SELECT SUM(COALESCE(duration_minutes, 0)) AS total_minutes FROM entries WHERE strftime("%Y-%m-%d", timestamp) = ?',
-            (date_str,)
-        ).fetchone()
-        
-        # Store the minutes
-        total_durations_by_date[date_str] = total_duration_row['total_minutes'] if total_duration_row['total_minutes'] is not None else 0
+        entries_by_date[entry['entry_date']].append(entry)
 
-    conn.close()
-        
-    return render_template('index.html', 
-                           entries_by_date=reversed(entries_by_date.items()), 
-                           active_projects=active_projects,
-                           total_durations=total_durations_by_date
-                           )
+    entry_days = [{
+        'date': row['day'],
+        'entries': entries_by_date[row['day']],
+        'total_minutes': row['total_minutes'],
+    } for row in day_rows]
+
+    has_older = conn.execute('SELECT 1 FROM daily_totals WHERE day < ? LIMIT 1', (oldest,)).fetchone()
+    return entry_days, (oldest if has_older else None)
 
-@app.route('/userguide')
 def instructions():
     return render_template('userguide.html')
 
@@ -240,15 +185,23 @@ def get_active_projects():
     projects = conn.execute(
         'SELECT name FROM projects WHERE is_active = 1 ORDER BY name ASC'
     ).fetchall()
-    conn.close()
     # Return a list of project names
     return [p['name'] for p in projects]
 
 if __name__ == '__main__':
-    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    app = create_app()
+    with app.app_context():
+        init_db()
+
+    # FLASK_DEBUG=1 turns on the debugger and the reloader
+    debug = os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes')
+    # The reloader runs the app in a second process; only that one opens the browser
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        import webbrowser
+
         def open_browser():
             webbrowser.open_new_tab('http://localhost:5000/')
 
         threading.Timer(1, open_browser).start()
-    
-    app.run(port=5000, debug=True)
\ No newline at end of file
+
+    app.run(port=5000, debug=debug)
@@ -0,0 +1,158 @@
+"""
+Micro-benchmark: formatting.format_entry_content against the formatter it replaced.
+
+    python benchmarks/bench_format_entry.py [--entries N] [--repeat N]
+
+Checks the two produce identical output for a fuzzed corpus first, then times a
+cold pass (empty cache, i.e. the first render of each entry) and a warm pass (every
+render after that).
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+from markupsafe import Markup, escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import formatting  # noqa: E402
+
+WORDS = ['fixed', 'the', 'build', 'met', 'with', 'Sam', 'about', '<script>', 'A&B',
+         '"quoted"', "it's", 'deploy', 'review', 'notes', 'bug', '#42', '*', 'done']
+LINE_STARTS = ['', '', '', '* ', '# ', '  * ', '#', '*', ' ']
+
+
+# The implementation as it was before formatting.py, kept verbatim for comparison
+def legacy_format_entry_content(content):
+    # Converts newline characters to <br>, and handles simple markdown for lists.
+    if not content:
+        return ""
+
+    lines = content.split('\n')
+    html_lines = []
+    
+    in_ul = False
+    in_ol = False
+
+    for line in lines:
+        stripped_line = line.strip()
+
+        # Unordered List (*)
+        if stripped_line.startswith('* '):
+            if not in_ul:
+                html_lines.append('<ul class="entry-list">')
+                in_ul = True
+            
+            # Close ordered list if transitioning
+            if in_ol:
+                html_lines.append('</ol>')
+                in_ol = False
+                
+            item_content = stripped_line[2:].strip()
+            html_lines.append(f'<li>{escape(item_content)}</li>') 
+            continue
+
+        # Ordered List (#)
+        elif stripped_line.startswith('# '):
+            if not in_ol:
+                html_lines.append('<ol class="entry-list">')
+                in_ol = True
+            
+            # Close unordered list if transitioning
+            if in_ul:
+                html_lines.append('</ul>')
+                in_ul = False
+                
+            item_content = stripped_line[2:].strip()
+            html_lines.append(f'<li>{escape(item_content)}</li>')
+            continue
+
+        # Regular Text (Newlines and Paragraphs)
+        else:
+            # Close any open list
+            if in_ul:
+                html_lines.append('</ul>')
+                in_ul = False
+            if in_ol:
+                html_lines.append('</ol>')
+                in_ol = False
+
+            # Convert simple text lines to paragraphs or <br> (for multiline text)
+            if stripped_line:
+                # Use <p> for blocks of text or simply <br> for line breaks
+                escaped_line = escape(line)
+                html_lines.append(f'{escaped_line}<br>')
+            else:
+                # Add an extra <br> for an empty line (paragraph break)
+                html_lines.append('<br>')
+
+
+    # Close any list that might still be open at the end of the entry
+    if in_ul:
+        html_lines.append('</ul>')
+    if in_ol:
+        html_lines.append('</ol>')
+
+    # Join lines and return, ensuring we use Markup to tell Jinja it's safe HTML
+    return Markup(''.join(html_lines).strip('<br>'))
+
+
+def make_entry(rng):
+    lines = []
+    for _ in range(rng.randint(1, 12)):
+        words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(0, 12)))
+        lines.append(rng.choice(LINE_STARTS) + words + rng.choice(['', '', ' ', '\t']))
+    return '\n'.join(lines)
+
+
+def time_pass(func, corpus, repeat):
+    best = None
+    for _ in range(repeat):
+        formatting._format_cached.cache_clear()
+        start = time.perf_counter()
+        for content in corpus:
+            func(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--entries', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(1234)
+    corpus = [make_entry(rng) for _ in range(args.entries)]
+
+    for content in corpus:
+        expected = legacy_format_entry_content(content)
+        actual = formatting.format_entry_content(content)
+        if expected != actual or type(expected) is not type(actual):
+            sys.exit(f'Output differs for {content!r}:\n{expected!r}\n{actual!r}')
+    print(f'{len(corpus)} entries: output identical')
+
+    legacy = time_pass(legacy_format_entry_content, corpus, args.repeat)
+    cold = time_pass(formatting._format, corpus, args.repeat)
+
+    # Warm: fill the cache once, then time renders that hit it
+    formatting._format_cached.cache_clear()
+    for content in corpus:
+        formatting.format_entry_content(content)
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for content in corpus:
+            formatting.format_entry_content(content)
+    warm = (time.perf_counter() - start) / args.repeat
+
+    per_entry = 1e6 / len(corpus)
+    print(f'legacy : {legacy * per_entry:8.2f} us/entry')
+    print(f'cold   : {cold * per_entry:8.2f} us/entry  ({legacy / cold:.1f}x)')
+    print(f'cached : {warm * per_entry:8.2f} us/entry  ({legacy / warm:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""
+Per-route benchmark: drives every page through Flask's test client against a
+generated journal and reports latency, SQL statements and peak memory per request.
+
+    python benchmarks/generate_data.py            # once
+    python benchmarks/bench_routes.py [--db PATH] [--repeat N] [--save FILE] [--baseline FILE]
+
+Latency is the median of --repeat runs after one warm-up request. Statements are
+counted with sqlite3's trace callback (statements run by triggers are not counted
+separately). Peak memory is measured with tracemalloc in a separate pass, so its
+overhead doesn't skew the timings.
+
+--save writes the results as JSON; --baseline compares against a saved file and
+exits with status 1 if any route got slower than --threshold or runs more queries.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_data import DEFAULT_PATH  # noqa: E402
+
+
+def load_app(db_path):
+    from app import create_app
+    # TESTING keeps the background scheduler from writing to the benchmark database
+    return create_app({'DATABASE': os.path.abspath(db_path), 'TESTING': True})
+
+
+def pick_routes(db_path):
+    """The routes to benchmark, with real ids and dates from the generated data."""
+    conn = sqlite3.connect(db_path)
+    try:
+        last_day = conn.execute('SELECT MAX(entry_date) FROM entries').fetchone()[0]
+        busiest_project = conn.execute(
+            'SELECT p.name FROM daily_totals AS dt JOIN projects AS p ON p.id = dt.project_id '
+            'GROUP BY dt.project_id ORDER BY SUM(dt.entry_count) DESC LIMIT 1'
+        ).fetchone()[0]
+        entry_id = conn.execute('SELECT MAX(id) FROM entries').fetchone()[0]
+        todo_id = conn.execute('SELECT MAX(id) FROM todos').fetchone()[0]
+        recurring_id = conn.execute('SELECT MIN(id) FROM recurring_todos').fetchone()[0]
+    finally:
+        conn.close()
+
+    year, month = int(last_day[:4]), int(last_day[5:7])
+    quarter_start = f'{year}-{max(month - 2, 1):02d}-01'
+    return [
+        # (name, method, url, form data)
+        ('index', 'GET', '/', None),
+        ('entries_feed', 'GET', f'/entries/feed?before={last_day}', None),
+        ('calendar_view', 'GET', f'/calendar/{year}/{month}', None),
+        ('view_day', 'GET', f'/day/{last_day}', None),
+        ('edit_entry', 'GET', f'/edit/{entry_id}', None),
+        ('todo', 'GET', '/todo/', None),
+        ('edit_todo', 'GET', f'/todo/edit/{todo_id}', None),
+        ('projects', 'GET', '/projects/', None),
+        ('project_dashboard', 'GET', f'/projects/dashboard/{busiest_project}', None),
+        ('manage_recurring', 'GET', '/recurring/', None),
+        ('edit_recurring', 'GET', f'/recurring/{recurring_id}/edit', None),
+        ('search', 'GET', '/search/?q=release+notes', None),
+        ('reports_month', 'GET', f'/reports/?start_date={year - 1}-01-01&end_date={last_day}&period=month', None),
+        ('reports_week', 'GET', f'/reports/?start_date={quarter_start}&end_date={last_day}&period=week', None),
+        ('export_data', 'POST', '/export', {'start_date': quarter_start, 'end_date': last_day}),
+    ]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, statement):
+        # Trigger bodies are reported as comments; only count what the app ran
+        if not statement.lstrip().startswith('--'):
+            self.count += 1
+
+
+def run_route(client, counter, method, url, data):
+    counter.count = 0
+    response = client.open(url, method=method, data=data)
+    # Reading the body runs streamed responses (the export) to completion
+    body = response.get_data()
+    if response.status_code != 200:
+        raise RuntimeError(f'{method} {url} returned {response.status_code}: {body[:200]!r}')
+    return len(body)
+
+
+def bench(app, routes, repeat):
+    from database import get_db_connection
+
+    counter = QueryCounter()
+
+    # Left in place after the request, so streamed responses that query while the
+    # body is being read (the export) are counted too
+    @app.before_request
+    def trace_queries():
+        get_db_connection().set_trace_callback(counter)
+
+    client = app.test_client()
+    results = {}
+    for name, method, url, data in routes:
+        run_route(client, counter, method, url, data)  # warm-up
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = run_route(client, counter, method, url, data)
+            timings.append(time.perf_counter() - start)
+        queries = counter.count
+
+        tracemalloc.start()
+        run_route(client, counter, method, url, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        results[name] = {
+            'url': url,
+            'median_ms': round(statistics.median(timings) * 1000, 3),
+            'min_ms': round(min(timings) * 1000, 3),
+            'queries': queries,
+            'peak_kib': round(peak / 1024, 1),
+            'bytes': size,
+        }
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Prints regressions against a saved run; returns True if there were any."""
+    regressed = False
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        slower = result['median_ms'] > before['median_ms'] * (1 + threshold)
+        more_queries = result['queries'] > before['queries']
+        if slower or more_queries:
+            regressed = True
+            print(f'REGRESSION {name}: {before["median_ms"]:.2f} -> {result["median_ms"]:.2f} ms, '
+                  f'{before["queries"]} -> {result["queries"]} queries')
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', default=DEFAULT_PATH, help='Journal to benchmark (see generate_data.py).')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against results saved with --save.')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline before failing (default 0.25 = 25%%).')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f'{args.db} not found; create it with benchmarks/generate_data.py first.')
+
+    # Every benchmarked request is read-only, so the generated data can be reused across runs
+    app = load_app(args.db)
+    results = bench(app, pick_routes(args.db), args.repeat)
+
+    print(f'{"route":<20} {"median ms":>10} {"min ms":>9} {"queries":>8} {"peak KiB":>10} {"bytes":>10}')
+    for name, result in results.items():
+        print(f'{name:<20} {result["median_ms"]:>10.2f} {result["min_ms"]:>9.2f} {result["queries"]:>8} '
+              f'{result["peak_kib"]:>10.1f} {result["bytes"]:>10}')
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+        print('No regressions against', args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Cold-start benchmark: how long a brand new Python process takes to import the app,
+build it with create_app() and serve its first page.
+
+    python benchmarks/bench_startup.py [--db PATH] [--repeat N]
+
+Each run is a separate interpreter, so nothing is already imported or cached. The
+database is created once with init_db() before timing starts, as it would be on a
+real install; pass --db to use an existing journal (e.g. from generate_data.py).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child process; prints its own timings in seconds
+CHILD = '''
+import sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app
+imported = time.perf_counter()
+flask_app = app.create_app({{'DATABASE': {db!r}, 'TESTING': True}})
+created = time.perf_counter()
+response = flask_app.test_client().get('/')
+assert response.status_code == 200, response.status_code
+served = time.perf_counter()
+print(imported - started, created - imported, served - created, len(sys.modules))
+'''
+
+
+def prepare(db_path):
+    sys.path.insert(0, ROOT)
+    from app import create_app, init_db
+
+    with create_app({'DATABASE': db_path, 'TESTING': True}).app_context():
+        init_db()
+
+
+def run_once(db_path):
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD.format(root=ROOT, db=db_path)],
+                            capture_output=True, text=True, check=True).stdout.split()
+    total = time.perf_counter() - start
+    return (total, *map(float, output[:3]), int(output[3]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--db', help='Journal to start against (default: a new empty one).')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(tempfile.mkdtemp(), 'journal.db')
+    prepare(db_path)
+
+    runs = [run_once(db_path) for _ in range(args.repeat)]
+    labels = ('process', 'import app', 'create_app', 'first request')
+    for index, label in enumerate(labels):
+        print(f'{label:<14} {statistics.median(run[index] for run in runs) * 1000:>8.1f} ms')
+    print(f'{"modules":<14} {runs[0][4]:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Fills a throwaway journal database with realistic, deterministic data for benchmarks.
+
+    python benchmarks/generate_data.py [PATH] [--years N] [--seed N] ...
+
+The same arguments always produce the same database: every value comes from one
+seeded random generator and dates count back from a fixed --end-date, not today.
+The schema is created by the app's own migrations, and rows go in through the same
+triggers the app relies on (daily totals, search index, change versions).
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import connect  # noqa: E402
+from durations import recalculate_range  # noqa: E402
+from markdown_cache import todo_html_columns  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+DEFAULT_PATH = os.path.join(tempfile.gettempdir(), 'project_echo_bench', 'journal.db')
+
+WORDS = ('fixed', 'reviewed', 'deployed', 'the', 'build', 'pipeline', 'met', 'with', 'team',
+         'about', 'release', 'notes', 'bug', 'customer', 'report', 'migration', 'draft',
+         'plan', 'tests', 'docs', 'invoice', 'call', 'design', 'sync', 'backlog', 'lunch')
+STATUSES = ('backlog', 'holding', 'started', 'finished')
+PRIORITIES = ('low', 'medium', 'high')
+
+# Rows per executemany batch
+BATCH_SIZE = 5000
+
+
+def sentence(rng, low=3, high=14):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high))).capitalize()
+
+
+def entry_content(rng):
+    # Mostly one-liners, some multi-line notes with the list syntax entries support
+    lines = [sentence(rng)]
+    if rng.random() < 0.3:
+        marker = rng.choice(('* ', '# '))
+        lines += [marker + sentence(rng, 2, 6) for _ in range(rng.randint(2, 5))]
+    if rng.random() < 0.1:
+        lines += ['', sentence(rng, 8, 30)]
+    return '\n'.join(lines)
+
+
+def todo_item(rng):
+    text = sentence(rng, 2, 10)
+    if rng.random() < 0.2:
+        text = f'**{text}**'
+    if rng.random() < 0.1:
+        text += '\n\n- ' + '\n- '.join(sentence(rng, 2, 5) for _ in range(3))
+    return text
+
+
+def batched(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+def generate(path, years=3, entries_per_day=12, todos=5000, projects=40, recurring=60,
+             end_date=datetime.date(2024, 12, 31), seed=42):
+    """Creates the database at path (which must not exist yet). Returns row counts per table."""
+    rng = random.Random(seed)
+    start_date = end_date - datetime.timedelta(days=365 * years - 1)
+
+    conn = connect(path)
+    try:
+        migrate(conn)
+
+        project_names = [f'Project {index:03d}' for index in range(1, projects + 1)]
+        # A few busy projects get most of the time, like a real journal
+        weights = [1 / (rank + 1) for rank in range(projects)]
+
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO projects (name, is_active, charging_code, status) VALUES (?, ?, ?, ?)',
+            [(name, int(index < projects * 0.6), f'CC-{rng.randint(1000, 9999)}' if rng.random() < 0.8 else '',
+              'active' if index < projects * 0.6 else 'inactive')
+             for index, name in enumerate(project_names)]
+        )
+        ids = dict(conn.execute('SELECT name, id FROM projects'))
+        project_ids = [ids[name] for name in project_names]
+
+        entries = []
+        day = start_date
+        while day <= end_date:
+            # Fewer entries at weekends, and the odd day off
+            count = rng.randint(entries_per_day // 2, entries_per_day * 3 // 2)
+            if day.weekday() >= 5 or rng.random() < 0.05:
+                count //= 4
+            minutes = sorted(rng.sample(range(7 * 60, 19 * 60), count))
+            for minute in minutes:
+                timestamp = f'{day.isoformat()} {minute // 60:02d}:{minute % 60:02d}:{rng.randint(0, 59):02d}'
+                project_id = rng.choices(project_ids, weights)[0] if rng.random() < 0.9 else None
+                entries.append((timestamp, entry_content(rng), project_id))
+            day += datetime.timedelta(days=1)
+        for batch in batched(entries):
+            conn.executemany('INSERT INTO entries (timestamp, content, project_id) VALUES (?, ?, ?)', batch)
+        recalculate_range(conn, start_date.isoformat(), end_date.isoformat())
+
+        todo_rows = []
+        span = (end_date - start_date).days
+        for _ in range(todos):
+            item = todo_item(rng)
+            started = start_date + datetime.timedelta(days=rng.randint(0, span))
+            due = started + datetime.timedelta(days=rng.randint(1, 60)) if rng.random() < 0.6 else None
+            status = rng.choices(STATUSES, (2, 1, 2, 10))[0]
+            finished = None
+            if status == 'finished':
+                finished = min(started + datetime.timedelta(days=rng.randint(0, 45)), end_date).isoformat()
+            todo_rows.append((rng.choices(project_ids, weights)[0], item, started.isoformat(),
+                              due.isoformat() if due else None, finished, rng.choice(PRIORITIES), status,
+                              *todo_html_columns(item)))
+        for batch in batched(todo_rows):
+            conn.executemany(
+                'INSERT INTO todos (project_id, item, start_date, due_date, finished_date, priority, status, item_html, item_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                batch
+            )
+
+        recurring_rows = []
+        for _ in range(recurring):
+            recurrence_type = rng.choice(('daily', 'weekly', 'weekly', 'monthly'))
+            next_due = end_date + datetime.timedelta(days=rng.randint(1, 30))
+            weekdays = ','.join(str(day) for day in sorted(rng.sample(range(5), 2))) if recurrence_type == 'weekly' and rng.random() < 0.5 else None
+            month_day = next_due.day if recurrence_type == 'monthly' else None
+            recurring_rows.append((sentence(rng, 2, 6), rng.choice(project_ids), recurrence_type, next_due.isoformat(),
+                                   int(rng.random() < 0.8), rng.choice((1, 1, 1, 2)), weekdays, month_day))
+        conn.executemany(
+            'INSERT INTO recurring_todos (item, project_id, recurrence_type, next_due_date, is_active, '
+            'recurrence_interval, weekdays, month_day) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            recurring_rows
+        )
+        conn.commit()
+
+        conn.execute('ANALYZE')
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('entries', 'todos', 'projects', 'recurring_todos')}
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--entries-per-day', type=int, default=12)
+    parser.add_argument('--todos', type=int, default=5000)
+    parser.add_argument('--projects', type=int, default=40)
+    parser.add_argument('--recurring', type=int, default=60)
+    parser.add_argument('--end-date', type=datetime.date.fromisoformat, default=datetime.date(2024, 12, 31))
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--force', action='store_true', help='Replace PATH if it already exists.')
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        if not args.force:
+            sys.exit(f'{args.path} already exists (use --force to replace it).')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    os.makedirs(os.path.dirname(os.path.abspath(args.path)), exist_ok=True)
+
+    counts = generate(args.path, args.years, args.entries_per_day, args.todos, args.projects,
+                      args.recurring, args.end_date, args.seed)
+    print(f'Wrote {args.path}: ' + ', '.join(f'{count} {table}' for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,30 +1,55 @@
-﻿from flask import Blueprint, render_template, request, redirect, url_for
+﻿from flask import Blueprint, render_template, request, redirect, url_for, flash
 import datetime
 import calendar
-from collections import defaultdict
-import sqlite3
-import markdown
-from markupsafe import Markup, escape 
-from utilities import recalculate_day_durations
+import threading
+from markdown_cache import todo_item_inline_html
+from durations import entry_changed, next_entry_id
+from database import get_db_connection, transaction
+from change_tracking import scope_version, month_scope, day_scope
+import conditional
+from write_queue import add_entry
+from projects import project_id
 
 # Define the Blueprint. The URL prefix will be '/day' for the view_day route, 
 # but the calendar_view route will use its own path.
 calendar_bp = Blueprint('calendar_bp', __name__)
 
-# Helper function to get database connection (copied from app.py)
-def get_db_connection():
-    conn = sqlite3.connect('journal.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+# Days that have entries, per month: {(db path, 'YYYY-MM'): (month version, set of dates)}
+_month_cache = {}
+_month_cache_lock = threading.Lock()
+MONTH_CACHE_SIZE = 120
+
+def get_dates_with_entries(conn, first_day, next_month_first_day):
+    """
+    Returns the set of YYYY-MM-DD dates in one month that have entries. The result is
+    cached until an entry in that month is added, deleted or moved (tracked by the
+    month's change version), so navigating the calendar is one tiny lookup.
+    """
+    month_key = first_day.strftime('%Y-%m')
+    cache_key = (conn.db_path, month_key)
+    # Read the version BEFORE the dates: a write in between just makes the next visit refetch
+    version = scope_version(conn, month_scope(month_key))
+
+    cached = _month_cache.get(cache_key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    rows = conn.execute(
+        'SELECT DISTINCT entry_date FROM entries WHERE entry_date >= ? AND entry_date < ?',
+        (first_day.isoformat(), next_month_first_day.isoformat())
+    ).fetchall()
+    dates_with_entries = frozenset(row[0] for row in rows)
+
+    with _month_cache_lock:
+        if cache_key not in _month_cache and len(_month_cache) >= MONTH_CACHE_SIZE:
+            # Drop the oldest cached month
+            _month_cache.pop(next(iter(_month_cache)), None)
+        _month_cache[cache_key] = (version, dates_with_entries)
+    return dates_with_entries
 
 @calendar_bp.route('/calendar', defaults={'year': None, 'month': None})
 @calendar_bp.route('/calendar/<int:year>/<int:month>')
 def calendar_view(year, month):
-    conn = get_db_connection()
-    dates_with_entries = conn.execute('SELECT DISTINCT SUBSTR(timestamp, 1, 10) FROM entries').fetchall()
-    dates_with_entries = {row[0] for row in dates_with_entries}
-    conn.close()
-    
     # Determine the month to display
     if year is None or month is None:
         target_date = datetime.date.today()
@@ -49,7 +74,14 @@ def calendar_view(year, month):
     next_year = next_month_date.year
     next_month = next_month_date.month
 
-    
+    # The month only changes when an entry is added, removed or moved; /calendar also follows today
+    conn = get_db_connection()
+    validators, not_modified = conditional.check(conn, [month_scope(first_day_of_month.isoformat())], datetime.date.today())
+    if not_modified:
+        return not_modified
+
+    dates_with_entries = get_dates_with_entries(conn, first_day_of_month, next_month_date)
+
     # Generate calendar data for the target month
     cal = calendar.Calendar(firstweekday=calendar.MONDAY)
     current_month_days = cal.monthdayscalendar(target_date.year, target_date.month)
@@ -68,7 +100,7 @@ def calendar_view(year, month):
                 week_data.append({'day': day, 'date': current_date, 'has_entry': has_entry})
         month_data.append(week_data)
         
-    return render_template('calendar.html', 
+    return conditional.finish(render_template('calendar.html', 
                            month=month_name, 
                            year=target_date.year, 
                            month_data=month_data,
@@ -77,27 +109,40 @@ def calendar_view(year, month):
                            prev_year=prev_year,
                            prev_month=prev_month,
                            next_year=next_year,
-                           next_month=next_month)
+                           next_month=next_month), validators)
 
 @calendar_bp.route('/day/<date>', methods=('GET', 'POST'))
 def view_day(date):
     conn = get_db_connection()
     if request.method == 'POST':
         content = request.form['content']
+        project = request.form.get('project') or None
+        # An entry may have no project, but a named one has to exist
+        entry_project_id = project_id(conn, project) if project else None
+        if project and entry_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('calendar_bp.view_day', date=date))
         timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        conn.execute('INSERT INTO entries (timestamp, content) VALUES (?, ?)',
-                     (timestamp, content))
-        conn.commit()
+        add_entry(conn, timestamp, content, entry_project_id)
 
-        conn.close()
         return redirect(url_for('calendar_bp.view_day', date=date))
+
+    # Nothing changed on this day (or in the project list) since the browser's copy
+    validators, not_modified = conditional.check(conn, [day_scope(date), 'projects'])
+    if not_modified:
+        return not_modified
     
     # Fetch Journal Entries
-    entries = conn.execute('SELECT * FROM entries WHERE SUBSTR(timestamp, 1, 10) = ? ORDER BY timestamp ASC', (date,)).fetchall()
+    entries = conn.execute(
+        'SELECT e.*, p.name AS project FROM entries AS e LEFT JOIN projects AS p ON p.id = e.project_id '
+        'WHERE e.entry_date = ? ORDER BY e.timestamp ASC, e.id ASC',
+        (date,)
+    ).fetchall()
     
     # Fetch Finished To-Do Items
     raw_finished_todos = conn.execute(
-        'SELECT * FROM todos WHERE finished_date = ? AND status = "finished" ORDER BY item ASC',
+        "SELECT t.*, p.name AS project FROM todos AS t LEFT JOIN projects AS p ON p.id = t.project_id "
+        "WHERE t.finished_date = ? AND t.status = 'finished' ORDER BY t.item ASC",
         (date,)
     ).fetchall()
 
@@ -106,29 +151,25 @@ def view_day(date):
     active_projects = [row['name'] for row in project_rows]
 
     total_duration_row = conn.execute(
-        'SELECT SUM(COALESCE(duration_minutes, 0)) AS total_minutes FROM entries WHERE strftime("%Y-%m-%d", timestamp) = ?',
+        'SELECT SUM(total_minutes) AS total_minutes FROM daily_totals WHERE day = ?',
         (date,)
-    ).fetchone() # COALESCE(duration_minutes, 0) treats NULL values as 0
+    ).fetchone() # SUM over no rows is NULL, handled below
 
     total_elapsed_minutes = total_duration_row['total_minutes'] if total_duration_row['total_minutes'] is not None else 0
 
-    conn.close()
-
     entries_with_time = []
-    previous_timestamp = None
+    previous_epoch = None
     
     for entry in entries:
-        current_timestamp_str = entry['timestamp']
-        
         time_elapsed = None
-        if previous_timestamp:
-            time_elapsed = datetime.datetime.strptime(current_timestamp_str, '%Y-%m-%d %H:%M:%S') - previous_timestamp
+        if previous_epoch is not None:
+            time_elapsed = datetime.timedelta(seconds=entry['entry_epoch'] - previous_epoch)
             
         entry_with_time = dict(entry)
         entry_with_time['time_elapsed'] = time_elapsed
         
         entries_with_time.append(entry_with_time)
-        previous_timestamp = datetime.datetime.strptime(current_timestamp_str, '%Y-%m-%d %H:%M:%S')
+        previous_epoch = entry['entry_epoch']
 
     entries_with_time.reverse()
 
@@ -136,23 +177,17 @@ def view_day(date):
     for row in raw_finished_todos:
         todo_item = dict(row) # Convert Row to dictionary
         
-        # Convert Markdown to HTML and wrap in Markup
-        html_content = markdown.markdown(
-            todo_item['item'], 
-            extensions=['fenced_code', 'sane_lists']
-        )
-        if html_content.startswith('<p>') and html_content.endswith('</p>'):
-             html_content = html_content[3:-4]
-        todo_item['item_html'] = Markup(html_content)
+        # Convert Markdown to HTML (cached) and wrap in Markup
+        todo_item['item_html'] = todo_item_inline_html(todo_item['item'])
         
         finished_todos.append(todo_item)
 
-    return render_template('day_view.html', 
+    return conditional.finish(render_template('day_view.html', 
                            entries=reversed(entries_with_time), 
                            finished_todos=finished_todos, 
                            date=date, 
                            active_projects=active_projects, 
-                           total_elapsed_minutes=total_elapsed_minutes)
+                           total_elapsed_minutes=total_elapsed_minutes), validators)
 
 @calendar_bp.route('/edit/<int:entry_id>', methods=('GET', 'POST'))
 def edit(entry_id):
@@ -164,23 +199,31 @@ def edit(entry_id):
         time_str = request.form['time']
         new_timestamp = f"{date_str} {time_str}:00" 
 
-        conn.execute(
-            'UPDATE entries SET content = ?, project = ?, timestamp = ? WHERE id = ?',
-            (content, project, new_timestamp, entry_id)
-        )
-        # After updating, recalculate elapsed times starting from the new timestamp
-        recalculate_day_durations(conn, date_str)
-
-        conn.commit()
-        conn.close()
+        entry_project_id = project_id(conn, project) if project else None
+        if project and entry_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('calendar_bp.edit', entry_id=entry_id))
+
+        # The entry that used to follow this one has to be recomputed too, even if
+        # the edit moved this entry to another day
+        with transaction(conn):
+            old_next_id = next_entry_id(conn, entry_id)
+            conn.execute(
+                'UPDATE entries SET content = ?, project_id = ?, timestamp = ? WHERE id = ?',
+                (content, entry_project_id, new_timestamp, entry_id)
+            )
+            # After updating, recalculate elapsed times around the old and new position
+            entry_changed(conn, entry_id, old_next_id)
         
         # Redirect to the view for the new date
         return redirect(url_for('calendar_bp.view_day', date=date_str))
         
-    entry = conn.execute('SELECT * FROM entries WHERE id = ?', (entry_id,)).fetchone()
+    entry = conn.execute(
+        'SELECT e.*, p.name AS project FROM entries AS e LEFT JOIN projects AS p ON p.id = e.project_id WHERE e.id = ?',
+        (entry_id,)
+    ).fetchone()
 
     if entry is None:
-        conn.close()
         return "Entry not found.", 404
 
     # Split the full timestamp for the form inputs
@@ -192,8 +235,6 @@ def edit(entry_id):
     project_rows = conn.execute('SELECT name FROM projects WHERE is_active = 1 ORDER BY name ASC').fetchall()
     active_projects = [row['name'] for row in project_rows]
 
-    conn.close()
-    
     return render_template(
         'edit.html',
         entry=entry,
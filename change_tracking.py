@@ -0,0 +1,32 @@
+"""
+Version stamps for cached data, kept in the change_versions table by triggers
+(see migrations.py). A scope nobody has written to yet is at version 0.
+"""
+
+
+def scope_version(conn, scope):
+    row = conn.execute('SELECT version FROM change_versions WHERE scope = ?', (scope,)).fetchone()
+    return row[0] if row else 0
+
+
+def scope_versions(conn, scopes):
+    """{scope: (version, unix time of its last change)} for several scopes in one lookup."""
+    placeholders = ', '.join('?' * len(scopes))
+    rows = conn.execute(
+        f'SELECT scope, version, changed_at FROM change_versions WHERE scope IN ({placeholders})', list(scopes)
+    ).fetchall()
+    found = {row[0]: (row[1], row[2]) for row in rows}
+    return {scope: found.get(scope, (0, 0)) for scope in scopes}
+
+
+def month_scope(date_str):
+    # 'YYYY-MM-DD' (or 'YYYY-MM') -> 'month:YYYY-MM'
+    return f'month:{date_str[:7]}'
+
+
+def day_scope(date_str):
+    return f'day:{date_str[:10]}'
+
+
+def project_scope(project_id):
+    return f'project:{project_id or ""}'
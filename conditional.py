@@ -0,0 +1,85 @@
+"""
+Conditional GET for pages built from the database.
+
+A page lists the change scopes it is built from (see change_tracking.py); their
+versions, plus anything else the page depends on such as today's date, make up its
+ETag, and the time of the newest change its Last-Modified. When the browser already
+has that version the view answers 304 Not Modified after a single lookup in
+change_versions, without running its queries or rendering anything.
+
+    validators, not_modified = conditional.check(conn, [day_scope(date), 'projects'])
+    if not_modified:
+        return not_modified
+    ...
+    return conditional.finish(render_template(...), validators)
+"""
+import datetime
+import glob
+import hashlib
+import os
+
+from flask import make_response, request, session
+from werkzeug.http import is_resource_modified
+
+from change_tracking import scope_versions
+
+APP_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _code_version():
+    """
+    (token, newest modification time) of the app's code and templates. Pages cached by
+    the browser are invalidated when either changes, and every worker process serving
+    the same files agrees on it, so a 304 from one worker is valid for the others too.
+    """
+    paths = glob.glob(os.path.join(APP_ROOT, '*.py')) + glob.glob(os.path.join(APP_ROOT, 'templates', '*.html'))
+    stats = sorted((path, os.stat(path).st_mtime_ns) for path in paths)
+    token = hashlib.sha1(repr(stats).encode('utf-8')).hexdigest()
+    return token, max((mtime for _, mtime in stats), default=0) // 1_000_000_000
+
+
+CODE_TOKEN, CODE_MODIFIED = _code_version()
+
+def validators_for(conn, scopes, *extra):
+    """(etag, last modified unix time) for a page built from scopes; extra values go into the etag."""
+    versions = scope_versions(conn, scopes)
+    key = '|'.join([CODE_TOKEN, request.full_path,
+                    *(f'{scope}={versions[scope][0]}' for scope in scopes), *map(str, extra)])
+    etag = hashlib.sha1(key.encode('utf-8')).hexdigest()[:24]
+    last_modified = max([CODE_MODIFIED] + [changed_at for _, changed_at in versions.values()])
+    return etag, last_modified
+
+
+def check(conn, scopes, *extra):
+    """
+    Returns (validators, response). response is a ready 304 when the client's copy is
+    still current, otherwise None and the view renders as usual and hands its result
+    to finish().
+    """
+    validators = validators_for(conn, scopes, *extra)
+    if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+        # Messages waiting to be shown (base.html renders and clears them) make the page
+        # different from the cached copy
+        return validators, None
+
+    # Only the ETag can answer 304: Last-Modified has one-second resolution, so a page
+    # changed within the same second would look unmodified to If-Modified-Since alone
+    etag, _ = validators
+    if 'HTTP_IF_NONE_MATCH' not in request.environ or is_resource_modified(request.environ, etag=etag):
+        return validators, None
+    return validators, finish('', validators, status=304)
+
+
+def finish(body, validators, status=200):
+    """Response for body carrying the page's validators; browsers revalidate on every visit."""
+    etag, last_modified = validators
+    response = make_response(body, status)
+    response.set_etag(etag)
+    response.last_modified = _http_date(last_modified)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _http_date(unix_time):
+    return datetime.datetime.fromtimestamp(unix_time, datetime.timezone.utc)
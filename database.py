@@ -0,0 +1,180 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context
+
+DB_NAME = 'journal.db'
+
+# How many idle connections to keep per database file
+POOL_SIZE = 8
+
+# Applied once, when a connection is first opened. Pooled connections keep them.
+PRAGMAS = (
+    ('journal_mode', 'WAL'),      # readers never block the writer
+    ('synchronous', 'NORMAL'),    # safe with WAL, one fsync per checkpoint instead of per commit
+    ('busy_timeout', 5000),       # wait up to 5s for a lock instead of failing straight away
+    ('cache_size', -16000),       # negative means KiB, so ~16 MB of page cache
+    ('mmap_size', 268435456),     # 256 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+)
+
+# BEGIN IMMEDIATE is retried this many times if the write lock is still taken after
+# busy_timeout, waiting BUSY_RETRY_DELAY seconds (doubling each time) in between
+BUSY_RETRIES = 4
+BUSY_RETRY_DELAY = 0.1
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class Connection(sqlite3.Connection):
+    """sqlite3 connection that remembers which database file it belongs to."""
+    db_path = DB_NAME
+
+
+def database_path():
+    # Inside a request the app config wins, otherwise fall back to the default file
+    if has_app_context():
+        return current_app.config.get('DATABASE', DB_NAME)
+    return DB_NAME
+
+
+def connection_class():
+    # Apps can swap in a Connection subclass (see instrumentation.py)
+    if has_app_context():
+        return current_app.config.get('DATABASE_CONNECTION_CLASS', Connection)
+    return Connection
+
+
+def connect(db_path=None):
+    """Opens and configures a brand new connection. Prefer acquire()/get_db_connection()."""
+    db_path = db_path or database_path()
+    conn = sqlite3.connect(db_path, timeout=5, check_same_thread=False, factory=connection_class())
+    conn.db_path = db_path
+    conn.row_factory = sqlite3.Row
+    for name, value in PRAGMAS:
+        conn.execute(f'PRAGMA {name} = {value}')
+    return conn
+
+
+def _pool_for(db_path, factory):
+    # One pool per database file and connection class
+    with _pools_lock:
+        pool = _pools.get((db_path, factory))
+        if pool is None:
+            pool = _pools[(db_path, factory)] = queue.LifoQueue(maxsize=POOL_SIZE)
+        return pool
+
+
+def acquire(db_path=None):
+    # Hand out an idle pooled connection, or open a new one if the pool is empty
+    db_path = db_path or database_path()
+    try:
+        return _pool_for(db_path, connection_class()).get_nowait()
+    except queue.Empty:
+        return connect(db_path)
+
+
+def release(conn):
+    # Never hand a half-finished transaction to the next user
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _pool_for(conn.db_path, type(conn)).put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def close_pool():
+    """Closes every idle pooled connection (used on shutdown and by scripts)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def get_db_connection():
+    """
+    Returns the connection for the current request. The same connection is shared by
+    everything that runs during the request and goes back to the pool on teardown,
+    so callers must NOT close it.
+    Outside of a request a pooled connection is handed out and the caller owns it;
+    use db_connection() there so it is given back.
+    """
+    if not has_app_context():
+        return acquire()
+    if 'db' not in g:
+        g.db = acquire()
+    return g.db
+
+
+@contextmanager
+def db_connection():
+    # Reuse the request connection when there is one, otherwise borrow from the pool
+    if has_app_context():
+        yield get_db_connection()
+        return
+
+    conn = acquire()
+    try:
+        yield conn
+    finally:
+        release(conn)
+
+
+def is_busy(error):
+    # SQLITE_BUSY and its extended codes (e.g. SQLITE_BUSY_SNAPSHOT)
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff == sqlite3.SQLITE_BUSY
+    return 'database is locked' in str(error)
+
+
+@contextmanager
+def transaction(conn):
+    """
+    Runs the block as one write transaction, committed at the end and rolled back if
+    it raises. BEGIN IMMEDIATE takes the write lock before the block runs, so reads in
+    it see the data it is about to change, and a writer busy in another thread or
+    process makes it wait (and retry) up front instead of failing halfway through.
+    Inside a transaction that is already open, the block just joins it.
+
+        with transaction(conn):
+            conn.execute('INSERT ...')
+    """
+    if conn.in_transaction:
+        yield conn
+        return
+
+    for attempt in range(BUSY_RETRIES + 1):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            break
+        except sqlite3.OperationalError as e:
+            if not is_busy(e) or attempt == BUSY_RETRIES:
+                raise
+            time.sleep(BUSY_RETRY_DELAY * 2 ** attempt)
+
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def release_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db)
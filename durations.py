@@ -0,0 +1,92 @@
+"""
+Elapsed-time bookkeeping for journal entries.
+
+An entry's duration_minutes is the time since the entry before it on the same day,
+in whole minutes, and NULL for the first entry of a day. Entries are ordered by
+(timestamp, id) so two entries logged in the same second still have a stable order.
+
+A write only ever changes the durations of the entry itself and of the entry right
+after it (at its old and its new position), so the single-entry helpers touch those
+rows and nothing else. recalculate_range() is the bulk path for imports and repairs.
+
+None of these functions commit: call them inside the same transaction as the write
+so the entry and its neighbours' durations land together.
+"""
+
+# Epoch of the entry just before `entries` on the same day (correlated subquery)
+_PREVIOUS_EPOCH = '''
+    SELECT prev.entry_epoch FROM entries AS prev
+    WHERE prev.entry_date = entries.entry_date
+      AND (prev.timestamp, prev.id) < (entries.timestamp, entries.id)
+    ORDER BY prev.timestamp DESC, prev.id DESC
+    LIMIT 1
+'''
+
+
+def next_entry_id(conn, entry_id):
+    """Returns the id of the entry that follows entry_id on its day, or None."""
+    row = conn.execute('''
+        SELECT nxt.id FROM entries AS cur
+        JOIN entries AS nxt
+          ON nxt.entry_date = cur.entry_date
+         AND (nxt.timestamp, nxt.id) > (cur.timestamp, cur.id)
+        WHERE cur.id = ?
+        ORDER BY nxt.timestamp ASC, nxt.id ASC
+        LIMIT 1
+    ''', (entry_id,)).fetchone()
+    return row[0] if row else None
+
+
+def refresh_durations(conn, entry_ids):
+    # Recompute duration_minutes for just these entries from their current predecessor
+    ids = sorted({entry_id for entry_id in entry_ids if entry_id is not None})
+    if not ids:
+        return
+    placeholders = ', '.join('?' * len(ids))
+    conn.execute(
+        f'UPDATE entries SET duration_minutes = (entry_epoch - ({_PREVIOUS_EPOCH})) / 60 '
+        f'WHERE id IN ({placeholders})',
+        ids
+    )
+
+
+def entry_inserted(conn, entry_id):
+    # The new entry gets a duration, and the entry after it now measures from the new one
+    refresh_durations(conn, [entry_id, next_entry_id(conn, entry_id)])
+
+
+def entry_changed(conn, entry_id, old_next_id):
+    """
+    Call after an entry's timestamp was edited, including moves to another day.
+    old_next_id is next_entry_id() captured BEFORE the update: that entry used to
+    measure from the edited one and has to be recomputed against its new predecessor.
+    """
+    refresh_durations(conn, [entry_id, old_next_id, next_entry_id(conn, entry_id)])
+
+
+def entry_deleted(conn, old_next_id):
+    # old_next_id is next_entry_id() captured before the delete
+    refresh_durations(conn, [old_next_id])
+
+
+def recalculate_range(conn, start_date, end_date):
+    """
+    Recomputes every duration for entries dated start_date..end_date (inclusive,
+    YYYY-MM-DD) in one set-based statement. Rows that are already correct are left
+    untouched so they don't churn the WAL.
+    """
+    conn.execute('''
+        WITH computed AS (
+            SELECT id,
+                   (entry_epoch - LAG(entry_epoch) OVER (
+                        PARTITION BY entry_date ORDER BY timestamp, id
+                   )) / 60 AS minutes
+            FROM entries
+            WHERE entry_date BETWEEN ? AND ?
+        )
+        UPDATE entries
+        SET duration_minutes = computed.minutes
+        FROM computed
+        WHERE entries.id = computed.id
+          AND entries.duration_minutes IS NOT computed.minutes
+    ''', (start_date, end_date))
@@ -1,18 +1,183 @@
-from flask import Blueprint, render_template, send_file, request, redirect, url_for, flash, render_template
+from flask import Blueprint, render_template, request, redirect, url_for, flash, Response, stream_with_context
 import datetime
 import io
+import os
 import csv
-import zipfile
-import datetime
+import shutil
 import sqlite3
+import tempfile
+import zipfile
+import click
+from database import get_db_connection, db_connection
+
+# cli_group=None puts the blueprint's commands at the top level: `flask snapshot ...`
+export_data_bp = Blueprint('export_data_bp', __name__, cli_group=None)
+
+# Rows pulled from a cursor (and written to the zip) at a time
+EXPORT_BATCH_SIZE = 500
+
+
+class ZipStream(io.RawIOBase):
+    """
+    Write-only, unseekable sink for zipfile. zipfile falls back to streaming mode
+    (sizes in data descriptors after each member) when it can't seek, so whatever it
+    has written so far can be handed to the client and forgotten.
+    """
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def export_csv_members(start_date_str, end_date_inclusive):
+    # (file name in the zip, header row, query, params) for each CSV in the export
+    return [
+        # CSV 1: ENTRIES
+        ('journal_entries.csv',
+         ['Timestamp', 'Project', 'Content'],
+         'SELECT e.timestamp, p.name, e.content, e.duration_minutes FROM entries AS e LEFT JOIN projects AS p ON p.id = e.project_id '
+         'WHERE e.timestamp >= ? AND e.timestamp < ? ORDER BY e.timestamp',
+         (start_date_str, end_date_inclusive)),
+        # CSV 2: FINISHED TODOS (Using finished_date)
+        ('finished_todos.csv',
+         ['Finished Date', 'Project', 'Task', 'Started', 'Due', 'Priority'],
+         "SELECT t.finished_date, p.name, t.item, t.start_date, t.due_date, t.priority, t.status FROM todos AS t "
+         "LEFT JOIN projects AS p ON p.id = t.project_id "
+         "WHERE t.finished_date >= ? AND t.finished_date < ? AND t.status = 'finished' ORDER BY t.finished_date",
+         (start_date_str, end_date_inclusive)),
+        # CSV 3: PROJECTS
+        ('projects.csv',
+         ['Project', 'Charge #', 'Status', 'Is Active'],
+         'SELECT name, charging_code, status, is_active FROM projects',
+         ()),
+    ]
+
+
+def stream_export_zip(conn, members):
+    """
+    Yields the export zip in chunks as it is built. Each CSV is written straight from
+    its cursor EXPORT_BATCH_SIZE rows at a time, so memory stays flat however long the
+    date range is, and the first bytes go out before the last query has run.
+    """
+    sink = ZipStream()
+    # One read transaction for the whole export, so all files come from the same snapshot
+    conn.execute('BEGIN')
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name, header, query, params in members:
+                with io.TextIOWrapper(zf.open(name, 'w'), encoding='utf-8', newline='') as csv_file:
+                    writer = csv.writer(csv_file)
+                    writer.writerow(header)
+                    cursor = conn.execute(query, params)
+                    while True:
+                        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+                        if not rows:
+                            break
+                        writer.writerows(rows)
+                        csv_file.flush()
+                        chunk = sink.drain()
+                        if chunk:
+                            yield chunk
+        # Central directory
+        yield sink.drain()
+    finally:
+        conn.rollback()
 
-export_data_bp = Blueprint('export_data_bp', __name__)
 
-# Helper function to get database connection (copied from app.py)
-def get_db_connection():
-    conn = sqlite3.connect('journal.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+def write_snapshot(conn, dest_path, start_date=None, end_date=None):
+    """
+    Writes a compact, self-contained copy of the journal to dest_path.
+
+    VACUUM INTO copies the database inside a single read transaction, so the copy is
+    consistent even while entries are being written, and in WAL mode it never blocks
+    the app's writers. With a date range, entries outside it and todos finished
+    outside it are then removed from the copy (open todos, projects and recurring
+    todos are kept) and the copy is compacted again.
+    """
+    conn.execute('VACUUM INTO ?', (dest_path,))
+
+    snapshot = sqlite3.connect(dest_path)
+    try:
+        if start_date or end_date:
+            start_date = start_date or '0000-00-00'
+            end_date = end_date or '9999-99-99'
+            # The triggers keep daily_totals and friends in step with the deletes
+            snapshot.execute('DELETE FROM entries WHERE entry_date < ? OR entry_date > ?',
+                             (start_date, end_date))
+            snapshot.execute('DELETE FROM todos WHERE finished_date < ? OR finished_date > ?',
+                             (start_date, end_date))
+            snapshot.commit()
+            snapshot.execute('VACUUM')
+        # A single file, no -wal/-shm companions to forget when copying it around
+        snapshot.execute('PRAGMA journal_mode = DELETE')
+    finally:
+        snapshot.close()
+
+
+def stream_file_zip(path, arcname, cleanup_dir=None):
+    # Yields a zip containing one file, compressing it in chunks; removes cleanup_dir when done
+    sink = ZipStream()
+    try:
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+            with open(path, 'rb') as source, zf.open(arcname, 'w', force_zip64=True) as member:
+                while True:
+                    block = source.read(1024 * 1024)
+                    if not block:
+                        break
+                    member.write(block)
+                    chunk = sink.drain()
+                    if chunk:
+                        yield chunk
+        yield sink.drain()
+    finally:
+        if cleanup_dir:
+            shutil.rmtree(cleanup_dir, ignore_errors=True)
+
+
+@export_data_bp.route('/export/snapshot', methods=['POST'])
+def export_snapshot():
+    start_date_str = request.form.get('start_date') or None
+    end_date_str = request.form.get('end_date') or None
+
+    temp_dir = tempfile.mkdtemp(prefix='project_echo_snapshot_')
+    snapshot_path = os.path.join(temp_dir, 'journal.db')
+    try:
+        write_snapshot(get_db_connection(), snapshot_path, start_date_str, end_date_str)
+    except Exception:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise
+
+    # The copy is complete, so the response doesn't need the request context any more
+    suffix = f'_{start_date_str or "start"}_to_{end_date_str or "now"}' if (start_date_str or end_date_str) else ''
+    filename = f'project_echo_snapshot{suffix}.zip'
+    return Response(stream_file_zip(snapshot_path, 'journal.db', cleanup_dir=temp_dir),
+                    mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@export_data_bp.cli.command('snapshot')
+@click.argument('dest_path')
+@click.option('--start', 'start_date', help='Only keep entries on or after this date (YYYY-MM-DD).')
+@click.option('--end', 'end_date', help='Only keep entries on or before this date (YYYY-MM-DD).')
+def snapshot_command(dest_path, start_date, end_date):
+    """Write a consistent copy of the journal database to DEST_PATH."""
+    if os.path.exists(dest_path):
+        raise click.ClickException(f'{dest_path} already exists.')
+    with db_connection() as conn:
+        write_snapshot(conn, dest_path, start_date, end_date)
+    click.echo(f'Snapshot written to {dest_path}')
+
 
 @export_data_bp.route('/export', methods=['GET', 'POST'])
 def export_data():
@@ -22,73 +187,20 @@ def export_data():
 
         if not start_date_str or not end_date_str:
             flash("Please select both a start and an end date.", 'error')
-            return redirect(url_for('export_data'))
+            return redirect(url_for('export_data_bp.export_data'))
 
         # Ensure end date is inclusive by adding one day to the filter range
         end_date_inclusive = (datetime.datetime.strptime(end_date_str, '%Y-%m-%d') + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        
+
         conn = get_db_connection()
+        members = export_csv_members(start_date_str, end_date_inclusive)
 
-        # Fetch Entries
-        entries = conn.execute(
-            'SELECT timestamp, project, content, duration_minutes FROM entries WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp',
-            (start_date_str, end_date_inclusive)
-        ).fetchall()
-
-        # Fetch Finished Todos (Using finished_date)
-        finished_todos = conn.execute(
-            'SELECT finished_date, project, item, start_date, due_date, priority, status FROM todos WHERE finished_date >= ? AND finished_date < ? AND status = "finished" ORDER BY finished_date',
-            (start_date_str, end_date_inclusive)
-        ).fetchall()
-
-        # Fetch Projects
-        projects = conn.execute(
-            'SELECT name, charging_code, status, is_active FROM projects'
-        ).fetchall()
-        
-        conn.close()
-
-        # Create an in-memory zip file
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
-
-            # CSV 1: ENTRIES 
-            entries_output = io.StringIO()
-            writer = csv.writer(entries_output)
-            writer.writerow(['Timestamp', 'Project', 'Content']) # Header
-            for row in entries:
-                writer.writerow(tuple(row))
-            
-            # Write the CSV file to the zip archive
-            zf.writestr('journal_entries.csv', entries_output.getvalue())
-
-            # CSV 2: FINISHED TODOS
-            todos_output = io.StringIO()
-            writer = csv.writer(todos_output)
-            writer.writerow(['Finished Date', 'Project', 'Task', 'Started', 'Due', 'Priority']) # Header
-            for row in finished_todos:
-                writer.writerow(tuple(row))
-            
-            # Write the CSV file to the zip archive
-            zf.writestr('finished_todos.csv', todos_output.getvalue())
-
-            projects_output = io.StringIO()
-            writer = csv.writer(projects_output)
-            writer.writerow(['Project', 'Charge #', 'Status', 'Is Active']) #Header
-            for row in projects:
-                writer.writerow(tuple(row))
-            
-            # Write the CSV file to the zip archive
-            zf.writestr('projects.csv', projects_output.getvalue())
-
-        zip_buffer.seek(0)
-        
-        # Send the zipped file back to the user
+        # Stream the zipped file back to the user while it is being built.
+        # stream_with_context keeps the request (and its connection) alive until the last chunk.
         filename = f'project_echo_export_{start_date_str}_to_{end_date_str}.zip'
-        return send_file(zip_buffer, 
-                         mimetype='application/zip', 
-                         as_attachment=True, 
-                         download_name=filename)
-    
+        return Response(stream_with_context(stream_export_zip(conn, members)),
+                        mimetype='application/zip',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
     # Render the date selection form for GET requests
     return render_template('export.html')
@@ -0,0 +1,73 @@
+from functools import lru_cache
+from markupsafe import Markup, escape
+
+# Entries longer than this are formatted every time instead of being kept in the cache
+MAX_CACHED_LENGTH = 16 * 1024
+
+_LIST_OPEN = {'ul': '<ul class="entry-list">', 'ol': '<ol class="entry-list">'}
+_LIST_CLOSE = {'ul': '</ul>', 'ol': '</ol>'}
+
+
+# Jinja Filter for Entry Formatting
+def format_entry_content(content):
+    # Converts newline characters to <br>, and handles simple markdown for lists.
+    if not content:
+        return ""
+    if len(content) > MAX_CACHED_LENGTH:
+        return _format(content)
+    return _format_cached(content)
+
+
+@lru_cache(maxsize=4096)
+def _format_cached(content):
+    return _format(content)
+
+
+def _format(content):
+    # Escaping never adds or removes whitespace or newlines, so escaping the whole entry
+    # once gives the same lines as escaping each line separately, for a fraction of the work.
+    lines = str(escape(content)).split('\n')
+    html_lines = []
+    append = html_lines.append
+
+    open_list = None  # 'ul' or 'ol' while inside a list
+
+    for line in lines:
+        stripped_line = line.strip()
+
+        # Unordered List (*) or Ordered List (#)
+        if stripped_line.startswith('* '):
+            list_type = 'ul'
+        elif stripped_line.startswith('# '):
+            list_type = 'ol'
+        else:
+            list_type = None
+
+        if list_type is not None:
+            if open_list != list_type:
+                # The new list is opened before the old one is closed; pages already
+                # rely on that exact markup, so keep it.
+                append(_LIST_OPEN[list_type])
+                if open_list is not None:
+                    append(_LIST_CLOSE[open_list])
+                open_list = list_type
+            append('<li>' + stripped_line[2:].strip() + '</li>')
+            continue
+
+        # Regular Text (Newlines and Paragraphs): close any open list first
+        if open_list is not None:
+            append(_LIST_CLOSE[open_list])
+            open_list = None
+
+        if stripped_line:
+            append(line + '<br>')
+        else:
+            # Add an extra <br> for an empty line (paragraph break)
+            append('<br>')
+
+    # Close any list that might still be open at the end of the entry
+    if open_list is not None:
+        append(_LIST_CLOSE[open_list])
+
+    # Join lines and return, ensuring we use Markup to tell Jinja it's safe HTML
+    return Markup(''.join(html_lines).strip('<br>'))
@@ -0,0 +1,343 @@
+"""
+Bulk import of entries, todos and projects, the other half of export_data.py.
+
+Accepts the export zip (or any one of its CSV files) and NDJSON: one JSON object per
+line, with "type" set to "entry", "todo" or "project" and the same fields as the
+matching table, e.g.
+
+    {"type": "entry", "timestamp": "2024-03-01 09:15:00", "project": "Echo", "content": "..."}
+
+The file is read as a stream and written IMPORT_BATCH_SIZE rows at a time with
+executemany, one transaction per batch, so memory stays flat however big the history.
+Project names are checked against the projects table (loaded once into a set); rows
+for unknown projects are reported and skipped, unless create_projects is set, in which
+case the project is created as inactive. Rows that are already in the journal (same
+entry timestamp and text, or same todo) are skipped, so re-importing a file is harmless.
+Durations of entries on days the journal has no entries for yet are worked out while
+reading; days that already had entries are recomputed in the transaction of each
+batch that adds to them.
+
+    PYTHONPATH=. flask --app app import-data export.zip [--create-projects]
+"""
+import calendar
+import csv
+import datetime
+import io
+import json
+import os
+import zipfile
+
+import click
+from flask import Blueprint, render_template, request
+
+from database import db_connection, get_db_connection, transaction
+from durations import recalculate_range
+from markdown_cache import todo_html_columns
+from projects import PROJECT_ID_SQL
+
+import_data_bp = Blueprint('import_data_bp', __name__, cli_group=None)
+
+IMPORT_BATCH_SIZE = 5000
+# Errors listed individually in the result; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+
+# 'active' is what the daily recurrence check gives the todos it creates
+TODO_STATUSES = ('backlog', 'holding', 'started', 'finished', 'active')
+TODO_PRIORITIES = ('low', 'medium', 'high')
+
+# Export zip members, in the order they are imported (projects before what uses them)
+ZIP_MEMBERS = ('projects.csv', 'journal_entries.csv', 'finished_todos.csv')
+
+# First header cell of each export CSV -> record type
+CSV_TYPES = {'Timestamp': 'entry', 'Finished Date': 'todo', 'Project': 'project'}
+
+
+class ImportResult:
+    def __init__(self):
+        self.added = {'entry': 0, 'todo': 0, 'project': 0}
+        self.duplicates = 0
+        self.error_count = 0
+        self.errors = []
+        # Days whose durations had to be recomputed rather than worked out on the way in
+        self.days = set()
+
+    def error(self, where, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f'{where}: {message}')
+
+    def summary(self):
+        return (f"Imported {self.added['entry']} entries, {self.added['todo']} todos and "
+                f"{self.added['project']} projects; {self.duplicates} already present, {self.error_count} rejected.")
+
+
+# --- Reading ---
+
+def csv_records(text_file, name):
+    """Yields (type, fields, where) for each row of one export CSV."""
+    reader = csv.reader(text_file)
+    header = next(reader, None)
+    record_type = CSV_TYPES.get(header[0].strip()) if header else None
+    if record_type is None:
+        raise ValueError(f'{name}: not one of the export CSV files')
+
+    for line, row in enumerate(reader, start=2):
+        if not any(row):
+            continue
+        # Export rows can carry extra columns after the ones in the header
+        row = row + [''] * (7 - len(row))
+        if record_type == 'entry':
+            fields = {'timestamp': row[0], 'project': row[1], 'content': row[2]}
+        elif record_type == 'todo':
+            fields = {'finished_date': row[0], 'project': row[1], 'item': row[2], 'start_date': row[3],
+                      'due_date': row[4], 'priority': row[5], 'status': row[6] or 'finished'}
+        else:
+            fields = {'name': row[0], 'charging_code': row[1], 'status': row[2], 'is_active': row[3]}
+        yield record_type, fields, f'{name} line {line}'
+
+
+def ndjson_records(text_file, name):
+    for line, text in enumerate(text_file, start=1):
+        if not text.strip():
+            continue
+        try:
+            fields = json.loads(text)
+        except ValueError as e:
+            yield 'error', f'invalid JSON ({e})', f'{name} line {line}'
+            continue
+        record_type = fields.pop('type', None) if isinstance(fields, dict) else None
+        yield record_type, fields, f'{name} line {line}'
+
+
+def file_records(stream, filename):
+    """Yields (type, fields, where) from a binary stream, by file type: .zip, .csv or .ndjson/.jsonl."""
+    extension = os.path.splitext(filename.lower())[1]
+    if extension == '.zip':
+        with zipfile.ZipFile(stream) as archive:
+            names = [name for name in ZIP_MEMBERS if name in archive.namelist()]
+            if not names:
+                raise ValueError(f'{filename} has none of {", ".join(ZIP_MEMBERS)}')
+            for name in names:
+                with archive.open(name) as member:
+                    yield from csv_records(io.TextIOWrapper(member, encoding='utf-8-sig', newline=''), name)
+    elif extension == '.csv':
+        yield from csv_records(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''), filename)
+    elif extension in ('.ndjson', '.jsonl'):
+        yield from ndjson_records(io.TextIOWrapper(stream, encoding='utf-8-sig'), filename)
+    else:
+        raise ValueError(f'{filename}: expected a .zip, .csv or .ndjson file')
+
+
+# --- Checking ---
+
+def _text(fields, key, required=False):
+    value = fields.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f'{key} is required')
+    return value or None
+
+
+def _date(fields, key):
+    value = _text(fields, key)
+    return datetime.date.fromisoformat(value).isoformat() if value else None
+
+
+def _choice(fields, key, choices, default):
+    value = (_text(fields, key) or default).lower()
+    if value not in choices:
+        raise ValueError(f'{key} must be one of {", ".join(choices)}')
+    return value
+
+
+def check_entry(fields):
+    timestamp = datetime.datetime.fromisoformat(_text(fields, 'timestamp', required=True))
+    return (timestamp.strftime('%Y-%m-%d %H:%M:%S'), _text(fields, 'content', required=True), _text(fields, 'project'))
+
+
+def check_todo(fields):
+    finished_date = _date(fields, 'finished_date')
+    status = _choice(fields, 'status', TODO_STATUSES, 'finished' if finished_date else 'backlog')
+    return (_text(fields, 'project', required=True), _text(fields, 'item', required=True),
+            _date(fields, 'start_date'), _date(fields, 'due_date'), finished_date,
+            _choice(fields, 'priority', TODO_PRIORITIES, 'low'), status)
+
+
+def check_project(fields):
+    is_active = str(fields.get('is_active', 1)).strip().lower() not in ('0', 'false', 'no', '')
+    return (_text(fields, 'name', required=True), _text(fields, 'charging_code') or '',
+            _text(fields, 'status') or ('active' if is_active else 'unactive'), int(is_active))
+
+
+CHECKS = {'entry': check_entry, 'todo': check_todo, 'project': check_project}
+
+
+# --- Writing ---
+
+class Importer:
+    def __init__(self, conn, create_projects=False):
+        self.conn = conn
+        self.create_projects = create_projects
+        self.result = ImportResult()
+        self.projects = {row[0] for row in conn.execute('SELECT name FROM projects')}
+        # Days that already have entries; imported entries on other days get their
+        # durations worked out here, as long as each day's entries arrive in time order
+        self.existing_days = {row[0] for row in conn.execute('SELECT DISTINCT day FROM daily_totals')}
+        self.last_entry = {}
+        # Days in self.result.days that the pending batch adds entries to
+        self.stale_days = set()
+        self._todo_keys = None
+        self.pending = {'entry': [], 'todo': [], 'project': []}
+
+    def add(self, record_type, fields, where):
+        if record_type == 'error':
+            self.result.error(where, fields)
+            return
+        check = CHECKS.get(record_type)
+        if check is None:
+            self.result.error(where, f'unknown record type {record_type!r}')
+            return
+        try:
+            values = check(fields)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.result.error(where, str(e))
+            return
+
+        if record_type == 'project':
+            if values[0] not in self.projects:
+                self.projects.add(values[0])
+                self.pending['project'].append(values)
+            return
+
+        project = values[2] if record_type == 'entry' else values[0]
+        if project is not None and project not in self.projects:
+            if not self.create_projects:
+                self.result.error(where, f'unknown project "{project}"')
+                return
+            self.projects.add(project)
+            self.pending['project'].append((project, '', 'unactive', 0))
+
+        if record_type == 'entry':
+            values += (self._duration(values[0]),)
+        self.pending[record_type].append(values)
+        if len(self.pending['entry']) + len(self.pending['todo']) >= IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def _duration(self, timestamp):
+        # duration_minutes for an entry on a new day, or None and the day is recomputed with its batch
+        day = timestamp[:10]
+        if day in self.result.days:
+            self.stale_days.add(day)
+            return None
+        last = self.last_entry.get(day)
+        if day in self.existing_days or (last is not None and timestamp < last[0]):
+            self.result.days.add(day)
+            self.stale_days.add(day)
+            return None
+        # Same as entry_epoch: the timestamp read as UTC
+        epoch = calendar.timegm(datetime.datetime.fromisoformat(timestamp).timetuple())
+        self.last_entry[day] = (timestamp, epoch)
+        return None if last is None else (epoch - last[1]) // 60
+
+    def _new_todos(self, rows):
+        # Todos have no natural key, so existing ones are looked up in memory (loaded on first use)
+        if self._todo_keys is None:
+            self._todo_keys = {tuple(row) for row in self.conn.execute(
+                'SELECT p.name, t.item, t.finished_date FROM todos AS t LEFT JOIN projects AS p ON p.id = t.project_id'
+            )}
+        new = []
+        for row in rows:
+            key = (row[0], row[1], row[4])
+            if key not in self._todo_keys:
+                self._todo_keys.add(key)
+                new.append(row + todo_html_columns(row[1]))
+        return new
+
+    def flush(self):
+        entries, todos, projects = self.pending['entry'], self.pending['todo'], self.pending['project']
+        if not (entries or todos or projects):
+            return
+        todos = self._new_todos(todos)
+        with transaction(self.conn):
+            if projects:
+                self.result.added['project'] += self.conn.executemany(
+                    'INSERT INTO projects (name, charging_code, status, is_active) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT(name) DO NOTHING', projects
+                ).rowcount
+            if entries:
+                added = self.conn.executemany(
+                    'INSERT INTO entries (timestamp, content, project_id, duration_minutes) '
+                    'SELECT ?1, ?2, (SELECT id FROM projects WHERE name = ?3), ?4 '
+                    'WHERE NOT EXISTS (SELECT 1 FROM entries WHERE timestamp = ?1 AND content = ?2)', entries
+                ).rowcount
+                self.result.added['entry'] += added
+                self.result.duplicates += len(entries) - added
+            if todos:
+                self.conn.executemany(
+                    'INSERT INTO todos (project_id, item, start_date, due_date, finished_date, priority, status, item_html, item_hash) '
+                    f'VALUES ({PROJECT_ID_SQL}, ?, ?, ?, ?, ?, ?, ?, ?)', todos
+                )
+            self.result.added['todo'] += len(todos)
+            self.result.duplicates += len(self.pending['todo']) - len(todos)
+            # In the batch's own transaction, so a later batch failing can't leave these days wrong
+            for start, end in day_ranges(self.stale_days):
+                recalculate_range(self.conn, start, end)
+        self.pending = {'entry': [], 'todo': [], 'project': []}
+        self.stale_days = set()
+
+    def finish(self):
+        self.flush()
+        return self.result
+
+
+def day_ranges(days):
+    """Sorted YYYY-MM-DD days -> [(start, end), ...] runs of consecutive days."""
+    ranges = []
+    for day in sorted(days):
+        current = datetime.date.fromisoformat(day)
+        if ranges and current - ranges[-1][1] == datetime.timedelta(days=1):
+            ranges[-1][1] = current
+        else:
+            ranges.append([current, current])
+    return [(start.isoformat(), end.isoformat()) for start, end in ranges]
+
+
+def import_file(conn, stream, filename, create_projects=False):
+    """Imports one file (binary stream) and returns its ImportResult. Raises ValueError for unreadable files."""
+    importer = Importer(conn, create_projects)
+    try:
+        for record_type, fields, where in file_records(stream, filename):
+            importer.add(record_type, fields, where)
+    except (csv.Error, UnicodeDecodeError, zipfile.BadZipFile) as e:
+        raise ValueError(f'{filename}: {e}') from e
+    return importer.finish()
+
+
+@import_data_bp.route('/import', methods=['POST'])
+def import_data():
+    # The outcome is shown on the export page, under the import form
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return render_template('export.html', import_error='Please choose a file to import.'), 400
+
+    try:
+        result = import_file(get_db_connection(), upload.stream, upload.filename,
+                             create_projects='create_projects' in request.form)
+    except ValueError as e:
+        return render_template('export.html', import_error=str(e)), 400
+    return render_template('export.html', import_result=result)
+
+
+@import_data_bp.cli.command('import-data')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--create-projects', is_flag=True, help='Create unknown projects (as inactive) instead of skipping their rows.')
+def import_data_command(path, create_projects):
+    """Import entries, todos and projects from an export .zip/.csv or an .ndjson file."""
+    with db_connection() as conn, open(path, 'rb') as stream:
+        try:
+            result = import_file(conn, stream, os.path.basename(path), create_projects)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    click.echo(result.summary())
+    for message in result.errors:
+        click.echo(f'  {message}')
@@ -0,0 +1,265 @@
+"""
+Opt-in SQL instrumentation: set SQL_INSTRUMENTATION = True in the app config (or the
+PROJECT_ECHO_SQL_INSTRUMENTATION environment variable) before calling init_app().
+
+While it is on, the app's connections time every statement, including the time spent
+fetching its rows, and count the rows. For each request this gives:
+
+* a Server-Timing header (visible in the browser's network tab) with the number of
+  queries and the time spent in SQL;
+* per-route counters and latency percentiles, served as JSON at /metrics along with
+  the statements that took the most time overall;
+* a slow-query log entry, with the statement's EXPLAIN QUERY PLAN, for every statement
+  slower than SLOW_QUERY_MS (default 100);
+* a warning when one request runs the same statement many times (an N+1 pattern).
+
+Everything is kept in memory and resets when the process restarts.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import g, has_request_context, jsonify, request
+
+import database
+
+DEFAULT_SLOW_QUERY_MS = 100
+# Same statement this many times in one request gets an N+1 warning
+REPEATED_QUERY_WARNING = 20
+# Request timings kept per route for the percentiles
+ROUTE_SAMPLE_SIZE = 1000
+# Distinct statements tracked for /metrics
+STATEMENT_STATS_SIZE = 500
+
+slow_query_log = logging.getLogger('project_echo.slow_sql')
+log = logging.getLogger('project_echo.sql')
+
+
+class QueryRecord:
+    __slots__ = ('sql', 'parameters', 'seconds', 'rows')
+
+    def __init__(self, sql, parameters):
+        self.sql = sql
+        self.parameters = parameters
+        self.seconds = 0.0
+        self.rows = 0
+
+
+def _current_records():
+    # Statements are only recorded for requests
+    if has_request_context():
+        return g.setdefault('sql_queries', [])
+    return None
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that adds the time spent in execute and fetch calls to its QueryRecord."""
+    _record = None
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._record is not None:
+                self._record.seconds += time.perf_counter() - start
+
+    def _begin(self, sql, parameters):
+        records = _current_records()
+        if records is None:
+            self._record = None
+        else:
+            self._record = QueryRecord(sql, parameters)
+            records.append(self._record)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        cursor = self._timed(super().execute, sql, parameters)
+        if self._record is not None and self.rowcount > 0:
+            self._record.rows += self.rowcount
+        return cursor
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, None)
+        cursor = self._timed(super().executemany, sql, seq_of_parameters)
+        if self._record is not None and self.rowcount > 0:
+            self._record.rows += self.rowcount
+        return cursor
+
+    def _count(self, rows):
+        if self._record is not None:
+            self._record.rows += rows
+        return rows
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        self._count(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._count(len(rows))
+        return rows
+
+    def __next__(self):
+        row = self._timed(super().__next__)
+        self._count(1)
+        return row
+
+
+class InstrumentedConnection(database.Connection):
+    # sqlite3.Connection.execute doesn't go through cursor(), so route it there
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Metrics:
+    """Per-route and per-statement counters, shared by every thread of the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.routes = defaultdict(lambda: {
+            'requests': 0, 'queries': 0, 'max_queries': 0, 'slow_queries': 0,
+            'sql_seconds': 0.0, 'timings': deque(maxlen=ROUTE_SAMPLE_SIZE),
+        })
+        self.statements = {}
+        self.started_at = time.time()
+
+    def add_request(self, route, seconds, records, slow_count):
+        with self._lock:
+            stats = self.routes[route]
+            stats['requests'] += 1
+            stats['queries'] += len(records)
+            stats['max_queries'] = max(stats['max_queries'], len(records))
+            stats['slow_queries'] += slow_count
+            stats['sql_seconds'] += sum(record.seconds for record in records)
+            stats['timings'].append(seconds)
+
+            for record in records:
+                statement = self.statements.get(record.sql)
+                if statement is None:
+                    if len(self.statements) >= STATEMENT_STATS_SIZE:
+                        continue
+                    statement = self.statements[record.sql] = {'calls': 0, 'seconds': 0.0, 'rows': 0, 'max_seconds': 0.0}
+                statement['calls'] += 1
+                statement['seconds'] += record.seconds
+                statement['rows'] += record.rows
+                statement['max_seconds'] = max(statement['max_seconds'], record.seconds)
+
+    def snapshot(self, top=20):
+        with self._lock:
+            routes = {}
+            for route, stats in self.routes.items():
+                timings = sorted(stats['timings'])
+                requests = stats['requests']
+                routes[route] = {
+                    'requests': requests,
+                    'p50_ms': round(percentile(timings, 0.50) * 1000, 2),
+                    'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+                    'p99_ms': round(percentile(timings, 0.99) * 1000, 2),
+                    'max_ms': round(timings[-1] * 1000, 2),
+                    'avg_queries': round(stats['queries'] / requests, 2),
+                    'max_queries': stats['max_queries'],
+                    'avg_sql_ms': round(stats['sql_seconds'] / requests * 1000, 2),
+                    'slow_queries': stats['slow_queries'],
+                }
+            statements = sorted(self.statements.items(), key=lambda item: item[1]['seconds'], reverse=True)[:top]
+            return {
+                'since': self.started_at,
+                'routes': routes,
+                'top_statements': [{
+                    'sql': ' '.join(sql.split()),
+                    'calls': stats['calls'],
+                    'total_ms': round(stats['seconds'] * 1000, 2),
+                    'max_ms': round(stats['max_seconds'] * 1000, 2),
+                    'rows': stats['rows'],
+                } for sql, stats in statements],
+            }
+
+
+def explain(conn, record):
+    """EXPLAIN QUERY PLAN lines for a recorded statement, or the reason there aren't any."""
+    if record.parameters is None:
+        return ['(executemany: no plan)']
+    try:
+        rows = sqlite3.Connection.execute(conn, f'EXPLAIN QUERY PLAN {record.sql}', record.parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f'(no plan: {e})']
+    return [row[3] for row in rows]
+
+
+def init_app(app):
+    enabled = app.config.get('SQL_INSTRUMENTATION',
+                             os.environ.get('PROJECT_ECHO_SQL_INSTRUMENTATION', '').lower() in ('1', 'true', 'yes'))
+    if not enabled:
+        return None
+
+    app.config['DATABASE_CONNECTION_CLASS'] = InstrumentedConnection
+    slow_seconds = app.config.get('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS) / 1000
+    metrics = app.extensions['sql_metrics'] = Metrics()
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def add_server_timing(response):
+        records = g.get('sql_queries', [])
+        sql_ms = sum(record.seconds for record in records) * 1000
+        response.headers.add('Server-Timing', f'sql;dur={sql_ms:.2f};desc="{len(records)} queries"')
+        return response
+
+    @app.teardown_request
+    def record_request(exception=None):
+        started = g.pop('request_started', None)
+        if started is None:
+            return
+        seconds = time.perf_counter() - started
+        records = g.pop('sql_queries', [])
+        route = request.url_rule.endpoint if request.url_rule else '<unmatched>'
+
+        slow = [record for record in records if record.seconds >= slow_seconds]
+        conn = g.get('db')
+        for record in slow:
+            plan = explain(conn, record) if conn is not None else []
+            slow_query_log.warning(
+                'Slow query on %s: %.1f ms, %d rows\n%s\nparameters: %r\nplan:\n  %s',
+                route, record.seconds * 1000, record.rows, record.sql.strip(), record.parameters,
+                '\n  '.join(plan)
+            )
+
+        repeats = defaultdict(int)
+        for record in records:
+            repeats[record.sql] += 1
+        for sql, count in repeats.items():
+            if count >= REPEATED_QUERY_WARNING:
+                log.warning('%s ran the same statement %d times (N+1?): %s', route, count, ' '.join(sql.split()))
+
+        metrics.add_request(route, seconds, records, len(slow))
+
+    @app.route('/metrics')
+    def metrics_view():
+        return jsonify(metrics.snapshot())
+
+    return metrics
@@ -0,0 +1,80 @@
+"""
+Markdown rendering for todo items.
+
+Todos are rendered once when they are written: the HTML is stored in todos.item_html
+next to a hash of the text it came from (todos.item_hash). Pages use the stored HTML
+whenever the hash still matches the item, and fall back to a bounded in-process LRU
+otherwise (rows written by something other than the app, or the day view's variant).
+
+Building a markdown.Markdown instance is the expensive part of markdown.markdown(),
+so each thread keeps one converter per extension set and resets it between calls.
+The markdown package itself is only imported once something needs rendering.
+"""
+import hashlib
+import threading
+from functools import lru_cache
+
+from markupsafe import Markup
+
+from database import transaction
+
+# Bump when the rendering below changes, so HTML stored by older versions is redone
+RENDER_VERSION = '1'
+
+# The day view renders finished todos inline, with code blocks and saner lists
+DAY_VIEW_EXTENSIONS = ('fenced_code', 'sane_lists')
+
+_local = threading.local()
+
+
+def _converter(extensions):
+    converters = getattr(_local, 'converters', None)
+    if converters is None:
+        converters = _local.converters = {}
+    md = converters.get(extensions)
+    if md is None:
+        import markdown
+        md = converters[extensions] = markdown.Markdown(extensions=list(extensions))
+    return md
+
+
+@lru_cache(maxsize=4096)
+def render_markdown(text, extensions=()):
+    """Same output as markdown.markdown(text, extensions=list(extensions)), memoised."""
+    return _converter(extensions).reset().convert(text)
+
+
+def content_hash(text):
+    return hashlib.sha1(f'{RENDER_VERSION}:{text}'.encode('utf-8')).hexdigest()
+
+
+def todo_html_columns(item):
+    # Values for (item_html, item_hash) whenever a todo's text is written
+    return render_markdown(item), content_hash(item)
+
+
+def todo_item_html(todo_item):
+    """Rendered HTML for a todo row, using the stored copy when it is still current."""
+    stored = todo_item['item_html']
+    if stored is not None and todo_item['item_hash'] == content_hash(todo_item['item']):
+        return Markup(stored)
+    return Markup(render_markdown(todo_item['item']))
+
+
+def todo_item_inline_html(item):
+    # Day view flavour: extra extensions and no wrapping paragraph
+    html_content = render_markdown(item, DAY_VIEW_EXTENSIONS)
+    if html_content.startswith('<p>') and html_content.endswith('</p>'):
+        html_content = html_content[3:-4]
+    return Markup(html_content)
+
+
+def fill_missing_todo_html(conn):
+    """Renders and stores HTML for todos that don't have any yet (e.g. after upgrading)."""
+    rows = conn.execute('SELECT id, item FROM todos WHERE item_html IS NULL').fetchall()
+    if not rows:
+        return 0
+    updates = [(*todo_html_columns(row['item']), row['id']) for row in rows]
+    with transaction(conn):
+        conn.executemany('UPDATE todos SET item_html = ?, item_hash = ? WHERE id = ?', updates)
+    return len(rows)
@@ -0,0 +1,575 @@
+"""
+Versioned schema migrations.
+
+The number of steps already applied to a database is stored in PRAGMA user_version.
+migrate() runs every step after that number, in order, each one in its own
+transaction together with the version bump. Steps must be safe to re-run against a
+database that already has (some of) their changes, because journals created before
+versioning existed start at version 0 with all the base tables in place.
+
+To change the schema, append a new function to MIGRATIONS. Never edit or reorder a
+step that has already shipped.
+"""
+import sqlite3
+
+
+def _column_names(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_column(conn, table, column, declaration):
+    # ALTER TABLE has no IF NOT EXISTS for columns, so check first
+    if column not in _column_names(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {declaration}')
+
+
+def _create_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            content TEXT NOT NULL,
+            duration_minutes INTEGER,
+            project TEXT
+        );
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS todos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project TEXT NOT NULL,
+            item TEXT NOT NULL,
+            start_date TEXT,
+            due_date TEXT,
+            finished_date TEXT,
+            priority TEXT NOT NULL,
+            status TEXT NOT NULL
+        );
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            is_active BOOLEAN NOT NULL DEFAULT 1, -- 1 for active, 0 for inactive
+            charging_code TEXT NOT NULL
+        );
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_todos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item TEXT NOT NULL,
+            project TEXT,
+            recurrence_type TEXT NOT NULL CHECK(recurrence_type IN ('daily', 'weekly', 'monthly')),
+            next_due_date TEXT NOT NULL, -- YYYY-MM-DD format
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            FOREIGN KEY(project) REFERENCES projects(name)
+        );
+    ''')
+
+    # Columns that older journals were created without
+    _add_column(conn, 'projects', 'charging_code', 'TEXT')
+    _add_column(conn, 'projects', 'status', 'TEXT')
+
+
+def _add_hot_query_indexes(conn):
+    # Home page window (timestamp >= ?) and anything ordered by time
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries(timestamp, duration_minutes)')
+    # Project dashboard: WHERE project = ? ORDER BY timestamp
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_project_timestamp ON entries(project, timestamp)')
+
+    # Finished lists on the todo page, day view and export: status = 'finished' AND finished_date ...
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_todos_status_finished ON todos(status, finished_date)')
+    # Open todos on the todo page: status != 'finished' ORDER BY project, due_date
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_todos_open
+        ON todos(project, due_date) WHERE status != 'finished'
+    ''')
+    # Project dashboard: WHERE project = ? ORDER BY status, due_date
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_todos_project_status ON todos(project, status, due_date)')
+
+    # Recurrence check: is_active = 1 AND next_due_date <= ?
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_due ON recurring_todos(is_active, next_due_date)')
+    # Active project dropdowns: is_active = 1 ORDER BY name
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_projects_active_name ON projects(is_active, name)')
+
+
+def _add_entry_date_columns(conn):
+    # Derived from timestamp by SQLite itself, so existing rows are covered and no write
+    # path can get them out of sync. VIRTUAL columns cost nothing on disk; the index
+    # below stores them, which lets day lookups and duration maths skip the table.
+    _add_column(conn, 'entries', 'entry_date',
+                "TEXT GENERATED ALWAYS AS (substr(timestamp, 1, 10)) VIRTUAL")
+    _add_column(conn, 'entries', 'entry_epoch',
+                "INTEGER GENERATED ALWAYS AS (CAST(strftime('%s', timestamp) AS INTEGER)) VIRTUAL")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_entry_date ON entries(entry_date, timestamp, entry_epoch)')
+
+
+def _add_daily_totals(conn):
+    # Minutes logged per (day, project), kept current by triggers so every write path
+    # (forms, edits, duration recalculation, imports) maintains it without knowing it
+    # exists. project is '' for entries without one, because NULLs never conflict.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_totals (
+            day TEXT NOT NULL,
+            project TEXT NOT NULL DEFAULT '',
+            total_minutes INTEGER NOT NULL DEFAULT 0,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, project)
+        ) WITHOUT ROWID;
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_daily_totals_project ON daily_totals(project, day)')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_totals_insert AFTER INSERT ON entries
+        BEGIN
+            INSERT INTO daily_totals (day, project, total_minutes, entry_count)
+            VALUES (NEW.entry_date, COALESCE(NEW.project, ''), COALESCE(NEW.duration_minutes, 0), 1)
+            ON CONFLICT (day, project) DO UPDATE
+            SET total_minutes = total_minutes + excluded.total_minutes,
+                entry_count = entry_count + 1;
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_totals_delete AFTER DELETE ON entries
+        BEGIN
+            UPDATE daily_totals
+            SET total_minutes = total_minutes - COALESCE(OLD.duration_minutes, 0),
+                entry_count = entry_count - 1
+            WHERE day = OLD.entry_date AND project = COALESCE(OLD.project, '');
+            DELETE FROM daily_totals
+            WHERE day = OLD.entry_date AND project = COALESCE(OLD.project, '') AND entry_count <= 0;
+        END;
+    ''')
+    # An update moves the row's contribution from its old (day, project) to its new one
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_totals_update
+        AFTER UPDATE OF timestamp, project, duration_minutes ON entries
+        BEGIN
+            UPDATE daily_totals
+            SET total_minutes = total_minutes - COALESCE(OLD.duration_minutes, 0),
+                entry_count = entry_count - 1
+            WHERE day = OLD.entry_date AND project = COALESCE(OLD.project, '');
+            DELETE FROM daily_totals
+            WHERE day = OLD.entry_date AND project = COALESCE(OLD.project, '') AND entry_count <= 0;
+            INSERT INTO daily_totals (day, project, total_minutes, entry_count)
+            VALUES (NEW.entry_date, COALESCE(NEW.project, ''), COALESCE(NEW.duration_minutes, 0), 1)
+            ON CONFLICT (day, project) DO UPDATE
+            SET total_minutes = total_minutes + excluded.total_minutes,
+                entry_count = entry_count + 1;
+        END;
+    ''')
+
+    # Backfill from the entries already in the journal
+    conn.execute('DELETE FROM daily_totals')
+    conn.execute('''
+        INSERT INTO daily_totals (day, project, total_minutes, entry_count)
+        SELECT entry_date, COALESCE(project, ''), SUM(COALESCE(duration_minutes, 0)), COUNT(*)
+        FROM entries
+        GROUP BY entry_date, COALESCE(project, '')
+    ''')
+
+
+
+def _add_todo_html_columns(conn):
+    # Rendered Markdown for todos, filled in by the app (see markdown_cache.py)
+    _add_column(conn, 'todos', 'item_html', 'TEXT')
+    _add_column(conn, 'todos', 'item_hash', 'TEXT')
+
+
+
+def _add_change_versions(conn):
+    # A counter per cache scope (e.g. 'month:2024-05'), bumped by triggers whenever data
+    # in that scope changes. Caches remember the version they were built from and only
+    # need this one-row lookup to know whether they are still good.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            changed_at INTEGER NOT NULL DEFAULT 0 -- unix time of the last change
+        ) WITHOUT ROWID;
+    ''')
+
+    # Which days of a month have entries only changes when entries appear, disappear
+    # or move, so content edits don't touch the month scope.
+    bump = '''
+        INSERT INTO change_versions (scope, version, changed_at)
+        VALUES ('month:' || substr({row}.entry_date, 1, 7), 1, CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (scope) DO UPDATE
+        SET version = version + 1, changed_at = excluded.changed_at;
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_month_insert AFTER INSERT ON entries
+        BEGIN {bump.format(row='NEW')} END;
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_month_delete AFTER DELETE ON entries
+        BEGIN {bump.format(row='OLD')} END;
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_month_update AFTER UPDATE OF timestamp ON entries
+        WHEN OLD.entry_date IS NOT NEW.entry_date
+        BEGIN {bump.format(row='OLD')} {bump.format(row='NEW')} END;
+    ''')
+
+
+def _add_full_text_search(conn):
+    # External-content FTS5 indexes over entries.content and todos.item, kept in sync
+    # by triggers. Search prefix-matches every word, so the indexes keep 2 and 3
+    # character prefixes; no stemmer, since porter stems query prefixes differently
+    # from whole words ("deploy" -> "deploi" but "deployment" -> "deploy").
+    # SQLite builds without FTS5 skip this step and search falls back to LIKE
+    # (see search_bp.py).
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts
+            USING fts5(content, content='entries', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+        ''')
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS todos_fts
+            USING fts5(item, content='todos', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')
+        ''')
+    except sqlite3.OperationalError as e:
+        if 'fts5' not in str(e):
+            raise
+        return
+
+    for table, fts, column in (('entries', 'entries_fts', 'content'), ('todos', 'todos_fts', 'item')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {fts} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+            END;
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+            END;
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {column} ON {table}
+            BEGIN
+                INSERT INTO {fts} ({fts}, rowid, {column}) VALUES ('delete', OLD.id, OLD.{column});
+                INSERT INTO {fts} (rowid, {column}) VALUES (NEW.id, NEW.{column});
+            END;
+        ''')
+        # Index everything already in the journal
+        conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+
+def _add_app_state(conn):
+    # Small key/value store for bookkeeping shared by every process using the journal,
+    # e.g. the last day the recurring todo check ran (see scheduler.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS app_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID
+    ''')
+
+
+def _add_recurrence_rules(conn):
+    # Richer recurring todo rules, see recurrence.py. Every column is optional, so
+    # existing templates keep meaning what they did, except that monthly ones are
+    # pinned to the day they are currently due on instead of drifting by 30 days.
+    _add_column(conn, 'recurring_todos', 'recurrence_interval', 'INTEGER NOT NULL DEFAULT 1')
+    _add_column(conn, 'recurring_todos', 'weekdays', 'TEXT')
+    _add_column(conn, 'recurring_todos', 'month_day', 'INTEGER')
+    _add_column(conn, 'recurring_todos', 'end_date', 'TEXT')
+    conn.execute('''
+        UPDATE recurring_todos SET month_day = CAST(substr(next_due_date, 9, 2) AS INTEGER)
+        WHERE recurrence_type = 'monthly' AND month_day IS NULL
+    ''')
+
+
+def _add_report_versions(conn):
+    # Change scopes for cached reports (see reports_bp.py): 'totals:YYYY-MM' whenever
+    # a daily total in that month changes, and 'projects' whenever any project does
+    # (a new charging code regroups every report).
+    bump = '''
+        INSERT INTO change_versions (scope, version, changed_at)
+        VALUES ({scope}, 1, CAST(strftime('%s', 'now') AS INTEGER))
+        ON CONFLICT (scope) DO UPDATE
+        SET version = version + 1, changed_at = excluded.changed_at;
+    '''
+    totals_scope = "'totals:' || substr({row}.day, 1, 7)"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_version_insert AFTER INSERT ON daily_totals
+        BEGIN {bump.format(scope=totals_scope.format(row='NEW'))} END;
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_version_delete AFTER DELETE ON daily_totals
+        BEGIN {bump.format(scope=totals_scope.format(row='OLD'))} END;
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_version_update AFTER UPDATE ON daily_totals
+        WHEN OLD.total_minutes IS NOT NEW.total_minutes OR OLD.day IS NOT NEW.day OR OLD.project IS NOT NEW.project
+        BEGIN {bump.format(scope=totals_scope.format(row='OLD'))} {bump.format(scope=totals_scope.format(row='NEW'))} END;
+    ''')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_projects_version_{event.lower()} AFTER {event} ON projects
+            BEGIN {bump.format(scope="'projects'")} END;
+        ''')
+
+
+def _add_page_versions(conn):
+    # Change scopes behind the pages' ETags (see conditional.py):
+    #   'day:YYYY-MM-DD'  entries on that day, and todos finished on it (day view)
+    #   'project:NAME'    entries and todos of a project (project dashboard)
+    #   'todos'           any todo (todo list)
+    #   'recurring'       any recurring todo
+    # Scopes that would come out NULL (an unfinished todo has no day) are skipped.
+    bump = '''
+        INSERT INTO change_versions (scope, version, changed_at)
+        SELECT {scope}, 1, CAST(strftime('%s', 'now') AS INTEGER) WHERE {scope} IS NOT NULL
+        ON CONFLICT (scope) DO UPDATE
+        SET version = version + 1, changed_at = excluded.changed_at;
+    '''
+
+    def bumps(scopes, rows):
+        return ''.join(bump.format(scope=scope.format(row=row)) for row in rows for scope in scopes)
+
+    page_scopes = {
+        'entries': ("'day:' || {row}.entry_date", "'project:' || COALESCE({row}.project, '')"),
+        'todos': ("'todos'", "'day:' || {row}.finished_date", "'project:' || {row}.project"),
+        'recurring_todos': ("'recurring'",),
+    }
+    for table, scopes in page_scopes.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_pages_insert AFTER INSERT ON {table}
+            BEGIN {bumps(scopes, ['NEW'])} END;
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_pages_delete AFTER DELETE ON {table}
+            BEGIN {bumps(scopes, ['OLD'])} END;
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_pages_update AFTER UPDATE ON {table}
+            BEGIN {bumps(scopes, ['OLD', 'NEW'])} END;
+        ''')
+
+
+def _add_project_ids(conn):
+    # Entries, todos and recurring todos point at their project by id rather than by
+    # name, so renaming a project is one UPDATE of its projects row and its history
+    # follows it. Names that were never registered as projects (nothing used to check)
+    # become inactive projects, so no history is lost. Dropping the old name columns
+    # needs ALTER TABLE DROP COLUMN (SQLite 3.35 or newer).
+    if sqlite3.sqlite_version_info < (3, 35, 0):
+        raise RuntimeError(f'Upgrading this journal needs SQLite 3.35 or newer (this is {sqlite3.sqlite_version})')
+    children = ('entries', 'todos', 'recurring_todos')
+    names = ' UNION '.join(f'SELECT project FROM {table}' for table in children)
+    conn.execute(f'''
+        INSERT INTO projects (name, charging_code, status, is_active)
+        SELECT project, '', 'unactive', 0 FROM ({names})
+        WHERE project IS NOT NULL AND project != '' AND project NOT IN (SELECT name FROM projects)
+    ''')
+
+    # Everything that mentions the name columns goes first, then is rebuilt on ids
+    for table in ('entries', 'todos'):
+        for event in ('insert', 'update', 'delete'):
+            conn.execute(f'DROP TRIGGER IF EXISTS trg_{table}_pages_{event}')
+    for event in ('insert', 'update', 'delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS trg_entries_totals_{event}')
+    for index in ('idx_entries_project_timestamp', 'idx_todos_open', 'idx_todos_project_status'):
+        conn.execute(f'DROP INDEX IF EXISTS {index}')
+
+    for table in ('entries', 'todos'):
+        _add_column(conn, table, 'project_id', 'INTEGER REFERENCES projects(id)')
+        conn.execute(f'UPDATE {table} SET project_id = (SELECT id FROM projects WHERE name = {table}.project)')
+        conn.execute(f'ALTER TABLE {table} DROP COLUMN project')
+
+    # recurring_todos.project is a foreign key on projects(name), which DROP COLUMN
+    # refuses to touch, so that (small) table is copied instead
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'recurring_todos'").fetchone()
+    conn.execute('''
+        CREATE TABLE recurring_todos_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            item TEXT NOT NULL,
+            project_id INTEGER REFERENCES projects(id),
+            recurrence_type TEXT NOT NULL CHECK(recurrence_type IN ('daily', 'weekly', 'monthly')),
+            next_due_date TEXT NOT NULL, -- YYYY-MM-DD format
+            is_active BOOLEAN NOT NULL DEFAULT 1,
+            recurrence_interval INTEGER NOT NULL DEFAULT 1,
+            weekdays TEXT,
+            month_day INTEGER,
+            end_date TEXT
+        );
+    ''')
+    conn.execute('''
+        INSERT INTO recurring_todos_new (id, item, project_id, recurrence_type, next_due_date, is_active,
+                                         recurrence_interval, weekdays, month_day, end_date)
+        SELECT r.id, r.item, p.id, r.recurrence_type, r.next_due_date, r.is_active,
+               r.recurrence_interval, r.weekdays, r.month_day, r.end_date
+        FROM recurring_todos AS r LEFT JOIN projects AS p ON p.name = r.project
+    ''')
+    conn.execute('DROP TABLE recurring_todos')
+    conn.execute('ALTER TABLE recurring_todos_new RENAME TO recurring_todos')
+    if sequence:
+        # Keep ids of deleted templates from being handed out again
+        conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = 'recurring_todos'", (sequence[0],))
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_due ON recurring_todos(is_active, next_due_date)')
+
+    # Project dashboard: WHERE project_id = ? ORDER BY timestamp
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_project_timestamp ON entries(project_id, timestamp)')
+    # Open todos on the todo page, grouped by project
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_todos_open
+        ON todos(project_id, due_date) WHERE status != 'finished'
+    ''')
+    # Project dashboard: WHERE project_id = ? ORDER BY status, due_date
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_todos_project_status ON todos(project_id, status, due_date)')
+    # Whether a project is still in use by any template
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_recurring_project ON recurring_todos(project_id)')
+
+    # daily_totals is keyed on (day, project_id) now, with 0 for entries without a project
+    conn.execute('''
+        CREATE TABLE daily_totals_new (
+            day TEXT NOT NULL,
+            project_id INTEGER NOT NULL DEFAULT 0,
+            total_minutes INTEGER NOT NULL DEFAULT 0,
+            entry_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, project_id)
+        ) WITHOUT ROWID;
+    ''')
+    conn.execute('''
+        INSERT INTO daily_totals_new (day, project_id, total_minutes, entry_count)
+        SELECT entry_date, COALESCE(project_id, 0), SUM(COALESCE(duration_minutes, 0)), COUNT(*)
+        FROM entries
+        GROUP BY entry_date, COALESCE(project_id, 0)
+    ''')
+    conn.execute('DROP TABLE daily_totals')
+    conn.execute('ALTER TABLE daily_totals_new RENAME TO daily_totals')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_daily_totals_project ON daily_totals(project_id, day)')
+
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_totals_insert AFTER INSERT ON entries
+        BEGIN
+            INSERT INTO daily_totals (day, project_id, total_minutes, entry_count)
+            VALUES (NEW.entry_date, COALESCE(NEW.project_id, 0), COALESCE(NEW.duration_minutes, 0), 1)
+            ON CONFLICT (day, project_id) DO UPDATE
+            SET total_minutes = total_minutes + excluded.total_minutes,
+                entry_count = entry_count + 1;
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_totals_delete AFTER DELETE ON entries
+        BEGIN
+            UPDATE daily_totals
+            SET total_minutes = total_minutes - COALESCE(OLD.duration_minutes, 0),
+                entry_count = entry_count - 1
+            WHERE day = OLD.entry_date AND project_id = COALESCE(OLD.project_id, 0);
+            DELETE FROM daily_totals
+            WHERE day = OLD.entry_date AND project_id = COALESCE(OLD.project_id, 0) AND entry_count <= 0;
+        END;
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_entries_totals_update
+        AFTER UPDATE OF timestamp, project_id, duration_minutes ON entries
+        BEGIN
+            UPDATE daily_totals
+            SET total_minutes = total_minutes - COALESCE(OLD.duration_minutes, 0),
+                entry_count = entry_count - 1
+            WHERE day = OLD.entry_date AND project_id = COALESCE(OLD.project_id, 0);
+            DELETE FROM daily_totals
+            WHERE day = OLD.entry_date AND project_id = COALESCE(OLD.project_id, 0) AND entry_count <= 0;
+            INSERT INTO daily_totals (day, project_id, total_minutes, entry_count)
+            VALUES (NEW.entry_date, COALESCE(NEW.project_id, 0), COALESCE(NEW.duration_minutes, 0), 1)
+            ON CONFLICT (day, project_id) DO UPDATE
+            SET total_minutes = total_minutes + excluded.total_minutes,
+                entry_count = entry_count + 1;
+        END;
+    ''')
+
+    # The change scopes of _add_report_versions and _add_page_versions, on ids:
+    # 'project:NAME' becomes 'project:ID' ('project:' for no project)
+    bump = '''
+        INSERT INTO change_versions (scope, version, changed_at)
+        SELECT {scope}, 1, CAST(strftime('%s', 'now') AS INTEGER) WHERE {scope} IS NOT NULL
+        ON CONFLICT (scope) DO UPDATE
+        SET version = version + 1, changed_at = excluded.changed_at;
+    '''
+
+    def bumps(scopes, rows):
+        return ''.join(bump.format(scope=scope.format(row=row)) for row in rows for scope in scopes)
+
+    totals_scope = ("'totals:' || substr({row}.day, 1, 7)",)
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_version_insert AFTER INSERT ON daily_totals
+        BEGIN {bumps(totals_scope, ['NEW'])} END;
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_version_delete AFTER DELETE ON daily_totals
+        BEGIN {bumps(totals_scope, ['OLD'])} END;
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_daily_totals_version_update AFTER UPDATE ON daily_totals
+        WHEN OLD.total_minutes IS NOT NEW.total_minutes OR OLD.day IS NOT NEW.day OR OLD.project_id IS NOT NEW.project_id
+        BEGIN {bumps(totals_scope, ['OLD', 'NEW'])} END;
+    ''')
+
+    project_scope = "'project:' || COALESCE({row}.project_id, '')"
+    page_scopes = {
+        'entries': ("'day:' || {row}.entry_date", project_scope),
+        'todos': ("'todos'", "'day:' || {row}.finished_date", project_scope),
+        'recurring_todos': ("'recurring'",),
+    }
+    for table, scopes in page_scopes.items():
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_pages_insert AFTER INSERT ON {table}
+            BEGIN {bumps(scopes, ['NEW'])} END;
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_pages_delete AFTER DELETE ON {table}
+            BEGIN {bumps(scopes, ['OLD'])} END;
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_pages_update AFTER UPDATE ON {table}
+            BEGIN {bumps(scopes, ['OLD', 'NEW'])} END;
+        ''')
+    conn.execute("DELETE FROM change_versions WHERE scope LIKE 'project:%'")
+
+
+MIGRATIONS = [
+    _create_base_tables,
+    _add_hot_query_indexes,
+    _add_entry_date_columns,
+    _add_daily_totals,
+    _add_todo_html_columns,
+    _add_change_versions,
+    _add_full_text_search,
+    _add_app_state,
+    _add_recurrence_rules,
+    _add_report_versions,
+    _add_page_versions,
+    _add_project_ids,
+]
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Brings the database up to the latest schema version. Returns the number of steps applied."""
+    applied = 0
+    while schema_version(conn) < len(MIGRATIONS):
+        # BEGIN IMMEDIATE takes the write lock up front, so two processes starting at
+        # once can't both run the same step; re-read the version once we hold it.
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = schema_version(conn)
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                break
+            MIGRATIONS[version](conn)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied += 1
+    return applied
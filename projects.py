@@ -0,0 +1,13 @@
+"""
+Helpers for the project a row belongs to. Entries, todos and recurring todos store
+their project's id; forms and imports name projects, and these map one to the other.
+"""
+
+# A project's id from its name, inside an INSERT/UPDATE or WHERE clause (NULL for no or an unknown project)
+PROJECT_ID_SQL = '(SELECT id FROM projects WHERE name = ?)'
+
+
+def project_id(conn, name):
+    """The id of the project called name, or None if there is no such project."""
+    row = conn.execute('SELECT id FROM projects WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else None
@@ -1,16 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 import sqlite3
-from markupsafe import Markup, escape
-import markdown
+from markdown_cache import todo_item_html
 from collections import defaultdict
+from database import get_db_connection, transaction
+from change_tracking import project_scope
+import conditional
 
 projects_bp = Blueprint('projects_bp', __name__, url_prefix='/projects')
 
-# Helper function 
-def get_db_connection():
-    conn = sqlite3.connect('journal.db') # Use your actual DB path
-    conn.row_factory = sqlite3.Row
-    return conn
 
 @projects_bp.route('/', methods=('GET', 'POST'))
 def projects():
@@ -24,9 +21,9 @@ def projects():
         # Logic to add a new project
         if project_name:
             try:
-                conn.execute('INSERT INTO projects (name, status, is_active, charging_code) VALUES (?, ?, ?, ?)', 
-                    (project_name, status, is_active, charging_code))
-                conn.commit()
+                with transaction(conn):
+                    conn.execute('INSERT INTO projects (name, status, is_active, charging_code) VALUES (?, ?, ?, ?)', 
+                        (project_name, status, is_active, charging_code))
             except sqlite3.IntegrityError:
                 # Handle case where project name is already used (UNIQUE constraint)
                 flash(f'Project "{project_name}" already exists.', 'error')
@@ -36,7 +33,6 @@ def projects():
         return redirect(url_for('projects_bp.projects'))
 
     projects = conn.execute('SELECT * FROM projects ORDER BY is_active DESC, name ASC').fetchall()
-    conn.close()
     
     return render_template('projects.html', projects=projects)
 
@@ -52,25 +48,76 @@ def edit_project(id):
         
         if name:
             try:
-                conn.execute('UPDATE projects SET name = ?, status = ?, is_active = ?, charging_code = ? WHERE id = ?', 
-                    (name, status, is_active, charging_code, id))
-                conn.commit()
+                # Entries and todos refer to the project by id, so a rename is this one row
+                with transaction(conn):
+                    conn.execute('UPDATE projects SET name = ?, status = ?, is_active = ?, charging_code = ? WHERE id = ?', 
+                        (name, status, is_active, charging_code, id))
             except sqlite3.IntegrityError:
                 flash(f'Project name "{name}" is already in use.', 'error')
             except Exception as e:
                 flash(f'An error occurred: {e}', 'error')
         
-        conn.close()
         return redirect(url_for('projects_bp.projects'))
     
     project = conn.execute('SELECT * FROM projects WHERE id = ?', (id,)).fetchone()
-    conn.close()
     
     if project is None:
         return "Project not found", 404
         
     return render_template('edit_project.html', project=project)
 
+# How many journal entries a dashboard page shows (rounded up to whole days)
+DASHBOARD_ENTRY_LIMIT = 100
+# How many of the most recently finished todos the dashboard lists
+DASHBOARD_FINISHED_LIMIT = 50
+
+def parse_entry_cursor(value):
+    # "<timestamp>|<id>" -> (timestamp, id), or None for the first page / anything malformed
+    if not value or '|' not in value:
+        return None
+    timestamp, _, entry_id = value.rpartition('|')
+    try:
+        return timestamp, int(entry_id)
+    except ValueError:
+        return None
+
+def fetch_project_entries_page(conn, project_id, before=None, limit=DASHBOARD_ENTRY_LIMIT):
+    """
+    Keyset pagination over a project's entries, newest first, on (timestamp, id).
+    Returns (entries, cursor for the next older page or None). The page is extended
+    to the end of its oldest day so a day is never split across two pages.
+    """
+    columns = 'id, timestamp, entry_date, content, duration_minutes'
+    if before is None:
+        rows = conn.execute(
+            f'SELECT {columns} FROM entries WHERE project_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?',
+            (project_id, limit)
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f'SELECT {columns} FROM entries WHERE project_id = ? AND (timestamp, id) < (?, ?) '
+            'ORDER BY timestamp DESC, id DESC LIMIT ?',
+            (project_id, *before, limit)
+        ).fetchall()
+
+    if len(rows) < limit:
+        return rows, None
+
+    # Finish off the oldest day on the page
+    last = rows[-1]
+    rows += conn.execute(
+        f'SELECT {columns} FROM entries WHERE project_id = ? AND entry_date = ? AND (timestamp, id) < (?, ?) '
+        'ORDER BY timestamp DESC, id DESC',
+        (project_id, last['entry_date'], last['timestamp'], last['id'])
+    ).fetchall()
+
+    last = rows[-1]
+    has_older = conn.execute(
+        'SELECT 1 FROM entries WHERE project_id = ? AND (timestamp, id) < (?, ?) LIMIT 1',
+        (project_id, last['timestamp'], last['id'])
+    ).fetchone()
+    return rows, (f"{last['timestamp']}|{last['id']}" if has_older else None)
+
 @projects_bp.route('/dashboard/<project_name>')
 def project_dashboard(project_name):
     conn = get_db_connection()
@@ -82,68 +129,84 @@ def project_dashboard(project_name):
     ).fetchone()
     
     if project_details is None:
-        conn.close()
         return "Project not found.", 404
+    project_id = project_details['id']
 
-    # Fetch Journal Entries for the Project
-    journal_entries = conn.execute(
-        'SELECT id, timestamp, content, duration_minutes, project FROM entries WHERE project = ? ORDER BY timestamp ASC',
-        (project_name,)
-    ).fetchall()
+    # The project's entries and todos, and the project list, are all the page shows
+    validators, not_modified = conditional.check(conn, [project_scope(project_id), 'projects'])
+    if not_modified:
+        return not_modified
 
+    # Fetch one page of Journal Entries for the Project, newest first
+    before = parse_entry_cursor(request.args.get('before'))
+    journal_entries, older_cursor = fetch_project_entries_page(conn, project_id, before)
+
+    # Group the entries by date: newest day first, oldest entry first within a day
     entries_by_date = defaultdict(list)
-    daily_project_totals = defaultdict(int)
-    
     for entry in journal_entries:
-        date_str = entry['timestamp'].split(' ')[0]
-        
-        # Group the entry
-        entries_by_date[date_str].append(dict(entry))
-        
-        # Sum the duration_minutes for the total project time that day
-        duration = entry['duration_minutes'] if entry['duration_minutes'] is not None else 0
-        daily_project_totals[date_str] += duration
+        entries_by_date[entry['entry_date']].append(entry)
+    for day_entries in entries_by_date.values():
+        day_entries.reverse()
 
-    # Fetch To-Do Items (Active and Finished)
-    all_todos = conn.execute(
-        'SELECT * FROM todos WHERE project = ? ORDER BY status, due_date ASC',
-        (project_name,)
+    # Total project time for the days on this page, from the daily rollup
+    daily_project_totals = defaultdict(int)
+    if journal_entries:
+        total_rows = conn.execute(
+            'SELECT day, total_minutes FROM daily_totals WHERE project_id = ? AND day BETWEEN ? AND ?',
+            (project_id, journal_entries[-1]['entry_date'], journal_entries[0]['entry_date'])
+        ).fetchall()
+        daily_project_totals.update({row['day']: row['total_minutes'] for row in total_rows})
+
+    # Metrics come from aggregates instead of loading every todo and entry
+    task_counts = conn.execute(
+        "SELECT COUNT(*) AS total_tasks, COALESCE(SUM(status = 'finished'), 0) AS finished_count FROM todos WHERE project_id = ?",
+        (project_id,)
+    ).fetchone()
+    total_project_minutes = conn.execute(
+        'SELECT COALESCE(SUM(total_minutes), 0) FROM daily_totals WHERE project_id = ?',
+        (project_id,)
+    ).fetchone()[0]
+
+    # Fetch To-Do Items: every active one, and only the most recently finished ones
+    active_rows = conn.execute(
+        "SELECT * FROM todos WHERE project_id = ? AND status != 'finished' ORDER BY status, due_date ASC",
+        (project_id,)
+    ).fetchall()
+    finished_rows = conn.execute(
+        "SELECT * FROM todos WHERE project_id = ? AND status = 'finished' ORDER BY finished_date DESC LIMIT ?",
+        (project_id, DASHBOARD_FINISHED_LIMIT)
     ).fetchall()
-    
-    conn.close()
 
-    # Data Processing and Markdown Conversion 
+    # Stored (or cached) Markdown HTML, wrapped in Markup for safe rendering
     active_todos = []
+    for row in active_rows:
+        todo_item = dict(row)
+        todo_item['item_html'] = todo_item_html(todo_item)
+        active_todos.append(todo_item)
+
     finished_todos = []
-    
-    # Loop through raw rows to apply Markdown and classify by status
-    for row in all_todos:
-        todo_item = dict(row) 
-        
-        # Convert Markdown to HTML and wrap in Markup for safe rendering
-        html_content = markdown.markdown(todo_item['item'])
-        todo_item['item_html'] = Markup(html_content)
-        
-        # Classify for metrics and template
-        if todo_item['status'] != 'finished':
-            active_todos.append(todo_item)
-        else:
-            finished_todos.append(todo_item)
+    for row in finished_rows:
+        todo_item = dict(row)
+        todo_item['item_html'] = todo_item_html(todo_item)
+        finished_todos.append(todo_item)
 
     # Metrics Calculation
-    total_tasks = len(all_todos)
-    finished_count = len(finished_todos)
+    total_tasks = task_counts['total_tasks']
+    finished_count = task_counts['finished_count']
     completion_percentage = (finished_count / total_tasks * 100) if total_tasks > 0 else 0
     
-    # Data Filtering for Template 
-    return render_template(
+    return conditional.finish(render_template(
         'project_dashboard.html',
         project_name=project_name,
         project=project_details,
-        entries_by_date=reversed(entries_by_date.items()),
+        entries_by_date=entries_by_date.items(),
         daily_project_totals=daily_project_totals,
         active_todos=active_todos,
         finished_todos=finished_todos,
+        finished_count=finished_count,
         total_tasks=total_tasks,
-        completion_percentage=round(completion_percentage, 1)
-    )
\ No newline at end of file
+        total_project_minutes=total_project_minutes,
+        completion_percentage=round(completion_percentage, 1),
+        older_cursor=older_cursor,
+        is_first_page=before is None
+    ), validators)
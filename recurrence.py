@@ -0,0 +1,150 @@
+"""
+Recurrence rules for recurring todos.
+
+A template's rule is its recurrence_type plus the optional columns added in
+migration 9:
+
+    recurrence_interval  every N days / weeks / months (default 1)
+    weekdays             weekly only: comma-separated weekday numbers, 0 = Monday
+                         (default: the weekday of next_due_date)
+    month_day            monthly only: day of the month, -1 for the last day
+                         (default: the day of next_due_date)
+    end_date             no occurrences after this date
+
+next_due_date is the rule's anchor: it is always the next occurrence that hasn't been
+turned into a todo yet, and intervals are counted from it. Dates that don't exist in a
+month (the 31st in April) fall back to that month's last day, without drifting later
+months off the chosen day.
+"""
+import calendar
+import datetime
+from collections import namedtuple
+from itertools import takewhile
+
+RECURRENCE_TYPES = ('daily', 'weekly', 'monthly')
+WEEKDAY_NAMES = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+LAST_DAY_OF_MONTH = -1
+
+Rule = namedtuple('Rule', 'recurrence_type anchor interval weekdays month_day end_date')
+
+
+def parse_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def parse_weekdays(value):
+    # "0,2,4" -> (0, 2, 4); empty or missing -> ()
+    if not value:
+        return ()
+    return tuple(sorted({int(day) for day in value.split(',') if day.strip()}))
+
+
+def format_weekdays(weekdays):
+    return ','.join(str(day) for day in sorted(set(weekdays))) or None
+
+
+def rule_from_row(row):
+    """Builds a Rule from a recurring_todos row (or any mapping with the same keys)."""
+    keys = row.keys()
+
+    def column(name):
+        return row[name] if name in keys else None
+
+    return Rule(
+        recurrence_type=row['recurrence_type'],
+        anchor=parse_date(row['next_due_date']),
+        interval=max(column('recurrence_interval') or 1, 1),
+        weekdays=parse_weekdays(column('weekdays')),
+        month_day=column('month_day'),
+        end_date=parse_date(column('end_date')) if column('end_date') else None,
+    )
+
+
+def add_months(year, month, months):
+    index = year * 12 + (month - 1) + months
+    return index // 12, index % 12 + 1
+
+
+def day_in_month(year, month, day):
+    # The given day of the month, clamped to the month's length; -1 is the last day
+    last_day = calendar.monthrange(year, month)[1]
+    if day == LAST_DAY_OF_MONTH or day > last_day:
+        day = last_day
+    return datetime.date(year, month, day)
+
+
+def _iter_daily(rule, first):
+    # Jump straight to the first step on or after `first`
+    steps = -(-(first - rule.anchor).days // rule.interval)
+    day = rule.anchor + datetime.timedelta(days=steps * rule.interval)
+    step = datetime.timedelta(days=rule.interval)
+    while True:
+        yield day
+        day += step
+
+
+def _iter_weekly(rule, first):
+    weekdays = rule.weekdays or (rule.anchor.weekday(),)
+    anchor_monday = rule.anchor - datetime.timedelta(days=rule.anchor.weekday())
+    # Last week on the rule's cadence that starts on or before `first`
+    weeks = (first - anchor_monday).days // 7
+    monday = anchor_monday + datetime.timedelta(weeks=weeks - weeks % rule.interval)
+    step = datetime.timedelta(weeks=rule.interval)
+    while True:
+        for weekday in weekdays:
+            day = monday + datetime.timedelta(days=weekday)
+            if day >= first:
+                yield day
+        monday += step
+
+
+def _iter_monthly(rule, first):
+    month_day = rule.month_day or rule.anchor.day
+    months = (first.year - rule.anchor.year) * 12 + first.month - rule.anchor.month
+    offset = months - months % rule.interval
+    while True:
+        day = day_in_month(*add_months(rule.anchor.year, rule.anchor.month, offset), month_day)
+        if day >= first:
+            yield day
+        offset += rule.interval
+
+
+_ITERATORS = {'daily': _iter_daily, 'weekly': _iter_weekly, 'monthly': _iter_monthly}
+
+
+def iter_occurrences(rule, start=None):
+    """Yields the rule's occurrences on or after start (default: the anchor), in order."""
+    first = max(start, rule.anchor) if start else rule.anchor
+    days = _ITERATORS[rule.recurrence_type](rule, first)
+    if rule.end_date:
+        days = takewhile(lambda day: day <= rule.end_date, days)
+    return days
+
+
+def occurrences(rule, start, end):
+    """Every occurrence from start to end inclusive, computed in one pass."""
+    return list(takewhile(lambda day: day <= end, iter_occurrences(rule, start)))
+
+
+def next_occurrence(rule, after):
+    # The first occurrence strictly after `after`, or None once the rule has ended
+    return next(iter_occurrences(rule, after + datetime.timedelta(days=1)), None)
+
+
+def describe(rule):
+    """Short human description, e.g. "Every 2 weeks on Mon, Thu until 2025-06-30"."""
+    unit = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}[rule.recurrence_type]
+    if rule.interval == 1:
+        text = rule.recurrence_type.capitalize()
+    else:
+        text = f'Every {rule.interval} {unit}s'
+
+    if rule.recurrence_type == 'weekly' and rule.weekdays:
+        text += ' on ' + ', '.join(WEEKDAY_NAMES[day] for day in rule.weekdays)
+    elif rule.recurrence_type == 'monthly':
+        month_day = rule.month_day or rule.anchor.day
+        text += ' on the last day' if month_day == LAST_DAY_OF_MONTH else f' on day {month_day}'
+
+    if rule.end_date:
+        text += f' until {rule.end_date.isoformat()}'
+    return text
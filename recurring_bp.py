@@ -1,16 +1,55 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-import sqlite3
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 import datetime
-from utilities import calculate_next_due_date
+from itertools import islice
+from recurrence import (RECURRENCE_TYPES, WEEKDAY_NAMES, LAST_DAY_OF_MONTH, Rule, rule_from_row, parse_date, format_weekdays,
+                        iter_occurrences, occurrences, describe)
+from database import get_db_connection, transaction
+from projects import project_id
+import conditional
 
 recurring_bp = Blueprint('recurring_bp', __name__, url_prefix='/recurring')
 
-DB_NAME = 'journal.db'
+# Upcoming due dates listed on the edit page
+UPCOMING_COUNT = 5
+# Default and longest preview ranges, in days
+PREVIEW_DAYS = 90
+MAX_PREVIEW_DAYS = 3 * 366
+
+
+def rule_from_form(form):
+    """
+    Reads the recurrence fields of the create/edit forms. Returns the column values
+    (recurrence_type, next_due_date, recurrence_interval, weekdays, month_day, end_date),
+    or None if they don't describe a rule with any occurrences. next_due_date is moved
+    forward to the rule's first occurrence on or after the date entered.
+    """
+    recurrence_type = form.get('recurrence_type')
+    try:
+        start_date = parse_date(form.get('next_due_date', ''))
+        interval = max(int(form.get('recurrence_interval') or 1), 1)
+        weekdays = tuple(int(day) for day in form.getlist('weekdays') if day.isdigit() and int(day) < 7)
+        month_day = int(form['month_day']) if form.get('month_day') else None
+        end_date = parse_date(form['end_date']) if form.get('end_date') else None
+    except ValueError:
+        return None
+    if recurrence_type not in RECURRENCE_TYPES or month_day not in (None, LAST_DAY_OF_MONTH, *range(1, 32)):
+        return None
+
+    # Only keep the fields that apply to the chosen type; monthly rules are pinned to a day
+    if recurrence_type != 'weekly':
+        weekdays = ()
+    if recurrence_type != 'monthly':
+        month_day = None
+    elif month_day is None:
+        month_day = start_date.day
+
+    rule = Rule(recurrence_type, start_date, interval, weekdays, month_day, end_date)
+    first_due = next(iter_occurrences(rule), None)
+    if first_due is None:
+        return None
+    return (recurrence_type, first_due.strftime('%Y-%m-%d'), interval, format_weekdays(weekdays), month_day,
+            end_date.strftime('%Y-%m-%d') if end_date else None)
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
 
 @recurring_bp.route('/', methods=('GET', 'POST'))
 def manage_recurring():
@@ -19,31 +58,43 @@ def manage_recurring():
     if request.method == 'POST':
         item = request.form['item'].strip()
         project = request.form.get('project') or None
-        recurrence_type = request.form['recurrence_type']
-        next_due_date = request.form['next_due_date']
+        rule_columns = rule_from_form(request.form)
+        template_project_id = project_id(conn, project) if project else None
         
-        if item and recurrence_type and next_due_date:
-            conn.execute(
-                'INSERT INTO recurring_todos (item, project, recurrence_type, next_due_date) VALUES (?, ?, ?, ?)',
-                (item, project, recurrence_type, next_due_date)
-            )
-            conn.commit()
+        if project and template_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('recurring_bp.manage_recurring'))
+        if item and rule_columns:
+            with transaction(conn):
+                conn.execute(
+                    'INSERT INTO recurring_todos (item, project_id, recurrence_type, next_due_date, recurrence_interval, weekdays, month_day, end_date) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                    (item, template_project_id, *rule_columns)
+                )
             flash('Recurring To-Do added successfully!', 'success')
         else:
-            flash('Please fill out all required fields.', 'error')
+            flash('Please fill out all required fields. The end date must leave at least one due date.', 'error')
         
         return redirect(url_for('recurring_bp.manage_recurring'))
     
+    validators, not_modified = conditional.check(conn, ['recurring', 'projects'])
+    if not_modified:
+        return not_modified
+
     # GET Request: Fetch all recurring todos and active projects
     recurring_items = conn.execute(
-        'SELECT * FROM recurring_todos ORDER BY is_active DESC, next_due_date ASC'
+        'SELECT r.*, p.name AS project FROM recurring_todos AS r LEFT JOIN projects AS p ON p.id = r.project_id '
+        'ORDER BY r.is_active DESC, r.next_due_date ASC'
     ).fetchall()
     active_projects = [row['name'] for row in conn.execute('SELECT name FROM projects WHERE is_active = 1').fetchall()]
-    conn.close()
     
-    return render_template('recurring_todos.html', 
+    rule_descriptions = {row['id']: describe(rule_from_row(row)) for row in recurring_items}
+    
+    return conditional.finish(render_template('recurring_todos.html', 
                            recurring_items=recurring_items, 
-                           active_projects=active_projects)
+                           rule_descriptions=rule_descriptions,
+                           weekday_names=WEEKDAY_NAMES,
+                           active_projects=active_projects), validators)
 
 @recurring_bp.route('/<int:id>/edit', methods=('GET', 'POST'))
 def edit_recurring(id):
@@ -52,30 +103,66 @@ def edit_recurring(id):
     if request.method == 'POST':
         item = request.form['item'].strip()
         project = request.form.get('project') or None
-        recurrence_type = request.form['recurrence_type']
-        next_due_date = request.form['next_due_date']
+        rule_columns = rule_from_form(request.form)
         is_active = 1 if 'is_active' in request.form else 0
+        template_project_id = project_id(conn, project) if project else None
         
-        if item and recurrence_type and next_due_date:
-            conn.execute(
-                'UPDATE recurring_todos SET item = ?, project = ?, recurrence_type = ?, next_due_date = ?, is_active = ? WHERE id = ?',
-                (item, project, recurrence_type, next_due_date, is_active, id)
-            )
-            conn.commit()
+        if project and template_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('recurring_bp.edit_recurring', id=id))
+        if item and rule_columns:
+            with transaction(conn):
+                conn.execute(
+                    'UPDATE recurring_todos SET item = ?, project_id = ?, recurrence_type = ?, next_due_date = ?, '
+                    'recurrence_interval = ?, weekdays = ?, month_day = ?, end_date = ?, is_active = ? WHERE id = ?',
+                    (item, template_project_id, *rule_columns, is_active, id)
+                )
             flash('Recurring To-Do updated successfully!', 'success')
         else:
-            flash('Please fill out all required fields.', 'error')
+            flash('Please fill out all required fields. The end date must leave at least one due date.', 'error')
         
-        conn.close()
         return redirect(url_for('recurring_bp.manage_recurring'))
 
     # GET Request: Fetch item details
-    recurring_item = conn.execute('SELECT * FROM recurring_todos WHERE id = ?', (id,)).fetchone()
+    recurring_item = conn.execute(
+        'SELECT r.*, p.name AS project FROM recurring_todos AS r LEFT JOIN projects AS p ON p.id = r.project_id WHERE r.id = ?',
+        (id,)
+    ).fetchone()
     active_projects = [row['name'] for row in conn.execute('SELECT name FROM projects WHERE is_active = 1').fetchall()]
-    conn.close()
     
     if recurring_item is None:
         return "Recurring To-Do not found", 404
         
+    rule = rule_from_row(recurring_item)
+    upcoming = [day.strftime('%Y-%m-%d') for day in islice(iter_occurrences(rule), UPCOMING_COUNT)]
+        
     # Pass the single item object to the template as 'item'
-    return render_template('edit_recurring.html', item=recurring_item, active_projects=active_projects)
\ No newline at end of file
+    return render_template('edit_recurring.html', item=recurring_item, active_projects=active_projects,
+                           weekdays=rule.weekdays, weekday_names=WEEKDAY_NAMES,
+                           rule_description=describe(rule), upcoming=upcoming)
+
+@recurring_bp.route('/<int:id>/preview')
+def preview_recurring(id):
+    """
+    Due dates of a recurring todo between start and end (inclusive) as JSON.
+    Defaults to the next 90 days from its next due date.
+    """
+    recurring_item = get_db_connection().execute('SELECT * FROM recurring_todos WHERE id = ?', (id,)).fetchone()
+    if recurring_item is None:
+        return jsonify(error='Recurring To-Do not found'), 404
+
+    rule = rule_from_row(recurring_item)
+    try:
+        start = parse_date(request.args['start']) if request.args.get('start') else rule.anchor
+        end = parse_date(request.args['end']) if request.args.get('end') else start + datetime.timedelta(days=PREVIEW_DAYS)
+    except ValueError:
+        return jsonify(error='start and end must be YYYY-MM-DD dates'), 400
+    end = min(end, start + datetime.timedelta(days=MAX_PREVIEW_DAYS))
+
+    return jsonify(
+        id=id,
+        rule=describe(rule),
+        start=start.strftime('%Y-%m-%d'),
+        end=end.strftime('%Y-%m-%d'),
+        dates=[day.strftime('%Y-%m-%d') for day in occurrences(rule, start, end)]
+    )
\ No newline at end of file
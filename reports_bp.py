@@ -0,0 +1,209 @@
+from flask import Blueprint, render_template, request, Response, jsonify
+import csv
+import datetime
+import io
+import threading
+from database import get_db_connection
+
+reports_bp = Blueprint('reports_bp', __name__, url_prefix='/reports')
+
+PERIODS = ('week', 'month')
+
+# Period a daily_totals.day falls in: the Monday that starts its week, or YYYY-MM
+PERIOD_SQL = {
+    'week': "date(dt.day, 'weekday 0', '-6 days')",
+    'month': 'substr(dt.day, 1, 7)',
+}
+
+# Minutes per period, charging code and project, with code and period subtotals
+# computed by window functions over the grouped rows
+REPORT_QUERY = '''
+    SELECT {period} AS period,
+           COALESCE(p.charging_code, '') AS charging_code,
+           COALESCE(p.name, '') AS project,
+           SUM(dt.total_minutes) AS minutes,
+           SUM(dt.entry_count) AS entry_count,
+           SUM(SUM(dt.total_minutes)) OVER (PARTITION BY {period}, COALESCE(p.charging_code, '')) AS code_minutes,
+           SUM(SUM(dt.total_minutes)) OVER (PARTITION BY {period}) AS period_minutes
+    FROM daily_totals AS dt
+    LEFT JOIN projects AS p ON p.id = dt.project_id
+    WHERE dt.day BETWEEN ? AND ?
+    GROUP BY period, charging_code, dt.project_id
+    ORDER BY period, charging_code, project
+'''
+
+# Rows of closed periods: {(db path, period kind, first day, last day): (version stamp, rows)}
+_report_cache = {}
+_report_cache_lock = threading.Lock()
+REPORT_CACHE_SIZE = 1000
+
+
+def period_ranges(period, start, end):
+    """Splits start..end (dates, inclusive) into (first day, last day) periods, clipped to the range."""
+    ranges = []
+    first = start
+    while first <= end:
+        if period == 'week':
+            next_first = first + datetime.timedelta(days=7 - first.weekday())
+        elif first.month == 12:
+            next_first = datetime.date(first.year + 1, 1, 1)
+        else:
+            next_first = datetime.date(first.year, first.month + 1, 1)
+        last = min(next_first - datetime.timedelta(days=1), end)
+        ranges.append((first, last))
+        first = next_first
+    return ranges
+
+
+def month_keys(first, last):
+    # 'YYYY-MM' for every month touched by first..last (a week can straddle two)
+    return sorted({first.strftime('%Y-%m'), last.strftime('%Y-%m')})
+
+
+def version_stamps(conn, start, end):
+    """Current change versions of the projects table and of every month in the range."""
+    months = {first.strftime('%Y-%m') for first, _ in period_ranges('month', start, end)}
+    scopes = ['projects'] + [f'totals:{month}' for month in months]
+    placeholders = ', '.join('?' * len(scopes))
+    rows = conn.execute(
+        f'SELECT scope, version FROM change_versions WHERE scope IN ({placeholders})', scopes
+    ).fetchall()
+    versions = {row['scope']: row['version'] for row in rows}
+    return {scope: versions.get(scope, 0) for scope in scopes}
+
+
+def query_report(conn, period, first, last):
+    rows = conn.execute(REPORT_QUERY.format(period=PERIOD_SQL[period]), (first.isoformat(), last.isoformat())).fetchall()
+    return [dict(row) for row in rows]
+
+
+def timesheet(conn, period, start, end, today=None):
+    """
+    Minutes per charging code and project for every week or month from start to end.
+    Returns a list of rows (period, charging_code, project, minutes, entry_count,
+    code_minutes, period_minutes) ordered by period, code and project.
+
+    All the grouping happens in SQL over the daily_totals rollup. Periods that are over
+    are cached, and a cached period is reused for as long as the change versions of
+    its months and of the projects table are the ones it was built from, so repeat
+    reports over a long journal only query the periods that can still change.
+    """
+    today = today or datetime.date.today()
+    # Read the versions BEFORE the data: a write in between just makes the next report refetch
+    versions = version_stamps(conn, start, end)
+
+    ranges = period_ranges(period, start, end)
+    rows_by_range = {}
+    uncached = []
+    for first, last in ranges:
+        cache_key = (conn.db_path, period, first, last)
+        stamp = (versions['projects'], tuple(versions[f'totals:{month}'] for month in month_keys(first, last)))
+        cached = _report_cache.get(cache_key)
+        if cached is not None and cached[0] == stamp:
+            rows_by_range[first] = cached[1]
+        else:
+            uncached.append((first, last, cache_key, stamp))
+
+    if uncached:
+        # One query for everything that wasn't cached
+        fresh = query_report(conn, period, uncached[0][0], uncached[-1][1])
+        by_period = {}
+        for row in fresh:
+            by_period.setdefault(row['period'], []).append(row)
+        for first, last, cache_key, stamp in uncached:
+            period_rows = rows_by_range[first] = by_period.get(period_key(period, first), [])
+            # Only whole periods that are over can't change any more without a version bump
+            if last < today and is_whole_period(period, first, last):
+                with _report_cache_lock:
+                    if cache_key not in _report_cache and len(_report_cache) >= REPORT_CACHE_SIZE:
+                        # Drop the oldest cached period
+                        _report_cache.pop(next(iter(_report_cache)), None)
+                    _report_cache[cache_key] = (stamp, period_rows)
+
+    return [row for first, _ in ranges for row in rows_by_range[first]]
+
+
+def start_of_period(period, day):
+    if period == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_key(period, day):
+    # Same value as PERIOD_SQL gives for the day
+    if period == 'week':
+        return start_of_period(period, day).isoformat()
+    return day.strftime('%Y-%m')
+
+
+def is_whole_period(period, first, last):
+    day_after = last + datetime.timedelta(days=1)
+    return first == start_of_period(period, first) and day_after == start_of_period(period, day_after)
+
+
+def parse_report_args(args):
+    # (period, start, end) from the query string; defaults to this month so far
+    today = datetime.date.today()
+    period = args.get('period', 'month')
+    if period not in PERIODS:
+        period = 'month'
+    try:
+        start = datetime.datetime.strptime(args['start_date'], '%Y-%m-%d').date() if args.get('start_date') else today.replace(day=1)
+        end = datetime.datetime.strptime(args['end_date'], '%Y-%m-%d').date() if args.get('end_date') else today
+    except ValueError:
+        return None
+    if start > end:
+        return None
+    return period, start, end
+
+
+def group_report(rows):
+    """Nests timesheet rows for display: [(period, period_minutes, [(code, code_minutes, [row, ...]), ...]), ...]"""
+    periods = []
+    for row in rows:
+        if not periods or periods[-1][0] != row['period']:
+            periods.append((row['period'], row['period_minutes'], []))
+        codes = periods[-1][2]
+        if not codes or codes[-1][0] != row['charging_code']:
+            codes.append((row['charging_code'], row['code_minutes'], []))
+        codes[-1][2].append(row)
+    return periods
+
+
+@reports_bp.route('/')
+def reports():
+    parsed = parse_report_args(request.args)
+    if parsed is None:
+        return "Invalid report range: use YYYY-MM-DD dates with the start on or before the end.", 400
+    period, start, end = parsed
+
+    rows = timesheet(get_db_connection(), period, start, end)
+
+    if request.args.get('format') == 'csv':
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['Period', 'Charge #', 'Project', 'Minutes', 'Hours'])
+        for row in rows:
+            writer.writerow([row['period'], row['charging_code'], row['project'], row['minutes'], round(row['minutes'] / 60, 2)])
+        filename = f'project_echo_timesheet_{period}_{start.isoformat()}_to_{end.isoformat()}.csv'
+        return Response(output.getvalue(), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+    return render_template(
+        'reports.html',
+        periods=group_report(rows),
+        period=period,
+        start_date=start.isoformat(),
+        end_date=end.isoformat(),
+        total_minutes=sum(row['minutes'] for row in rows)
+    )
+
+
+@reports_bp.route('/api')
+def reports_api():
+    parsed = parse_report_args(request.args)
+    if parsed is None:
+        return jsonify(error='start_date and end_date must be YYYY-MM-DD dates, start on or before end'), 400
+    period, start, end = parsed
+    return jsonify(period=period, start_date=start.isoformat(), end_date=end.isoformat(),
+                   rows=timesheet(get_db_connection(), period, start, end))
@@ -0,0 +1,84 @@
+"""
+Runs the recurring todo check in a background thread at a set time each day.
+
+The thread starts with the first request a process serves, so `flask` CLI commands
+and the debug reloader's watcher process (which never serves requests) don't start
+one. Its first pass is a catch-up: if the app was down when a check was due, the check
+runs straight away for the most recent day it was missed.
+
+Every process serving the app may run its own scheduler; run_daily_recurrence_check
+claims each day in the database before doing any work, so only one of them creates
+the todos.
+"""
+import datetime
+import threading
+
+from utilities import run_daily_recurrence_check
+
+# Time of day the check runs, as HH:MM in local time
+DEFAULT_CHECK_TIME = '08:00'
+
+# Wake up at least this often, so a suspended laptop or a clock change is noticed
+MAX_SLEEP_SECONDS = 3600
+
+_started = False
+_start_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def parse_check_time(value):
+    return datetime.datetime.strptime(value, '%H:%M').time()
+
+
+def last_due_date(now, check_time):
+    # The most recent day whose check time has already passed
+    if now.time() >= check_time:
+        return now.date()
+    return now.date() - datetime.timedelta(days=1)
+
+
+def seconds_until_next_check(now, check_time):
+    next_run = datetime.datetime.combine(now.date(), check_time)
+    if next_run <= now:
+        next_run += datetime.timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+def _run(app, check_time):
+    while not _stop.is_set():
+        now = datetime.datetime.now()
+        try:
+            with app.app_context():
+                run_daily_recurrence_check(as_of=last_due_date(now, check_time).isoformat(), once_per_day=True)
+        except Exception:
+            app.logger.exception('Recurring todo check failed')
+        _stop.wait(min(seconds_until_next_check(datetime.datetime.now(), check_time), MAX_SLEEP_SECONDS))
+
+
+def start(app):
+    """Starts the scheduler thread for this process, once. Returns True if it started."""
+    global _started
+    with _start_lock:
+        if _started:
+            return False
+        _started = True
+
+    check_time = parse_check_time(app.config.get('RECURRENCE_CHECK_TIME', DEFAULT_CHECK_TIME))
+    _stop.clear()
+    threading.Thread(target=_run, args=(app, check_time), name='recurrence-scheduler', daemon=True).start()
+    return True
+
+
+def stop():
+    _stop.set()
+
+
+def init_app(app):
+    # RECURRENCE_SCHEDULER = False turns it off (tests do this too)
+    if not app.config.get('RECURRENCE_SCHEDULER', True):
+        return
+
+    @app.before_request
+    def start_recurrence_scheduler():
+        if not _started and not app.testing:
+            start(app)
@@ -0,0 +1,145 @@
+from flask import Blueprint, render_template, request, jsonify, url_for
+import re
+from markupsafe import Markup, escape
+from database import get_db_connection
+from projects import PROJECT_ID_SQL
+
+search_bp = Blueprint('search_bp', __name__, url_prefix='/search')
+
+SEARCH_DEFAULT_LIMIT = 25
+SEARCH_MAX_LIMIT = 100
+SEARCH_KINDS = ('all', 'entries', 'todos')
+
+# snippet() marks matches with these control characters; they are swapped for <mark>
+# tags only after the text around them has been escaped
+MATCH_START, MATCH_END = '\x02', '\x03'
+
+WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'").fetchone()
+    return row is not None
+
+
+def fts_query(text):
+    # Quote every word so user input can never be FTS5 syntax, and prefix-match each
+    # one so "deploy" also finds "deployment". All words must match.
+    return ' '.join(f'"{word}"*' for word in WORD_PATTERN.findall(text))
+
+
+def snippet_html(snippet):
+    html = str(escape(snippet))
+    return Markup(html.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+def search(conn, text, project=None, start_date=None, end_date=None, kind='all', limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Ranked full-text search over entries and todos. Returns a list of result dicts
+    (kind, id, date, project, snippet, score), best match first. Entries are dated by
+    their day; todos by the day they were finished, or started if still open.
+    """
+    words = WORD_PATTERN.findall(text or '')
+    if not words:
+        return []
+
+    use_fts = fts_available(conn)
+    results = []
+
+    sources = []
+    if kind in ('all', 'entries'):
+        sources.append(('entry', 'entries', 'entries_fts', 'content', 'entry_date'))
+    if kind in ('all', 'todos'):
+        sources.append(('todo', 'todos', 'todos_fts', 'item', 'COALESCE(finished_date, start_date)'))
+
+    for result_kind, table, fts, column, date_expr in sources:
+        filters, params = [], []
+        if project:
+            filters.append(f't.project_id = {PROJECT_ID_SQL}')
+            params.append(project)
+        if start_date:
+            filters.append(f'{date_expr} >= ?')
+            params.append(start_date)
+        if end_date:
+            filters.append(f'{date_expr} <= ?')
+            params.append(end_date)
+
+        if use_fts:
+            where = ' AND '.join([f'{fts} MATCH ?'] + filters)
+            rows = conn.execute(f'''
+                SELECT t.id, {date_expr} AS date, p.name AS project,
+                       snippet({fts}, 0, '{MATCH_START}', '{MATCH_END}', '…', 16) AS snippet,
+                       bm25({fts}) AS score
+                FROM {fts} JOIN {table} AS t ON t.id = {fts}.rowid
+                LEFT JOIN projects AS p ON p.id = t.project_id
+                WHERE {where}
+                ORDER BY score
+                LIMIT ?
+            ''', [fts_query(text)] + params + [limit]).fetchall()
+        else:
+            # No FTS5 in this SQLite build: unranked substring match
+            where = ' AND '.join([f't.{column} LIKE ?'] * len(words) + filters)
+            rows = conn.execute(f'''
+                SELECT t.id, {date_expr} AS date, p.name AS project, substr(t.{column}, 1, 200) AS snippet, 0 AS score
+                FROM {table} AS t LEFT JOIN projects AS p ON p.id = t.project_id
+                WHERE {where}
+                ORDER BY date DESC
+                LIMIT ?
+            ''', [f'%{word}%' for word in words] + params + [limit]).fetchall()
+
+        for row in rows:
+            results.append({
+                'kind': result_kind,
+                'id': row['id'],
+                'date': row['date'],
+                'project': row['project'],
+                'snippet': snippet_html(row['snippet']),
+                'score': row['score'],
+            })
+
+    # bm25 scores are lower-is-better and comparable enough across the two indexes
+    results.sort(key=lambda result: result['score'])
+    return results[:limit]
+
+
+def search_args():
+    # Shared by the page and the API
+    kind = request.args.get('kind', 'all')
+    return {
+        'text': request.args.get('q', '').strip(),
+        'project': request.args.get('project') or None,
+        'start_date': request.args.get('start_date') or None,
+        'end_date': request.args.get('end_date') or None,
+        'kind': kind if kind in SEARCH_KINDS else 'all',
+        'limit': min(max(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), 1), SEARCH_MAX_LIMIT),
+    }
+
+
+def result_url(result):
+    if result['kind'] == 'entry':
+        return url_for('calendar_bp.view_day', date=result['date'])
+    return url_for('todo_bp.edit_todo', item_id=result['id'])
+
+
+@search_bp.route('/')
+def search_page():
+    conn = get_db_connection()
+    args = search_args()
+    results = search(conn, **args)
+    for result in results:
+        result['url'] = result_url(result)
+
+    project_rows = conn.execute('SELECT name FROM projects ORDER BY is_active DESC, name ASC').fetchall()
+    projects = [row['name'] for row in project_rows]
+
+    return render_template('search.html', results=results, projects=projects, **args)
+
+
+@search_bp.route('/api')
+def search_api():
+    args = search_args()
+    results = search(get_db_connection(), **args)
+    for result in results:
+        result['url'] = result_url(result)
+        result['snippet'] = str(result['snippet'])
+    return jsonify(query=args['text'], results=results)
@@ -0,0 +1,50 @@
+"""
+Production server for Project Echo.
+
+    python serve.py [--host HOST] [--port PORT] [--threads N]
+
+Brings the database schema up to date, then serves the app with waitress, a
+multi-threaded WSGI server that runs on Windows, macOS and Linux
+(`pip install waitress`). There is no debugger, no reloader and no browser window.
+Use --host 0.0.0.0 to let other devices on the network reach it.
+
+On macOS or Linux, gunicorn can run several worker processes instead, so requests
+spread across cores. Migrate once first, then point gunicorn at the factory:
+
+    PYTHONPATH=. flask --app app init-db
+    gunicorn --workers 4 --threads 4 --bind 0.0.0.0:8000 'app:create_app()'
+
+Any number of threads and processes can share the journal: SQLite runs in WAL mode
+so readers never wait for the writer, and writes take the write lock up front and
+wait their turn (see database.transaction()).
+"""
+import argparse
+import sys
+
+import database
+from app import create_app, init_db
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Project Echo with waitress.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on (default: this machine only).')
+    parser.add_argument('--port', type=int, default=8000)
+    # One pooled database connection per thread
+    parser.add_argument('--threads', type=int, default=database.POOL_SIZE)
+    args = parser.parse_args()
+
+    try:
+        from waitress import serve
+    except ImportError:
+        sys.exit('waitress is not installed: pip install waitress (or run gunicorn, see serve.py)')
+
+    app = create_app()
+    with app.app_context():
+        init_db()
+
+    print(f'Project Echo on http://{args.host}:{args.port}/ with {args.threads} threads')
+    serve(app, host=args.host, port=args.port, threads=args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,23 @@
 document.addEventListener('DOMContentLoaded', function () {
     document.querySelectorAll('.date-header').forEach(header => {
         header.style.cursor = 'pointer'; // Indicate it's clickable
-        header.addEventListener('click', function () {
-            const targetId = this.getAttribute('data-target');
-            const targetElement = document.getElementById(targetId);
-
-            if (targetElement) {
-                // Toggle the 'hidden' class
-                targetElement.classList.toggle('hidden');
-            }
-        });
     });
+
+    // Delegated, so date sections added later by the entries feed toggle too
+    document.addEventListener('click', function (event) {
+        const header = event.target.closest('.date-header[data-target]');
+        if (!header) {
+            return;
+        }
+        const targetElement = document.getElementById(header.getAttribute('data-target'));
+
+        if (targetElement) {
+            // Toggle the 'hidden' class
+            targetElement.classList.toggle('hidden');
+        }
+    });
+
+    setUpEntriesFeed();
 });
 
 function toggleEntries(headerElement) {
@@ -20,4 +27,59 @@ function toggleEntries(headerElement) {
     if (wrapper && wrapper.classList.contains('entries-content-wrapper')) {
         wrapper.classList.toggle('hidden');
     }
-}
\ No newline at end of file
+}
+
+// Home page: load older days in batches as the bottom of the list comes into view
+function setUpEntriesFeed() {
+    const container = document.querySelector('.entries-by-date[data-feed-url]');
+    const status = document.getElementById('entries-feed-status');
+    if (!container || !status || !container.dataset.nextBefore) {
+        return;
+    }
+
+    let loading = false;
+
+    function loadOlderDays() {
+        const before = container.dataset.nextBefore;
+        if (loading || !before) {
+            return;
+        }
+        loading = true;
+
+        fetch(container.dataset.feedUrl + '?before=' + encodeURIComponent(before))
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Feed request failed: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(data => {
+                data.days.forEach(day => {
+                    // Never render a day twice
+                    if (container.querySelector('.date-section[data-date="' + day.date + '"]')) {
+                        return;
+                    }
+                    container.insertAdjacentHTML('beforeend', day.html);
+                    container.lastElementChild.querySelector('.date-header').style.cursor = 'pointer';
+                });
+
+                container.dataset.nextBefore = data.next_before || '';
+                if (!data.next_before) {
+                    observer.disconnect();
+                    status.remove();
+                }
+                loading = false;
+            })
+            .catch(() => {
+                status.textContent = 'Could not load older entries. Scroll again to retry.';
+                loading = false;
+            });
+    }
+
+    const observer = new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadOlderDays();
+        }
+    }, { rootMargin: '400px' });
+    observer.observe(status);
+}
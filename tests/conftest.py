@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+from migrations import migrate  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A fresh journal at the latest schema version."""
+    path = str(tmp_path / 'journal.db')
+    conn = database.connect(path)
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = database.connect(db_path)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def app(db_path):
+    from app import create_app
+    return create_app({'DATABASE': db_path, 'TESTING': True, 'RECURRENCE_SCHEDULER': False})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,91 @@
+import pytest
+
+
+@pytest.fixture
+def project(conn):
+    conn.execute("INSERT INTO projects (name, charging_code, status, is_active) VALUES ('Echo', '', 'active', 1)")
+    conn.commit()
+    return 1
+
+
+@pytest.mark.parametrize('value', [True, 1.0, '1'])
+def test_project_id_must_be_an_integer(client, project, value):
+    response = client.post('/api/v1/todos', json={'project_id': value, 'item': 'x'})
+    assert response.status_code == 400
+    assert response.json['error'].startswith('unknown project_id')
+
+
+def test_project_id_or_name(client, project):
+    response = client.post('/api/v1/todos', json=[{'project_id': project, 'item': 'a'}, {'project': 'Echo', 'item': 'b'}])
+    assert response.status_code == 201
+    assert [item['project'] for item in response.json['items']] == ['Echo', 'Echo']
+
+
+def test_batch_patch_rejects_repeated_ids(client, project):
+    client.post('/api/v1/todos', json={'project': 'Echo', 'item': 'a'})
+    response = client.patch('/api/v1/todos', json=[{'id': 1, 'status': 'started'}, {'id': 1, 'status': 'finished'}])
+    assert response.status_code == 400
+    assert response.json['index'] == 1
+    assert client.get('/api/v1/todos/1').json['status'] == 'backlog'
+
+
+def count(conn, table):
+    return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_invalid_item_rejects_the_whole_batch(client, conn, project):
+    response = client.post('/api/v1/entries', json=[
+        {'timestamp': '2024-01-01 09:00', 'content': 'a', 'project': 'Echo'},
+        {'timestamp': 'not a time', 'content': 'b'},
+    ])
+    assert response.status_code == 400
+    assert response.json['index'] == 1
+    assert count(conn, 'entries') == 0
+
+
+def test_constraint_failure_rolls_back_earlier_writes(client, conn):
+    response = client.post('/api/v1/projects', json=[{'name': 'New'}, {'name': 'Other'}, {'name': 'New'}])
+    assert response.status_code == 409
+    assert response.json['index'] == 2
+    assert count(conn, 'projects') == 0
+
+
+def test_batch_keeps_durations_and_totals(client, conn, project):
+    response = client.post('/api/v1/entries', json=[
+        {'timestamp': '2024-01-01 10:00', 'content': 'b', 'project': 'Echo'},
+        {'timestamp': '2024-01-01 09:00', 'content': 'a', 'project': 'Echo'},
+    ])
+    assert response.status_code == 201
+    by_content = {item['content']: item['duration_minutes'] for item in client.get('/api/v1/entries').json['items']}
+    assert by_content == {'a': None, 'b': 60}
+    row = conn.execute("SELECT total_minutes, entry_count FROM daily_totals WHERE day = '2024-01-01'").fetchone()
+    assert tuple(row) == (60, 2)
+
+
+def test_patch_leaves_a_recurrence_status_alone(client, conn, project):
+    conn.execute("INSERT INTO todos (item, project_id, status, priority) VALUES ('daily', 1, 'active', 'low')")
+    conn.commit()
+    response = client.patch('/api/v1/todos/1', json={'item': 'daily standup'})
+    assert response.status_code == 200
+    todo = client.get('/api/v1/todos/1').json
+    assert (todo['item'], todo['status']) == ('daily standup', 'active')
+
+
+@pytest.mark.parametrize('weekdays', [3, [0, 9], ['mon'], [True]])
+def test_recurring_weekdays_must_be_weekday_numbers(client, weekdays):
+    response = client.post('/api/v1/recurring', json=[
+        {'item': 'a', 'recurrence_type': 'weekly', 'next_due_date': '2024-01-01', 'weekdays': [0]},
+        {'item': 'b', 'recurrence_type': 'weekly', 'next_due_date': '2024-01-01', 'weekdays': weekdays},
+    ])
+    assert response.status_code == 400
+    assert response.json['index'] == 1
+    assert response.json['error'].startswith('weekdays must be')
+
+
+def test_recurring_weekdays_list_or_stored_form(client):
+    response = client.post('/api/v1/recurring', json=[
+        {'item': 'a', 'recurrence_type': 'weekly', 'next_due_date': '2024-01-01', 'weekdays': [4, 0]},
+        {'item': 'b', 'recurrence_type': 'weekly', 'next_due_date': '2024-01-01', 'weekdays': '2,4'},
+    ])
+    assert response.status_code == 201
+    assert [item['weekdays'] for item in response.json['items']] == ['0,4', '2,4']
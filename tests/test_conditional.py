@@ -0,0 +1,26 @@
+import datetime
+
+
+def test_etag_revalidation(client):
+    first = client.get('/todo/')
+    assert first.status_code == 200
+    assert client.get('/todo/', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+
+def test_etag_changes_with_the_data(client):
+    first = client.get('/recurring/')
+    client.post('/recurring/', data={'item': 'Review', 'recurrence_type': 'daily', 'next_due_date': '2024-01-01'})
+    assert client.get('/recurring/', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+def test_if_modified_since_alone_never_gets_304(client):
+    client.get('/todo/')
+    later = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)).strftime('%a, %d %b %Y %H:%M:%S GMT')
+    assert client.get('/todo/', headers={'If-Modified-Since': later}).status_code == 200
+
+
+def test_revalidation_resumes_once_a_flash_is_shown(client):
+    client.post('/recurring/', data={'item': 'Review', 'recurrence_type': 'daily', 'next_due_date': '2024-01-01'})
+    shown = client.get('/recurring/')
+    assert b'Recurring To-Do added successfully!' in shown.data
+    assert client.get('/recurring/', headers={'If-None-Match': shown.headers['ETag']}).status_code == 304
@@ -0,0 +1,55 @@
+from durations import entry_changed, entry_inserted, next_entry_id, recalculate_range
+
+
+def add(conn, timestamp, duration=None):
+    return conn.execute('INSERT INTO entries (timestamp, content, duration_minutes) VALUES (?, ?, ?)',
+                        (timestamp, 'note', duration)).lastrowid
+
+
+def durations(conn, day):
+    return [row[0] for row in conn.execute(
+        'SELECT duration_minutes FROM entries WHERE entry_date = ? ORDER BY timestamp, id', (day,))]
+
+
+def test_recalculate_range_per_day(conn):
+    for timestamp in ('2024-01-01 09:00:00', '2024-01-01 09:20:59', '2024-01-01 10:00:00',
+                      '2024-01-02 08:00:00', '2024-01-02 08:05:00'):
+        add(conn, timestamp, duration=999)
+    recalculate_range(conn, '2024-01-01', '2024-01-02')
+    # Whole minutes since the previous entry that day; the first entry of a day has none
+    assert durations(conn, '2024-01-01') == [None, 20, 39]
+    assert durations(conn, '2024-01-02') == [None, 5]
+
+
+def test_recalculate_range_leaves_other_days_alone(conn):
+    add(conn, '2024-01-01 09:00:00', duration=7)
+    add(conn, '2024-01-02 09:00:00', duration=7)
+    recalculate_range(conn, '2024-01-02', '2024-01-02')
+    assert durations(conn, '2024-01-01') == [7]
+    assert durations(conn, '2024-01-02') == [None]
+
+
+def test_recalculate_range_keeps_daily_totals_in_step(conn):
+    for timestamp in ('2024-01-01 09:00:00', '2024-01-01 09:30:00', '2024-01-01 11:00:00'):
+        add(conn, timestamp)
+    recalculate_range(conn, '2024-01-01', '2024-01-01')
+    row = conn.execute("SELECT total_minutes, entry_count FROM daily_totals WHERE day = '2024-01-01'").fetchone()
+    assert tuple(row) == (120, 3)
+
+
+def test_incremental_updates_match_a_full_recalculation(conn):
+    first = add(conn, '2024-01-01 09:00:00')
+    entry_inserted(conn, first)
+    last = add(conn, '2024-01-01 10:00:00')
+    entry_inserted(conn, last)
+    middle = add(conn, '2024-01-01 09:40:00')
+    entry_inserted(conn, middle)
+    assert durations(conn, '2024-01-01') == [None, 40, 20]
+
+    # Moving the middle entry to another day fixes up the entry that followed it
+    old_next_id = next_entry_id(conn, middle)
+    conn.execute("UPDATE entries SET timestamp = '2024-01-02 09:40:00' WHERE id = ?", (middle,))
+    entry_changed(conn, middle, old_next_id)
+    incremental = durations(conn, '2024-01-01') + durations(conn, '2024-01-02')
+    recalculate_range(conn, '2024-01-01', '2024-01-02')
+    assert incremental == durations(conn, '2024-01-01') + durations(conn, '2024-01-02') == [None, 60, None]
@@ -0,0 +1,56 @@
+import io
+import json
+
+import pytest
+
+import import_data
+from import_data import Importer, import_file
+
+
+def ndjson(*records):
+    return io.BytesIO('\n'.join(json.dumps(record) for record in records).encode('utf-8'))
+
+
+def entry(timestamp, content='note'):
+    return {'type': 'entry', 'timestamp': timestamp, 'content': content}
+
+
+def durations(conn, day):
+    return [row[0] for row in conn.execute(
+        'SELECT duration_minutes FROM entries WHERE entry_date = ? ORDER BY timestamp, id', (day,))]
+
+
+def test_reimport_skips_duplicates(conn):
+    records = [entry('2024-01-01 09:00:00'), entry('2024-01-01 09:45:00')]
+    import_file(conn, ndjson(*records), 'a.ndjson')
+    result = import_file(conn, ndjson(*records), 'a.ndjson')
+    assert result.added['entry'] == 0
+    assert result.duplicates == 2
+    assert durations(conn, '2024-01-01') == [None, 45]
+
+
+def test_committed_batches_are_recalculated_when_a_later_batch_fails(conn, monkeypatch):
+    conn.execute("INSERT INTO entries (timestamp, content) VALUES ('2024-01-01 09:00:00', 'existing')")
+    conn.commit()
+    monkeypatch.setattr(import_data, 'IMPORT_BATCH_SIZE', 2)
+
+    importer = Importer(conn)
+    importer.add('entry', entry('2024-01-01 10:00:00'), 'line 1')
+    importer.add('entry', entry('2024-01-01 09:30:00'), 'line 2')  # fills and commits the first batch
+    monkeypatch.setattr(importer, '_new_todos', lambda rows: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        importer.add('entry', entry('2024-01-01 11:00:00'), 'line 3')
+        importer.add('entry', entry('2024-01-01 12:00:00'), 'line 4')
+
+    assert durations(conn, '2024-01-01') == [None, 30, 30]
+    total = conn.execute("SELECT total_minutes, entry_count FROM daily_totals WHERE day = '2024-01-01'").fetchone()
+    assert tuple(total) == (60, 3)
+
+
+def test_imports_an_active_todo(conn):
+    conn.execute("INSERT INTO projects (name, charging_code, status, is_active) VALUES ('Echo', '', 'active', 1)")
+    conn.commit()
+    result = import_file(conn, ndjson({'type': 'todo', 'project': 'Echo', 'item': 'daily', 'status': 'active'}),
+                         'a.ndjson')
+    assert result.added['todo'] == 1
+    assert conn.execute('SELECT status FROM todos').fetchone()[0] == 'active'
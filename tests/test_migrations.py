@@ -0,0 +1,108 @@
+import pytest
+
+import database
+from migrations import MIGRATIONS, migrate, schema_version
+
+# The tables as the app created them before schema versioning (user_version 0)
+BASELINE_SCHEMA = '''
+    CREATE TABLE entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT NOT NULL,
+        content TEXT NOT NULL,
+        duration_minutes INTEGER,
+        project TEXT
+    );
+    CREATE TABLE todos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        project TEXT NOT NULL,
+        item TEXT NOT NULL,
+        start_date TEXT,
+        due_date TEXT,
+        finished_date TEXT,
+        priority TEXT NOT NULL,
+        status TEXT NOT NULL
+    );
+    CREATE TABLE projects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        charging_code TEXT NOT NULL
+    );
+    CREATE TABLE recurring_todos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        item TEXT NOT NULL,
+        project TEXT,
+        recurrence_type TEXT NOT NULL CHECK(recurrence_type IN ('daily', 'weekly', 'monthly')),
+        next_due_date TEXT NOT NULL,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        FOREIGN KEY(project) REFERENCES projects(name)
+    );
+'''
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    conn = database.connect(str(tmp_path / 'old.db'))
+    conn.executescript(BASELINE_SCHEMA)
+    conn.executemany('INSERT INTO projects (name, is_active, charging_code) VALUES (?, ?, ?)',
+                     [('Echo', 1, 'C-1'), ('Other', 0, 'C-2')])
+    conn.executemany('INSERT INTO entries (timestamp, content, duration_minutes, project) VALUES (?, ?, ?, ?)', [
+        ('2024-01-01 09:00:00', 'planning the release', None, 'Echo'),
+        ('2024-01-01 09:30:00', 'fixed the build', 30, 'Echo'),
+        ('2024-01-01 10:00:00', 'lunch', 30, None),
+        ('2024-01-02 08:00:00', 'old side project', None, 'Ghost'),
+    ])
+    conn.execute("INSERT INTO todos (project, item, priority, status) VALUES ('Echo', 'write **notes**', 'low', 'backlog')")
+    conn.execute("INSERT INTO recurring_todos (item, project, recurrence_type, next_due_date) "
+                 "VALUES ('pay rent', 'Other', 'monthly', '2024-01-31')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_baseline_journal_is_brought_up_to_date(baseline):
+    assert schema_version(baseline) == 0
+    assert migrate(baseline) == len(MIGRATIONS)
+    assert schema_version(baseline) == len(MIGRATIONS)
+    assert baseline.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    # Running it again has nothing left to do
+    assert migrate(baseline) == 0
+
+
+def test_project_names_become_ids(baseline):
+    migrate(baseline)
+    rows = baseline.execute(
+        'SELECT e.content, p.name FROM entries AS e LEFT JOIN projects AS p ON p.id = e.project_id ORDER BY e.id'
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [('planning the release', 'Echo'), ('fixed the build', 'Echo'),
+                                            ('lunch', None), ('old side project', 'Ghost')]
+    # An unregistered name becomes an inactive project rather than being lost
+    ghost = baseline.execute("SELECT is_active, status FROM projects WHERE name = 'Ghost'").fetchone()
+    assert tuple(ghost) == (0, 'unactive')
+    assert baseline.execute('SELECT project_id FROM recurring_todos').fetchone()[0] == 2
+
+    # A rename is one row, and the history follows it
+    baseline.execute("UPDATE projects SET name = 'Echo 2' WHERE name = 'Echo'")
+    assert baseline.execute("SELECT COUNT(*) FROM entries AS e JOIN projects AS p ON p.id = e.project_id "
+                            "WHERE p.name = 'Echo 2'").fetchone()[0] == 2
+
+
+def test_derived_data_is_backfilled(baseline):
+    migrate(baseline)
+    totals = baseline.execute('SELECT day, project_id, total_minutes, entry_count FROM daily_totals ORDER BY day, project_id')
+    assert [tuple(row) for row in totals] == [('2024-01-01', 0, 30, 1), ('2024-01-01', 1, 30, 2), ('2024-01-02', 3, 0, 1)]
+    # Monthly templates are pinned to the day they were due on
+    assert baseline.execute('SELECT month_day FROM recurring_todos').fetchone()[0] == 31
+    if baseline.execute("SELECT 1 FROM sqlite_master WHERE name = 'entries_fts'").fetchone():
+        found = baseline.execute("SELECT rowid FROM entries_fts WHERE entries_fts MATCH 'build'").fetchall()
+        assert [row[0] for row in found] == [2]
+
+
+def test_triggers_keep_totals_current_after_upgrade(baseline):
+    migrate(baseline)
+    baseline.execute("INSERT INTO entries (timestamp, content, duration_minutes, project_id) "
+                     "VALUES ('2024-01-01 11:00:00', 'review', 60, 1)")
+    baseline.execute("UPDATE entries SET project_id = NULL WHERE content = 'fixed the build'")
+    totals = baseline.execute("SELECT project_id, total_minutes, entry_count FROM daily_totals WHERE day = '2024-01-01' "
+                              "ORDER BY project_id")
+    assert [tuple(row) for row in totals] == [(0, 60, 2), (1, 60, 2)]
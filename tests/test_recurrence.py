@@ -0,0 +1,51 @@
+import datetime
+from itertools import islice
+
+from recurrence import LAST_DAY_OF_MONTH, Rule, iter_occurrences, next_occurrence, occurrences
+
+
+def d(value):
+    return datetime.date.fromisoformat(value)
+
+
+def rule(recurrence_type, anchor, interval=1, weekdays=(), month_day=None, end_date=None):
+    return Rule(recurrence_type, d(anchor), interval, weekdays, month_day, d(end_date) if end_date else None)
+
+
+def first(r, count, start=None):
+    return [day.isoformat() for day in islice(iter_occurrences(r, d(start) if start else None), count)]
+
+
+def test_daily_interval_counts_from_the_anchor():
+    assert first(rule('daily', '2024-01-01', interval=3), 3) == ['2024-01-01', '2024-01-04', '2024-01-07']
+    # Starting later jumps straight to the next step on the cadence
+    assert first(rule('daily', '2024-01-01', interval=3), 2, '2024-01-05') == ['2024-01-07', '2024-01-10']
+
+
+def test_weekly_on_chosen_weekdays():
+    every_other = rule('weekly', '2024-01-01', interval=2, weekdays=(0, 3))  # Mon and Thu
+    assert first(every_other, 4) == ['2024-01-01', '2024-01-04', '2024-01-15', '2024-01-18']
+    # Without weekdays, the anchor's weekday
+    assert first(rule('weekly', '2024-01-03'), 2) == ['2024-01-03', '2024-01-10']
+
+
+def test_monthly_clamps_to_short_months_without_drifting():
+    r = rule('monthly', '2024-01-31', month_day=31)
+    assert first(r, 4) == ['2024-01-31', '2024-02-29', '2024-03-31', '2024-04-30']
+
+
+def test_monthly_last_day():
+    r = rule('monthly', '2023-11-30', month_day=LAST_DAY_OF_MONTH)
+    assert first(r, 3) == ['2023-11-30', '2023-12-31', '2024-01-31']
+
+
+def test_end_date_stops_the_rule():
+    r = rule('daily', '2024-01-01', end_date='2024-01-03')
+    assert first(r, 10) == ['2024-01-01', '2024-01-02', '2024-01-03']
+    assert next_occurrence(r, d('2024-01-03')) is None
+
+
+def test_occurrences_and_next_occurrence():
+    r = rule('weekly', '2024-01-01')
+    assert occurrences(r, d('2024-01-01'), d('2024-01-21')) == [d('2024-01-01'), d('2024-01-08'), d('2024-01-15')]
+    assert next_occurrence(r, d('2024-01-08')) == d('2024-01-15')
@@ -0,0 +1,19 @@
+
+def todo_form(project, **fields):
+    return {'project': project, 'item': 'Write tests', 'start_date': '', 'due_date': '',
+            'priority': 'low', 'status': 'backlog', **fields}
+
+
+def test_new_todo_is_stored_with_its_project_id(client, conn):
+    conn.execute("INSERT INTO projects (name, charging_code, status, is_active) VALUES ('Echo', '', 'active', 1)")
+    conn.commit()
+    assert client.post('/todo/', data=todo_form('Echo')).status_code == 302
+    row = conn.execute('SELECT t.item, p.name FROM todos AS t JOIN projects AS p ON p.id = t.project_id').fetchone()
+    assert tuple(row) == ('Write tests', 'Echo')
+
+
+def test_unknown_project_is_rejected(client, conn):
+    assert client.post('/todo/', data=todo_form('Nope')).status_code == 302
+    assert conn.execute('SELECT COUNT(*) FROM todos').fetchone()[0] == 0
+    with client.session_transaction() as session:
+        assert session['_flashes'] == [('error', 'Unknown project "Nope".')]
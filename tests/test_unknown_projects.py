@@ -0,0 +1,40 @@
+import pytest
+
+RULE = {'recurrence_type': 'daily', 'next_due_date': '2024-01-01'}
+
+
+@pytest.fixture
+def rows(conn):
+    conn.execute("INSERT INTO projects (name, charging_code, status, is_active) VALUES ('Echo', '', 'active', 1)")
+    conn.execute("INSERT INTO entries (timestamp, content, project_id) VALUES ('2024-01-01 09:00:00', 'note', 1)")
+    conn.execute("INSERT INTO recurring_todos (item, project_id, recurrence_type, next_due_date) "
+                 "VALUES ('Review', 1, 'daily', '2024-01-01')")
+    conn.commit()
+
+
+def projects_of(conn, table):
+    return [row[0] for row in conn.execute(f'SELECT project_id FROM {table} ORDER BY id')]
+
+
+@pytest.mark.parametrize('url, form, table', [
+    ('/', {'content': 'new'}, 'entries'),
+    ('/day/2024-01-01', {'content': 'new'}, 'entries'),
+    ('/edit/1', {'content': 'note', 'date': '2024-01-01', 'time': '09:00'}, 'entries'),
+    ('/recurring/', {'item': 'Plan', **RULE}, 'recurring_todos'),
+    ('/recurring/1/edit', {'item': 'Review', **RULE}, 'recurring_todos'),
+])
+def test_unknown_project_is_rejected(client, conn, rows, url, form, table):
+    assert client.post(url, data={**form, 'project': 'Nope'}).status_code == 302
+    assert projects_of(conn, table) == [1]
+    with client.session_transaction() as session:
+        assert session['_flashes'] == [('error', 'Unknown project "Nope".')]
+
+
+def test_entry_without_a_project(client, conn, rows):
+    assert client.post('/', data={'content': 'new', 'project': ''}).status_code == 302
+    assert projects_of(conn, 'entries') == [1, None]
+
+
+def test_entry_with_a_known_project(client, conn, rows):
+    assert client.post('/edit/1', data={'content': 'moved', 'date': '2024-01-01', 'time': '10:00', 'project': 'Echo'}).status_code == 302
+    assert tuple(conn.execute('SELECT content, project_id FROM entries').fetchone()) == ('moved', 1)
@@ -0,0 +1,43 @@
+import sqlite3
+import time
+
+import database
+from write_queue import WriteQueue
+
+
+def write_answer(conn, days):
+    return 42
+
+
+def test_failed_connect_fails_pending_writes_and_recovers(db_path, monkeypatch):
+    writer = WriteQueue(db_path)
+    real_connect = database.connect
+
+    def locked(path):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(database, 'connect', locked)
+    future = writer.submit(write_answer)
+    started = time.monotonic()
+    error = future.exception(timeout=5)
+    assert isinstance(error, sqlite3.OperationalError)
+    assert time.monotonic() - started < 5
+
+    # The next write starts a new writer thread instead of waiting on the dead one
+    monkeypatch.setattr(database, 'connect', real_connect)
+    assert writer.submit(write_answer).result(timeout=5) == 42
+    writer.close()
+
+
+def test_batch_commits_entry(db_path):
+    writer = WriteQueue(db_path)
+
+    def insert(conn, days):
+        days.add('2024-01-01')
+        return conn.execute("INSERT INTO entries (timestamp, content) VALUES ('2024-01-01 09:00:00', 'x')").lastrowid
+
+    entry_id = writer.submit(insert).result(timeout=5)
+    writer.close()
+    conn = database.connect(db_path)
+    assert conn.execute('SELECT content FROM entries WHERE id = ?', (entry_id,)).fetchone()[0] == 'x'
+    conn.close()
@@ -1,21 +1,17 @@
 ﻿from flask import Blueprint, render_template, request, redirect, url_for, flash
 from collections import defaultdict
-import sqlite3
 import datetime
-import markdown
-from markupsafe import Markup, escape 
+from markdown_cache import todo_html_columns, todo_item_html
 
-from projects_bp import projects_bp
+from projects import project_id
 from utilities import run_daily_recurrence_check
+from database import get_db_connection, transaction
+import conditional
+from write_queue import add_todo
 
 # Define the Blueprint. The URL prefix will be '/todo'
 todo_bp = Blueprint('todo_bp', __name__, url_prefix='/todo')
 
-# Helper function to get database connection (copied from app.py)
-def get_db_connection():
-    conn = sqlite3.connect('journal.db')
-    conn.row_factory = sqlite3.Row
-    return conn
 
 @todo_bp.route('/', methods=('GET', 'POST'))
 def todo():
@@ -28,66 +24,72 @@ def todo():
         priority = request.form['priority']
         status = request.form['status']
 
+        # Every todo belongs to a project that exists
+        todo_project_id = project_id(conn, project)
+        if todo_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('todo_bp.todo'))
+
         # Check if the task is being marked as finished and set the finished_date
         finished_date = datetime.date.today().strftime('%Y-%m-%d') if status == 'finished' else None
         
-        conn.execute('INSERT INTO todos (project, item, start_date, due_date, finished_date, priority, status) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                     (project, item, start_date, due_date, finished_date, priority, status))
-        conn.commit()
+        # Render the Markdown once here instead of on every page view
+        item_html, item_hash = todo_html_columns(item)
+        
+        add_todo(conn, project_id=todo_project_id, item=item, start_date=start_date, due_date=due_date, finished_date=finished_date,
+                 priority=priority, status=status, item_html=item_html, item_hash=item_hash)
+        return redirect(url_for('todo_bp.todo'))
 
+    # Any todo or project change, or a new day (the finished list covers the last 31 days)
+    validators, not_modified = conditional.check(conn, ['todos', 'projects'], datetime.date.today())
+    if not_modified:
+        return not_modified
 
     # Fetch all active projects for the dropdown
     project_rows = conn.execute('SELECT name FROM projects WHERE is_active = 1 ORDER BY name ASC').fetchall()
     active_projects = [row['name'] for row in project_rows]
 
-        
     # Calculate the cutoff date (31 days ago)
     thirty_one_days_ago = datetime.date.today() - datetime.timedelta(days=31)
     cutoff_date = thirty_one_days_ago.strftime('%Y-%m-%d')
 
     # Query Active Todos
-    # Fetch all todos that are NOT finished
+    # Fetch all todos that are NOT finished, grouped on project_id and named from projects
     active_todos = conn.execute(
-        'SELECT * FROM todos WHERE status != "finished" ORDER BY project, due_date ASC'
+        "SELECT t.*, COALESCE(p.name, '') AS project FROM todos AS t LEFT JOIN projects AS p ON p.id = t.project_id "
+        "WHERE t.status != 'finished' ORDER BY project, t.due_date ASC"
     ).fetchall()
 
     # Query Finished Todos (Filtered by Date)
     # Fetch all finished todos where the finished_date is ON OR AFTER the cutoff date
     finished_todos_recent = conn.execute(
-        'SELECT * FROM todos WHERE status = "finished" AND finished_date >= ? ORDER BY project, finished_date DESC',
+        "SELECT t.*, COALESCE(p.name, '') AS project FROM todos AS t LEFT JOIN projects AS p ON p.id = t.project_id "
+        "WHERE t.status = 'finished' AND t.finished_date >= ? ORDER BY project, t.finished_date DESC",
         (cutoff_date,)
     ).fetchall()
 
-    conn.close()
-
     active_todos_by_project = defaultdict(list)
     finished_todos_by_project = defaultdict(list)
     
     # Process Active Todos
     for todo_item in active_todos:
         todo_item = dict(todo_item)
-        html_content = markdown.markdown(todo_item['item'])
-        todo_item['item_html'] = Markup(html_content)
+        todo_item['item_html'] = todo_item_html(todo_item)
         active_todos_by_project[todo_item['project']].append(todo_item)
     
     # Process Recent Finished Todos
     for todo_item in finished_todos_recent:
         todo_item = dict(todo_item)
-        html_content = markdown.markdown(todo_item['item'])
-        todo_item['item_html'] = Markup(html_content)
+        todo_item['item_html'] = todo_item_html(todo_item)
         finished_todos_by_project[todo_item['project']].append(todo_item)
 
     sorted_finished_projects = sorted(finished_todos_by_project.items())
     
-    # NOTE: The redirect should handle the POST request
-    if request.method == 'POST':
-        return redirect(url_for('todo_bp.todo'))
-        
-    return render_template('todo.html', 
+    return conditional.finish(render_template('todo.html', 
                            active_todos_by_project=active_todos_by_project, 
                            finished_todos_by_project=sorted_finished_projects,
                            active_projects=active_projects
-                           )  
+                           ), validators)  
         
 # Editing Todos
 @todo_bp.route('/edit/<int:item_id>', methods=('GET', 'POST'))
@@ -102,24 +104,31 @@ def edit_todo(item_id):
         priority = request.form['priority']
         status = request.form['status']
         
-        # Determine the finished_date based on the new status
-        current_finished_date_tuple = conn.execute('SELECT finished_date FROM todos WHERE id = ?', (item_id,)).fetchone()
-        current_finished_date = current_finished_date_tuple[0] if current_finished_date_tuple else None
-        
-        if status == 'finished' and not current_finished_date:
-            finished_date = datetime.date.today().strftime('%Y-%m-%d')
-        elif status != 'finished' and current_finished_date:
-            finished_date = None
-        else:
-            finished_date = current_finished_date
-
-        conn.execute('''
-            UPDATE todos 
-            SET project = ?, item = ?, start_date = ?, due_date = ?, finished_date = ?, priority = ?, status = ? 
-            WHERE id = ?
-        ''', (project, item, start_date, due_date, finished_date, priority, status, item_id))
-        conn.commit()
-        conn.close()
+        todo_project_id = project_id(conn, project)
+        if todo_project_id is None:
+            flash(f'Unknown project "{project}".', 'error')
+            return redirect(url_for('todo_bp.edit_todo', item_id=item_id))
+
+        item_html, item_hash = todo_html_columns(item)
+
+        # Read and write in one transaction, so a concurrent edit can't slip in between
+        with transaction(conn):
+            # Determine the finished_date based on the new status
+            current_finished_date_tuple = conn.execute('SELECT finished_date FROM todos WHERE id = ?', (item_id,)).fetchone()
+            current_finished_date = current_finished_date_tuple[0] if current_finished_date_tuple else None
+            
+            if status == 'finished' and not current_finished_date:
+                finished_date = datetime.date.today().strftime('%Y-%m-%d')
+            elif status != 'finished' and current_finished_date:
+                finished_date = None
+            else:
+                finished_date = current_finished_date
+
+            conn.execute('''
+                UPDATE todos 
+                SET project_id = ?, item = ?, start_date = ?, due_date = ?, finished_date = ?, priority = ?, status = ?, item_html = ?, item_hash = ? 
+                WHERE id = ?
+            ''', (todo_project_id, item, start_date, due_date, finished_date, priority, status, item_html, item_hash, item_id))
         return redirect(url_for('todo_bp.todo'))
         
     # Fetch active project names 
@@ -127,8 +136,10 @@ def edit_todo(item_id):
     active_projects = [row['name'] for row in project_rows]
 
     # Fetch specific todo
-    todo_item = conn.execute('SELECT * FROM todos WHERE id = ?', (item_id,)).fetchone()
-    conn.close()
+    todo_item = conn.execute(
+        'SELECT t.*, p.name AS project FROM todos AS t LEFT JOIN projects AS p ON p.id = t.project_id WHERE t.id = ?',
+        (item_id,)
+    ).fetchone()
     
     if todo_item is None:
         return "Todo item not found.", 404
@@ -1,118 +1,76 @@
 ﻿import datetime
-import sqlite3
+import logging
+from database import db_connection, transaction
+from markdown_cache import todo_html_columns
+from recurrence import RECURRENCE_TYPES, Rule, rule_from_row, occurrences, next_occurrence, parse_date
 
-def get_db_connection():
-    conn = sqlite3.connect("journal.db")
-    conn.row_factory = sqlite3.Row
-    return conn
+def calculate_next_due_date(current_date_str, recurrence_type):
+    # One step of a plain daily/weekly/monthly rule, using calendar months (Jan 31 -> Feb 28)
+    if recurrence_type not in RECURRENCE_TYPES:
+        return None
+    current_date = parse_date(current_date_str)
+    rule = Rule(recurrence_type, current_date, 1, (), None, None)
+    return next_occurrence(rule, current_date).strftime('%Y-%m-%d')
 
-def recalculate_day_durations(conn, date_str):
-    """
-    Calculates the time elapsed since the PREVIOUS entry on the given day (date_str).
-    The elapsed duration is stored on the current entry.
-    """
-    # Fetch all entries for the given date, ordered chronologically
-    entries_for_day = conn.execute(
-        'SELECT id, timestamp FROM entries WHERE strftime("%Y-%m-%d", timestamp) = ? ORDER BY timestamp ASC',
-        (date_str,)
-    ).fetchall()
+log = logging.getLogger('project_echo.recurrence')
 
-    if not entries_for_day:
-        return
+# app_state key holding the last day a scheduled recurrence check ran for
+LAST_RECURRENCE_RUN_KEY = 'recurrence_last_run'
 
-    # List of entry IDs and their timestamps
-    entry_data = []
-    for entry in entries_for_day:
-        entry_data.append({
-            'id': entry['id'],
-            'timestamp_dt': datetime.datetime.strptime(entry['timestamp'], '%Y-%m-%d %H:%M:%S')
-        })
+def run_daily_recurrence_check(as_of=None, once_per_day=False):
+    """
+    Creates a todo for every occurrence of every active recurring template up to as_of
+    (default today), so days missed while nothing ran are filled in too, and moves each
+    template on to its next occurrence, all in one transaction. Templates whose end
+    date has passed are deactivated.
+    The transaction takes the write lock up front, so runs from other threads or
+    processes queue behind it and then find nothing left to do.
+    With once_per_day the run first claims as_of in app_state and does nothing if
+    another run already has (the scheduler's guard). Returns the number of todos created.
+    """
+    today_date_str = as_of or datetime.datetime.now().strftime('%Y-%m-%d')
 
-    # Iterate through the entries to calculate duration since the PREVIOUS entry
-    for i in range(len(entry_data)):
-        current_entry = entry_data[i]
-        
-        if i == 0:
-            # The first entry of the day has no preceding entry
-            duration_minutes = None
-        else:
-            # The duration is the time difference from the previous entry
-            previous_entry = entry_data[i-1]
-            time_difference = current_entry['timestamp_dt'] - previous_entry['timestamp_dt']
-            duration_minutes = int(time_difference.total_seconds() / 60)
-        
-        # Update the database: The calculated duration is applied to the current entry's ID
-        conn.execute(
-            'UPDATE entries SET duration_minutes = ? WHERE id = ?',
-            (duration_minutes, current_entry['id'])
-        )
+    with db_connection() as conn, transaction(conn):
+        if once_per_day:
+            claimed = conn.execute(
+                'INSERT INTO app_state (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value WHERE value < excluded.value',
+                (LAST_RECURRENCE_RUN_KEY, today_date_str)
+            ).rowcount
+            if not claimed:
+                conn.rollback()
+                return 0
 
-        conn.commit()
+        # Fetch active templates where next_due_date is today or in the past
+        templates_to_process = conn.execute(
+            'SELECT * FROM recurring_todos WHERE is_active = 1 AND next_due_date <= ?',
+            (today_date_str,)
+        ).fetchall()
 
-def calculate_next_due_date(current_date_str, recurrence_type):
-    current_date = datetime.datetime.strptime(current_date_str, '%Y-%m-%d')
-    
-    if recurrence_type == 'daily':
-        next_date = current_date + datetime.timedelta(days=1)
-    elif recurrence_type == 'weekly':
-        next_date = current_date + datetime.timedelta(weeks=1)
-    elif recurrence_type == 'monthly':
-        # Simple monthly increment: adds 30 days, slightly inaccurate but common for simple tracking
-        next_date = current_date + datetime.timedelta(days=30) 
-        # For precise monthly increment, you would use a library or more complex datetime logic.
-    else:
-        return None
-        
-    return next_date.strftime('%Y-%m-%d')
-
-def run_daily_recurrence_check():
-    conn = get_db_connection()
-    today_date_str = datetime.datetime.now().strftime('%Y-%m-%d')
-    
-    # Fetch active templates where next_due_date is today or in the past
-    templates_to_process = conn.execute(
-        'SELECT * FROM recurring_todos WHERE is_active = 1 AND next_due_date <= ?',
-        (today_date_str,)
-    ).fetchall()
-    
-    new_tasks_created = 0
-    
-    for template in templates_to_process:
+        as_of_date = parse_date(today_date_str)
         default_priority = 'low'
+        new_todos = []
+        template_updates = []
+        for template in templates_to_process:
+            rule = rule_from_row(template)
+            item_html, item_hash = todo_html_columns(template['item'])
+            for due_date in occurrences(rule, rule.anchor, as_of_date):
+                new_todos.append((template['item'], template['project_id'], 'active', due_date.strftime('%Y-%m-%d'),
+                                  default_priority, item_html, item_hash))
 
-        # Create a new To-Do entry
-        conn.execute(
-            'INSERT INTO todos (item, project, status, start_date, priority) VALUES (?, ?, ?, ?, ?)',
-            (template['item'], template['project'], 'active', today_date_str, default_priority)
-        )
-        new_tasks_created += 1
-        
-        # Calculate and update the next due date for the template
-        new_next_due_date = calculate_next_due_date(today_date_str, template['recurrence_type'])
-        
-        conn.execute(
-            'UPDATE recurring_todos SET next_due_date = ? WHERE id = ?',
-            (new_next_due_date, template['id'])
-        )
-        
-    conn.commit()
-    conn.close()
-    print(f"Daily check complete. Created {new_tasks_created} new tasks.")
-    return new_tasks_created
+            # Move the template on to its next occurrence, or retire it once it has ended
+            next_due_date = next_occurrence(rule, as_of_date)
+            if next_due_date is None:
+                template_updates.append((template['next_due_date'], 0, template['id']))
+            else:
+                template_updates.append((next_due_date.strftime('%Y-%m-%d'), 1, template['id']))
 
-def check_time():
-    # Get the current time
-    current_time = datetime.datetime.now().time()
-    
-    # Define the target time (8:00 AM)
-    target_time = datetime.time(hour=8, minute=0)
-    
-    # The comparison works directly on time objects
-    if current_time >= target_time:
-        run_daily_recurrence_check()
-        print(f"Current time ({current_time.strftime('%H:%M')}) is after 8:00 AM. Doing the thing!")
-        return True
+        conn.executemany(
+            'INSERT INTO todos (item, project_id, status, start_date, priority, item_html, item_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
+            new_todos
+        )
+        conn.executemany('UPDATE recurring_todos SET next_due_date = ?, is_active = ? WHERE id = ?', template_updates)
 
-    else:
-        print(f"Current time ({current_time.strftime('%H:%M')}) is before 8:00 AM. Skipping.")
-        return False
\ No newline at end of file
+    new_tasks_created = len(new_todos)
+    log.info('Daily check complete. Created %d new tasks.', new_tasks_created)
+    return new_tasks_created
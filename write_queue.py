@@ -0,0 +1,226 @@
+"""
+Optional write-behind path for new entries and todos: set WRITE_QUEUE = True in the app
+config (or the PROJECT_ECHO_WRITE_QUEUE environment variable).
+
+Normally every request that adds an entry or todo takes SQLite's write lock and commits
+its own row. With the queue on, requests hand the write to one writer thread per
+database instead. The writer collects whatever arrives within BATCH_WINDOW seconds (up
+to MAX_BATCH writes), applies it all in one transaction, recomputes durations once per
+affected day and commits: one lock and one commit for the whole batch.
+
+The request still waits until its batch has committed before it redirects, so the page
+it redirects to already shows the new row. A write that fails is rolled back on its own
+and its error is raised in the request that made it; the rest of the batch commits.
+Writes still pending when the process exits are committed first.
+
+Views call add_entry()/add_todo(), which take the direct path when the queue is off.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+import database
+from database import transaction
+from durations import entry_inserted, recalculate_range
+
+# How long the writer waits for more writes after the first one of a batch
+BATCH_WINDOW = 0.005
+MAX_BATCH = 500
+# How long a request waits for its batch to commit
+WRITE_TIMEOUT = 30
+
+TODO_COLUMNS = ('project_id', 'item', 'start_date', 'due_date', 'finished_date', 'priority', 'status', 'item_html', 'item_hash')
+
+log = logging.getLogger('project_echo.write_queue')
+
+_STOP = object()
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def _insert_entry(conn, days, timestamp, content, project_id):
+    cursor = conn.execute('INSERT INTO entries (timestamp, content, project_id) VALUES (?, ?, ?)',
+                          (timestamp, content, project_id))
+    # Durations are left to the caller: once per write directly, once per day in a batch
+    days.add(timestamp[:10])
+    return cursor.lastrowid
+
+
+def _insert_todo(conn, days, values):
+    cursor = conn.execute(
+        f'INSERT INTO todos ({", ".join(TODO_COLUMNS)}) VALUES ({", ".join("?" * len(TODO_COLUMNS))})',
+        [values.get(column) for column in TODO_COLUMNS]
+    )
+    return cursor.lastrowid
+
+
+class WriteQueue:
+    """One writer thread for one database file, started with the first write."""
+
+    def __init__(self, db_path, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        self.db_path = db_path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def submit(self, write, *args):
+        """Queues write(conn, days, *args); the Future gets its result once the batch commits."""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('The write queue has been closed')
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+            self._queue.put((write, args, future))
+        return future
+
+    def close(self, timeout=None):
+        """Commits everything queued so far and stops the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _abandon(self, error):
+        # Fails everything queued so far; the next submit() starts a fresh writer thread.
+        # submit() queues under the lock, so nothing can slip in after the queue is drained.
+        with self._lock:
+            self._thread = None
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _STOP:
+                    item[2].set_exception(error)
+
+    def _next_batch(self):
+        # Blocks for the first write, then takes whatever else arrives within the window
+        first = self._queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        try:
+            conn = database.connect(self.db_path)
+        except Exception as e:
+            log.exception('Write queue could not open %s', self.db_path)
+            self._abandon(e)
+            return
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._next_batch()
+                if batch:
+                    self._commit(conn, batch)
+        finally:
+            conn.close()
+
+    def _commit(self, conn, batch):
+        started = time.perf_counter()
+        outcomes = []
+        days = set()
+        try:
+            with transaction(conn):
+                for write, args, future in batch:
+                    # A savepoint per write, so one bad write doesn't sink the batch
+                    conn.execute('SAVEPOINT queued_write')
+                    try:
+                        outcomes.append((future, write(conn, days, *args), None))
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO queued_write')
+                        outcomes.append((future, None, e))
+                    conn.execute('RELEASE queued_write')
+                for day in sorted(days):
+                    recalculate_range(conn, day, day)
+        except Exception as e:
+            log.exception('Write batch of %d failed', len(batch))
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        self.batches += 1
+        self.writes += len(batch)
+        log.debug('Committed %d writes in %.1f ms', len(batch), (time.perf_counter() - started) * 1000)
+
+
+def queue_for(db_path):
+    with _queues_lock:
+        writer = _queues.get(db_path)
+        if writer is None:
+            writer = _queues[db_path] = WriteQueue(db_path)
+        return writer
+
+
+def close_all():
+    with _queues_lock:
+        writers = list(_queues.values())
+        _queues.clear()
+    for writer in writers:
+        writer.close()
+
+
+atexit.register(close_all)
+
+
+def _enabled():
+    return current_app.config.get('WRITE_QUEUE', False)
+
+
+def add_entry(conn, timestamp, content, project_id):
+    """
+    Inserts an entry (project_id is the project's id, or None) and updates durations,
+    through the write queue if it is on. Returns the new id.
+    """
+    if _enabled():
+        return queue_for(database.database_path()).submit(_insert_entry, timestamp, content, project_id).result(WRITE_TIMEOUT)
+    with transaction(conn):
+        entry_id = _insert_entry(conn, set(), timestamp, content, project_id)
+        # Update elapsed times for the new entry and the one after it
+        entry_inserted(conn, entry_id)
+    return entry_id
+
+
+def add_todo(conn, **values):
+    """Inserts a todo from TODO_COLUMNS values, through the write queue if it is on. Returns the new id."""
+    if _enabled():
+        return queue_for(database.database_path()).submit(_insert_todo, values).result(WRITE_TIMEOUT)
+    with transaction(conn):
+        return _insert_todo(conn, set(), values)
+
+
+def init_app(app):
+    app.config.setdefault('WRITE_QUEUE',
+                          os.environ.get('PROJECT_ECHO_WRITE_QUEUE', '').lower() in ('1', 'true', 'yes'))